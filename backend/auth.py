@@ -1,10 +1,14 @@
 # Vox Trader Backend - Auth (hash, JWT)
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from config import get_settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=get_settings().BCRYPT_ROUNDS)
 
 
 def hash_password(password: str) -> str:
@@ -15,6 +19,11 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+def verify_and_update_password(plain: str, hashed: str) -> tuple[bool, str | None]:
+    """(valid, new hash or None): a new hash when the stored one uses other bcrypt rounds than BCRYPT_ROUNDS."""
+    return pwd_context.verify_and_update(plain, hashed)
+
+
 def create_access_token(data: dict) -> str:
     s = get_settings()
     to_encode = data.copy()
@@ -29,3 +38,79 @@ def decode_token(token: str) -> dict | None:
         return jwt.decode(token, s.JWT_SECRET, algorithms=[s.JWT_ALGORITHM])
     except JWTError:
         return None
+
+
+class TokenCache:
+    """Bounded LRU of verified token payloads keyed by the token's SHA-256.
+
+    Only tokens that verified and carry `exp` are cached; an entry is dropped once `exp` passes,
+    so a cached token is never accepted after jose itself would reject it. Invalid tokens are not
+    cached and are decoded every time.
+    """
+
+    def __init__(self, max_entries: int = 10000, decode=decode_token, clock=time.time):
+        self.max_entries = max(0, int(max_entries))
+        self._decode = decode
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalid": 0}
+
+    def decode(self, token: str) -> dict | None:
+        if not self.max_entries:
+            return self._decode(token)
+        key = hashlib.sha256(token.encode()).digest()
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[1]
+                del self._entries[key]
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+        payload = self._decode(token)
+        if payload is None:
+            with self._lock:
+                self._stats["invalid"] += 1
+            return None
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)) and exp > now:
+            with self._lock:
+                self._entries[key] = (float(exp), payload)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evicted"] += 1
+        return payload
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+        out["max_entries"] = self.max_entries
+        return out
+
+
+_token_cache: TokenCache | None = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache() -> TokenCache:
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = TokenCache(get_settings().JWT_CACHE_MAX_ENTRIES)
+    return _token_cache
+
+
+def decode_token_cached(token: str) -> dict | None:
+    """decode_token() through the verified-token LRU."""
+    return get_token_cache().decode(token)
@@ -11,13 +11,36 @@ class Settings(BaseSettings):
     MYSQL_USER: str = "root"
     MYSQL_PASSWORD: str = ""
     MYSQL_DATABASE: str = "vox_trader"
+    # Connection pool (database.get_db)
+    DB_POOL_SIZE: int = 20
+    DB_POOL_TIMEOUT_SEC: float = 10.0
+    DB_POOL_MAX_IDLE_SEC: float = 300.0
+    DB_POOL_MAX_LIFETIME_SEC: float = 1800.0
+    # Idle connections older than this are pinged before being handed out.
+    DB_POOL_PING_AFTER_SEC: float = 30.0
+    # /health/metrics requires this value in the X-Metrics-Token header; empty = endpoint disabled (404)
+    METRICS_TOKEN: str = ""
 
     # JWT
     JWT_SECRET: str = "change_me_in_production"
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRE_MINUTES: int = 60
+    # Verified tokens kept in an LRU (keyed by token hash, dropped at exp); 0 = decode every request
+    JWT_CACHE_MAX_ENTRIES: int = 10000
+    # bcrypt cost; hashes with other rounds are re-hashed on the next successful login
+    BCRYPT_ROUNDS: int = 12
+    # Password hashing off the event loop: worker processes (False = threads), queued + running
+    # hashes beyond MAX_PENDING get 429 right away; per-hash timeout
+    HASH_POOL_WORKERS: int = 2
+    HASH_POOL_PROCESSES: bool = True
+    HASH_POOL_MAX_PENDING: int = 32
+    HASH_POOL_TIMEOUT_SEC: float = 10.0
     # API key şifreleme (32 byte base64url). Yoksa JWT_SECRET ile türetilir.
+    # Rotasyon: "yeni_anahtar,eski_anahtar" (ilki şifreler, hepsi çözer; scripts/rotate_encryption_key.py)
     ENCRYPTION_KEY: str = ""
+    # Decrypted Binance credentials kept in memory per user (0 = decrypt on every call); PUT /settings/binance invalidates
+    BINANCE_CREDENTIALS_CACHE_TTL_SEC: float = 60.0
+    BINANCE_CREDENTIALS_CACHE_MAX_ENTRIES: int = 10000
 
     # Z.AI GLM-4.6V-Flash (https://docs.z.ai)
     GLM5_API_KEY: str = ""
@@ -28,6 +51,85 @@ class Settings(BaseSettings):
     # OpenAI (chat/completions)
     OPENAI_API_KEY: str = ""
     OPENAI_BASE_URL: str = "https://api.openai.com/v1"
+    # LLM provider clients: in-flight requests per provider, retries (jittered backoff), timeouts
+    LLM_MAX_CONCURRENCY: dict[str, int] = {"glm": 8, "openai": 16}
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BACKOFF_SEC: float = 0.5
+    LLM_CONNECT_TIMEOUT_SEC: float = 30.0
+    LLM_READ_TIMEOUT_SEC: float = 180.0
+    # Streamed chat: output token cap sent to the provider; its worst-case cost is reserved up front
+    CHAT_STREAM_MAX_OUTPUT_TOKENS: int = 4096
+    # Push channel (/events/stream): "memory" (single process) or "redis" (fan-out across workers)
+    EVENT_BUS_BACKEND: str = "memory"
+    EVENT_BUS_REDIS_URL: str = "redis://localhost:6379/0"
+    EVENT_STREAM_QUEUE_SIZE: int = 256
+    EVENT_STREAM_HEARTBEAT_SEC: float = 15.0
+    # Agent runner: worker threads, per-provider concurrent cycles, job reload interval
+    AGENT_RUNNER_WORKERS: int = 8
+    AGENT_PROVIDER_CONCURRENCY: dict[str, int] = {"glm": 4, "openai": 8}
+    AGENT_RUNNER_REFRESH_SEC: float = 5.0
+    # agent_job leases (multi-process / multi-host). TTL must exceed AGENT_RUNNER_REFRESH_SEC comfortably.
+    AGENT_LEASE_TTL_SEC: int = 30
+    AGENT_LEASE_CLAIM_BATCH: int = 50
+    AGENT_LEASE_MAX_JOBS: int = 0  # 0 = no per-runner cap beyond fair share
+    # Shutdown: seconds to wait for running cycles before handing leases back (jobs still running keep theirs)
+    AGENT_RUNNER_DRAIN_SEC: float = 20.0
+    # Agent log write-behind: flush after this many rows or this many seconds; drop beyond max buffer
+    AGENT_LOG_FLUSH_ROWS: int = 200
+    AGENT_LOG_FLUSH_INTERVAL_SEC: float = 0.5
+    AGENT_LOG_MAX_BUFFER: int = 10000
+    # Shared agent analysis: agents without a custom prompt reuse one LLM call per
+    # model/strategy/market/symbol/interval/candle; followers are billed at the cached-input rate
+    AGENT_SHARED_ANALYSIS: bool = False
+    AGENT_SHARED_ANALYSIS_TTL_SEC: float = 300.0
+    AGENT_SHARED_ANALYSIS_MAX_ENTRIES: int = 1024
+    # Retention: days to keep agent_log / agent_analyses (0 = forever), pass interval, delete chunk size/pause.
+    # RETENTION_ARCHIVE_DIR set -> expired analyses are appended to gzip JSON lines there before removal.
+    # Opt-in: rows are deleted for good, so nothing is pruned until RETENTION_ENABLED is turned on.
+    RETENTION_ENABLED: bool = False
+    RETENTION_AGENT_LOG_DAYS: int = 30
+    RETENTION_AGENT_ANALYSES_DAYS: int = 90
+    RETENTION_INTERVAL_SEC: float = 3600.0
+    RETENTION_CHUNK_ROWS: int = 5000
+    RETENTION_CHUNK_PAUSE_SEC: float = 0.2
+    RETENTION_ARCHIVE_DIR: str = ""
+    # Shared Binance last-price cache (demo engine); seconds a price is considered fresh
+    PRICE_CACHE_TTL_SEC: float = 2.0
+    # Binance WebSocket ingester (live prices + kline buffers). A replay file (JSON lines of
+    # combined-stream messages) replaces the live socket, e.g. for tests.
+    MARKET_STREAM_ENABLED: bool = True
+    MARKET_STREAM_REPLAY_FILE: str = ""
+    MARKET_STREAM_REPLAY_DELAY_SEC: float = 0.0
+    MARKET_STREAM_BUFFER_SIZE: int = 1000
+    MARKET_STREAM_TRACK_TTL_SEC: float = 600.0
+    # Pairs subscribed on request (demo prices, signed-in chart views) on top of running agents' pairs
+    MARKET_STREAM_MAX_TRACKED: int = 200
+    # Demo futures trigger engine (liquidation / stop-loss / take-profit). Ticks come from the market
+    # stream; the price cache is also polled every POLL_SEC and the index reloaded every RESYNC_SEC.
+    TRIGGER_ENGINE_ENABLED: bool = True
+    TRIGGER_ENGINE_POLL_SEC: float = 1.0
+    TRIGGER_ENGINE_RESYNC_SEC: float = 30.0
+    # Demo futures leaderboard: every open position is marked in one batch, reused for this many seconds
+    FUTURES_LEADERBOARD_TTL_SEC: float = 10.0
+    # Demo spot limit/stop orders: ticks are matched every BATCH_SEC and fills written BATCH_MAX per
+    # transaction; price-cache poll and index reload intervals as for the trigger engine
+    ORDER_BOOK_ENABLED: bool = True
+    ORDER_BOOK_BATCH_SEC: float = 0.05
+    ORDER_BOOK_BATCH_MAX: int = 500
+    ORDER_BOOK_POLL_SEC: float = 1.0
+    ORDER_BOOK_RESYNC_SEC: float = 30.0
+    # Agent spot trades rest as a limit order at the analysis' buy_at / sell_at when that level is better than the market
+    AGENT_SPOT_LIMIT_ORDERS: bool = False
+    # Local kline store: closed candles as memory-mapped NumPy segments under this directory
+    # (empty = disabled, every kline read goes to Binance REST); open segment files kept mapped
+    KLINE_STORE_DIR: str = ""
+    KLINE_STORE_MAX_OPEN_SEGMENTS: int = 256
+    # Rendered agent chart cache (shared per symbol/interval/candle), total PNG base64 bytes
+    CHART_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    # Chart render worker processes (0 = render in the calling thread), queued renders, wait/timeout
+    RENDER_POOL_WORKERS: int = 2
+    RENDER_POOL_MAX_PENDING: int = 16
+    RENDER_POOL_TIMEOUT_SEC: float = 30.0
     # Magazala ödeme
     MAGAZALA_API_KEY: str = ""
     MAGAZALA_BASE_URL: str = "https://magazala.com/api/v1"
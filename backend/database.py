@@ -1,7 +1,12 @@
-# Vox Trader Backend - MySQL connection
-import pymysql
+# Vox Trader Backend - MySQL connection (pooled)
+import os
+import threading
+import time
+from collections import deque
 from contextlib import contextmanager
 from typing import Generator
+
+import pymysql
 from config import get_settings
 
 
@@ -11,17 +16,247 @@ def get_connection(**overrides):
     return pymysql.connect(**kwargs)
 
 
+class PoolTimeoutError(pymysql.err.OperationalError):
+    """No connection became available within DB_POOL_TIMEOUT_SEC."""
+
+
+class _PooledConn:
+    __slots__ = ("conn", "created_at", "last_used_at")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used_at = now
+
+
+class ConnectionPool:
+    """Thread-safe bounded pool of pymysql connections.
+
+    Idle connections are reused LIFO so hot connections stay warm and cold ones age out.
+    On checkout, connections idle longer than `ping_after_sec` are pinged; connections older
+    than `max_lifetime_sec` or idle longer than `max_idle_sec` are closed and replaced.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 20,
+        timeout_sec: float = 10.0,
+        max_idle_sec: float = 300.0,
+        max_lifetime_sec: float = 1800.0,
+        ping_after_sec: float = 30.0,
+        connect=get_connection,
+    ):
+        self.max_size = max(1, int(max_size))
+        self.timeout_sec = float(timeout_sec)
+        self.max_idle_sec = float(max_idle_sec)
+        self.max_lifetime_sec = float(max_lifetime_sec)
+        self.ping_after_sec = float(ping_after_sec)
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle: deque[_PooledConn] = deque()
+        self._in_use: dict[int, _PooledConn] = {}
+        self._opening = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total_ms": 0.0,
+            "wait_time_max_ms": 0.0,
+            "timeouts": 0,
+            "opened": 0,
+            "closed": 0,
+            "evicted_idle": 0,
+            "recycled_lifetime": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+        }
+
+    def _close_quietly(self, pc: _PooledConn) -> None:
+        try:
+            pc.conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, pc: _PooledConn, now: float) -> str | None:
+        if self.max_lifetime_sec > 0 and now - pc.created_at >= self.max_lifetime_sec:
+            return "recycled_lifetime"
+        if self.max_idle_sec > 0 and now - pc.last_used_at >= self.max_idle_sec:
+            return "evicted_idle"
+        return None
+
+    def _evict_expired_locked(self, now: float) -> list[_PooledConn]:
+        """Drop expired idle connections; caller closes the returned ones outside the lock."""
+        dead = []
+        keep: deque[_PooledConn] = deque()
+        for pc in self._idle:
+            reason = self._expired(pc, now)
+            if reason:
+                self._stats[reason] += 1
+                self._stats["closed"] += 1
+                dead.append(pc)
+            else:
+                keep.append(pc)
+        self._idle = keep
+        return dead
+
+    def _size_locked(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout_sec
+        waited = False
+        while True:
+            candidate = None
+            open_new = False
+            with self._cond:
+                if self._closed:
+                    raise pymysql.err.InterfaceError("Connection pool is closed")
+                dead = self._evict_expired_locked(time.monotonic())
+                if self._idle:
+                    candidate = self._idle.pop()
+                    self._in_use[id(candidate.conn)] = candidate
+                elif self._size_locked() < self.max_size:
+                    self._opening += 1
+                    open_new = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        for pc in dead:
+                            self._close_quietly(pc)
+                        raise PoolTimeoutError(2013, "Timed out waiting for a database connection")
+                    waited = True
+                    self._cond.wait(remaining)
+            for pc in dead:
+                self._close_quietly(pc)
+            if open_new:
+                try:
+                    candidate = _PooledConn(self._connect())
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._stats["opened"] += 1
+                    self._in_use[id(candidate.conn)] = candidate
+            if candidate is None:
+                continue
+            if not open_new and time.monotonic() - candidate.last_used_at >= self.ping_after_sec:
+                try:
+                    candidate.conn.ping(reconnect=False)
+                except Exception:
+                    with self._cond:
+                        self._in_use.pop(id(candidate.conn), None)
+                        self._stats["health_check_failures"] += 1
+                        self._stats["closed"] += 1
+                        self._cond.notify()
+                    self._close_quietly(candidate)
+                    continue
+            waited_ms = (time.monotonic() - start) * 1000.0
+            with self._cond:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                self._stats["wait_time_total_ms"] += waited_ms
+                if waited_ms > self._stats["wait_time_max_ms"]:
+                    self._stats["wait_time_max_ms"] = waited_ms
+            return candidate.conn
+
+    def release(self, conn, discard: bool = False) -> None:
+        with self._cond:
+            pc = self._in_use.pop(id(conn), None)
+            if pc is None:
+                return
+            now = time.monotonic()
+            if discard or self._closed or not conn.open:
+                reason = "discarded"
+            else:
+                reason = self._expired(pc, now)
+            self._cond.notify()
+            if reason is None:
+                pc.last_used_at = now
+                self._idle.append(pc)
+                return
+            self._stats[reason] += 1
+            self._stats["closed"] += 1
+        self._close_quietly(pc)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._stats["closed"] += len(idle)
+            self._cond.notify_all()
+        for pc in idle:
+            self._close_quietly(pc)
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out["max_size"] = self.max_size
+            out["in_use"] = len(self._in_use)
+            out["idle"] = len(self._idle)
+        checkouts = out["checkouts"] or 1
+        out["wait_time_avg_ms"] = round(out["wait_time_total_ms"] / checkouts, 3)
+        out["wait_time_total_ms"] = round(out["wait_time_total_ms"], 3)
+        out["wait_time_max_ms"] = round(out["wait_time_max_ms"], 3)
+        return out
+
+
+_pool: ConnectionPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Process-wide pool, created lazily (and re-created after fork)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            s = get_settings()
+            _pool = ConnectionPool(
+                max_size=s.DB_POOL_SIZE,
+                timeout_sec=s.DB_POOL_TIMEOUT_SEC,
+                max_idle_sec=s.DB_POOL_MAX_IDLE_SEC,
+                max_lifetime_sec=s.DB_POOL_MAX_LIFETIME_SEC,
+                ping_after_sec=s.DB_POOL_PING_AFTER_SEC,
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
 @contextmanager
 def get_db() -> Generator:
-    conn = get_connection()
+    pool = get_pool()
+    conn = pool.acquire()
+    broken = False
     try:
         yield conn
         conn.commit()
     except Exception:
-        conn.rollback()
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
         raise
     finally:
-        conn.close()
+        pool.release(conn, discard=broken)
 
 
 def get_db_no_database():
@@ -1,19 +1,25 @@
 # Vox Trader - API key şifreleme (Fernet)
 import base64
 import hashlib
-from cryptography.fernet import Fernet
+from functools import lru_cache
+from cryptography.fernet import Fernet, MultiFernet
 from config import get_settings
 
 
-def _get_fernet() -> Fernet:
+@lru_cache
+def _get_fernet() -> MultiFernet:
+    """Built once per process: key derivation and Fernet setup do not repeat per value.
+
+    ENCRYPTION_KEY may list several comma-separated keys for rotation: the first encrypts,
+    all of them decrypt (old keys stay at the end until rotate_api_value has re-encrypted the data).
+    The key derived from JWT_SECRET always decrypts last, so values stored before ENCRYPTION_KEY
+    was set stay readable.
+    """
     s = get_settings()
-    key = getattr(s, "ENCRYPTION_KEY", None)
-    if key:
-        key = key.encode() if isinstance(key, str) else key
-    else:
-        raw = hashlib.sha256((s.JWT_SECRET + "vox_binance_salt").encode()).digest()
-        key = base64.urlsafe_b64encode(raw)
-    return Fernet(key)
+    raw = hashlib.sha256((s.JWT_SECRET + "vox_binance_salt").encode()).digest()
+    derived = base64.urlsafe_b64encode(raw).decode()
+    keys = [k.strip() for k in (getattr(s, "ENCRYPTION_KEY", None) or "").split(",") if k.strip()]
+    return MultiFernet([Fernet(k.encode()) for k in dict.fromkeys(keys + [derived])])
 
 
 def encrypt_api_value(plain: str) -> str:
@@ -26,3 +32,10 @@ def decrypt_api_value(cipher: str) -> str:
     if not cipher:
         return ""
     return _get_fernet().decrypt(cipher.encode()).decode()
+
+
+def rotate_api_value(cipher: str) -> str:
+    """Re-encrypt a stored value with the current (first) key."""
+    if not cipher:
+        return ""
+    return _get_fernet().rotate(cipher.encode()).decode()
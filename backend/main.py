@@ -1,14 +1,49 @@
 # Vox Trader Backend - FastAPI
+import hmac
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth_router, settings_router, binance_router, ai_router, demo_router, billing_router
+from routers import auth_router, settings_router, binance_router, ai_router, demo_router, billing_router, events_router
+from auth import get_token_cache
+from config import get_settings
+from database import close_pool, get_pool
+from services.price_cache import get_price_cache
+from services.credential_cache import get_credential_cache
+from services.analysis_cache import get_analysis_cache
+from services.chart_cache import get_chart_cache
+from services.kline_store import get_kline_store
+from services.event_bus import get_event_bus, start_event_bus, stop_event_bus
+from services.render_pool import get_render_pool, start_render_pool, stop_render_pool
+from services.hash_pool import get_hash_pool, start_hash_pool, stop_hash_pool
+from services.llm_client import close_llm_clients, llm_client_stats, start_llm_clients
+from services.market_stream import get_market_stream, start_market_stream, stop_market_stream
+from services.retention import get_retention, start_retention, stop_retention
+from services.trigger_engine import get_trigger_engine, start_trigger_engine, stop_trigger_engine
+from services.order_book import get_order_book, start_order_book, stop_order_book
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    start_event_bus()
+    start_llm_clients()
+    start_render_pool()
+    start_hash_pool()
+    start_market_stream(load_targets=ai_router.agent_stream_targets)
+    start_trigger_engine(load=demo_router.load_trigger_positions, close=demo_router.close_triggered_position)
+    start_order_book(load=demo_router.load_open_spot_orders, fill=demo_router.fill_resting_orders)
     ai_router.start_agent_runner()
+    start_retention()
     yield
+    stop_retention()
+    ai_router.stop_agent_runner()
+    stop_order_book()
+    stop_trigger_engine()
+    stop_market_stream()
+    stop_hash_pool()
+    stop_render_pool()
+    await close_llm_clients()
+    stop_event_bus()
+    close_pool()
 
 
 app = FastAPI(title="Vox Trader API", version="0.1.0", lifespan=lifespan)
@@ -19,6 +54,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 app.include_router(auth_router.router)
@@ -27,8 +63,37 @@ app.include_router(binance_router.router)
 app.include_router(ai_router.router)
 app.include_router(demo_router.router)
 app.include_router(billing_router.router)
+app.include_router(events_router.router)
 
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/health/metrics")
+def health_metrics(x_metrics_token: str | None = Header(None)):
+    """In-process runtime metrics (connection pool, caches, schedulers). Internal: needs METRICS_TOKEN."""
+    token = get_settings().METRICS_TOKEN
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_metrics_token or not hmac.compare_digest(x_metrics_token.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return {
+        "db_pool": get_pool().stats(),
+        "jwt_cache": get_token_cache().stats(),
+        "credential_cache": get_credential_cache().stats(),
+        "agent_scheduler": ai_router.agent_runner_stats(),
+        "price_cache": get_price_cache().stats(),
+        "market_stream": get_market_stream().stats() if get_market_stream() else None,
+        "chart_cache": get_chart_cache().stats(),
+        "kline_store": get_kline_store().stats() if get_kline_store() else None,
+        "analysis_cache": get_analysis_cache().stats(),
+        "render_pool": get_render_pool().stats() if get_render_pool() else None,
+        "hash_pool": get_hash_pool().stats() if get_hash_pool() else None,
+        "llm_clients": llm_client_stats(),
+        "event_bus": get_event_bus().stats(),
+        "retention": get_retention().stats() if get_retention() else None,
+        "trigger_engine": get_trigger_engine().stats() if get_trigger_engine() else None,
+        "order_book": get_order_book().stats() if get_order_book() else None,
+    }
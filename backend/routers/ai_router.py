@@ -1,16 +1,27 @@
 # Vox Trader Backend - Z.AI GLM + OpenAI chat + agent (balance, model selection, token usage logging)
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Literal, Optional
 import asyncio
+import hashlib
 import httpx
+import json
+import os
 import re
+import socket
 import time
 import threading
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime, timedelta, timezone
 from config import get_settings
-from routers.auth_router import get_current_user_id
+from routers.auth_router import get_current_user, get_current_user_id
 from database import get_db
+from services.agent_scheduler import AgentScheduler
+from services.event_bus import publish_event
+from services.llm_client import LLMProviderError, get_llm_client
+from services.log_writer import BatchWriter
 import pymysql
 
 router = APIRouter(prefix="/ai", tags=["ai"])
@@ -40,26 +51,38 @@ def _get_balance(user_id: int) -> float:
     return float(row["balance"]) if row else 0.0
 
 
-def _deduct_balance(user_id: int, cost_usd: float, conn=None) -> bool:
-    """Deduct from balance using existing or new DB connection. Returns True for cost_usd <= 0."""
-    if cost_usd <= 0:
-        return True
-    if conn is not None:
-        with conn.cursor() as cur:
-            cur.execute("SELECT balance FROM users WHERE id = %s FOR UPDATE", (user_id,))
-            row = cur.fetchone()
-            if not row or float(row[0]) < cost_usd:
-                return False
-            cur.execute("UPDATE users SET balance = balance - %s WHERE id = %s", (cost_usd, user_id))
+def _deduct_balance(cur, user_id: int, cost_usd: float) -> bool:
+    """Deduct from balance (a negative cost refunds) inside the caller's transaction, without committing.
+
+    Returns False, changing nothing, when the balance does not cover a charge. The caller commits and
+    then calls `_publish_balance` so the event is only sent for a durable change.
+    """
+    if cost_usd > 0:
+        cur.execute("SELECT balance FROM users WHERE id = %s FOR UPDATE", (user_id,))
+        row = cur.fetchone()
+        balance = row["balance"] if isinstance(row, dict) else (row[0] if row else None)
+        if balance is None or float(balance) < cost_usd:
+            return False
+    if cost_usd != 0:
+        cur.execute("UPDATE users SET balance = balance - %s WHERE id = %s", (cost_usd, user_id))
+    return True
+
+
+def _publish_balance(user_id: int, cost_usd: float) -> None:
+    if cost_usd != 0:
+        publish_event(user_id, "ai_balance", {"cost_usd": cost_usd})
+
+
+def _charge_balance(user_id: int, cost_usd: float) -> bool:
+    """Deduct (or refund) in its own transaction, commit and publish `ai_balance`. False when the balance is short."""
+    if cost_usd == 0:
         return True
     with get_db() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT balance FROM users WHERE id = %s FOR UPDATE", (user_id,))
-            row = cur.fetchone()
-            if not row or float(row[0]) < cost_usd:
+            if not _deduct_balance(cur, user_id, cost_usd):
                 return False
-            cur.execute("UPDATE users SET balance = balance - %s WHERE id = %s", (cost_usd, user_id))
-            conn.commit()
+        conn.commit()
+    _publish_balance(user_id, cost_usd)
     return True
 
 
@@ -72,61 +95,73 @@ def _compute_cost(model_id: str, input_tokens: int, output_tokens: int, cached_i
 
 
 def _append_agent_log(user_id: int, message: str, log_type: str = "log", analysis_id: int | None = None) -> None:
+    """Queue a log line on the write-behind writer; written synchronously when it is not running."""
+    row = (user_id, (message or "")[:500], analysis_id, log_type)
+    writer = _agent_log_writer
+    if writer is not None and writer.is_alive():
+        writer.add(row)
+    else:
+        _write_agent_log_rows([row])
+
+
+def _write_agent_log_rows(rows: list[tuple]) -> None:
+    """One multi-row INSERT per batch, then push the lines to open dashboards."""
     with get_db() as conn:
         with conn.cursor() as cur:
-            cur.execute(
+            cur.executemany(
                 "INSERT INTO agent_log (user_id, message, analysis_id, log_type) VALUES (%s, %s, %s, %s)",
-                (user_id, (message or "")[:500], analysis_id, log_type),
+                rows,
             )
+            # A single multi-row INSERT gets consecutive AUTO_INCREMENT ids starting at lastrowid.
+            first_id = cur.lastrowid
             conn.commit()
+    now = datetime.now().strftime("%H:%M:%S")
+    for i, (user_id, message, analysis_id, log_type) in enumerate(rows):
+        publish_event(user_id, "agent_log", {
+            "id": first_id + i, "time": now, "message": message, "analysis_id": analysis_id, "log_type": log_type,
+        })
+
+
+_agent_log_writer: BatchWriter | None = None
 
 
 # Background agent runner (keeps running even if page is closed)
-_agent_runner_thread: threading.Thread | None = None
-_agent_runner_stop = threading.Event()
+_agent_scheduler: AgentScheduler | None = None
+_agent_scheduler_lock = threading.Lock()
 
 
 def _get_demo_portfolio_context(user_id: int) -> str:
-    """Return user demo balance and positions (amount + average entry) as text context for agent decisions."""
+    """Return user demo balance and positions (amount + average entry) as text context for agent decisions.
+
+    One query: average entry is kept per (user_id, asset) in demo_holdings by the order path.
+    """
     try:
         with get_db() as conn:
             with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                cur.execute("SELECT demo_balance FROM users WHERE id = %s", (user_id,))
-                row = cur.fetchone()
-                if not row:
-                    return ""
-                demo_balance = float(row["demo_balance"])
                 cur.execute(
-                    "SELECT asset, quantity FROM demo_holdings WHERE user_id = %s AND quantity > 0",
+                    """
+                    SELECT u.demo_balance, h.asset, h.quantity, h.avg_entry_price
+                    FROM users u
+                    LEFT JOIN demo_holdings h ON h.user_id = u.id AND h.quantity > 0 AND h.asset <> 'USDT'
+                    WHERE u.id = %s
+                    ORDER BY h.asset
+                    """,
                     (user_id,),
                 )
-                holdings = [{"asset": r["asset"], "quantity": float(r["quantity"])} for r in cur.fetchall()]
+                rows = cur.fetchall()
+        if not rows:
+            return ""
+        demo_balance = float(rows[0]["demo_balance"])
+        holdings = [r for r in rows if r["asset"] is not None]
         if not holdings:
             return f"Current demo balance: {demo_balance:.2f} USDT. No open positions (USDT only)."
         lines = [f"Current demo balance: {demo_balance:.2f} USDT."]
         for h in holdings:
-            asset, qty = h["asset"], h["quantity"]
-            if asset == "USDT":
-                continue
-            symbol = asset + "USDT"
-            with get_db() as conn:
-                with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                    cur.execute(
-                        """
-                        SELECT quantity, price_usdt FROM demo_trades
-                        WHERE user_id = %s AND symbol = %s AND side = 'BUY'
-                        ORDER BY created_at ASC
-                        """,
-                        (user_id, symbol),
-                    )
-                    buys = cur.fetchall()
-            if buys:
-                total_qty = sum(float(b["quantity"]) for b in buys)
-                total_cost = sum(float(b["quantity"]) * float(b["price_usdt"]) for b in buys)
-                avg_cost = total_cost / total_qty if total_qty else 0
-                lines.append(
-                    f"Position: {symbol} — {qty:.8f} units (average buy ~{avg_cost:.2f} USDT)."
-                )
+            symbol = h["asset"] + "USDT"
+            qty = float(h["quantity"])
+            avg_entry = float(h["avg_entry_price"] or 0)
+            if avg_entry > 0:
+                lines.append(f"Position: {symbol} — {qty:.8f} units (average buy ~{avg_entry:.2f} USDT).")
             else:
                 lines.append(f"Position: {symbol} — {qty:.8f} units.")
         return " ".join(lines)
@@ -135,20 +170,25 @@ def _get_demo_portfolio_context(user_id: int) -> str:
 
 
 def _get_demo_futures_context(user_id: int) -> str:
-    """Return user demo futures positions as text context."""
+    """Return user demo futures positions as text context (one query)."""
     try:
         with get_db() as conn:
             with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                cur.execute("SELECT demo_balance FROM users WHERE id = %s", (user_id,))
-                row = cur.fetchone()
-                if not row:
-                    return ""
-                margin_available = float(row["demo_balance"])
                 cur.execute(
-                    "SELECT symbol, side, quantity, entry_price, leverage, margin_used FROM demo_futures_positions WHERE user_id = %s",
+                    """
+                    SELECT u.demo_balance, p.symbol, p.side, p.quantity, p.entry_price, p.leverage, p.margin_used
+                    FROM users u
+                    LEFT JOIN demo_futures_positions p ON p.user_id = u.id
+                    WHERE u.id = %s
+                    ORDER BY p.id
+                    """,
                     (user_id,),
                 )
-                positions = cur.fetchall()
+                rows = cur.fetchall()
+        if not rows:
+            return ""
+        margin_available = float(rows[0]["demo_balance"])
+        positions = [r for r in rows if r["symbol"] is not None]
         if not positions:
             return f"Available margin: {margin_available:.2f} USDT. No open leveraged positions."
         lines = [f"Available margin: {margin_available:.2f} USDT."]
@@ -186,6 +226,7 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     messages: list[ChatMessage]
     model: str = DEFAULT_CHAT_MODEL
+    stream: bool = False  # True: reply as server-sent events (text/event-stream)
 
 
 class ChatResponse(BaseModel):
@@ -263,22 +304,15 @@ def _parse_agent_response(content: str) -> AgentAnalyzeResponse:
     )
 
 
-def _analyze_with_image_sync(
-    user_id: int,
-    image_base64: str,
-    symbol: str,
-    interval: str,
-    strategy: str,
-    custom_prompt: str,
-    market_type: str,
-    model_id: str = DEFAULT_AGENT_MODEL,
-) -> tuple[str, int | None]:
-    """Send sync request with image + context to selected model (GLM/OpenAI), return action and analysis_id, deduct balance, and log usage."""
-    s = get_settings()
-    model_info = MODEL_REGISTRY.get(model_id) or MODEL_REGISTRY.get(DEFAULT_AGENT_MODEL)
-    provider = model_info.get("provider", "glm")
+AGENT_SYSTEM_PROMPT = (
+    "You are a crypto chart analyst and trading assistant. Suggest BUY, SELL, or HOLD. In futures mode BUY=long and SELL=short. Keep it concise."
+)
+
+
+def _agent_user_content(
+    symbol: str, interval: str, strategy: str, custom_prompt: str, market_type: str, portfolio_ctx: str,
+) -> str:
     is_futures = market_type == "futures"
-    portfolio_ctx = _get_demo_futures_context(user_id) if is_futures else _get_demo_portfolio_context(user_id)
     strategy_text = AGENT_STRATEGIES.get(strategy, AGENT_STRATEGIES["kisa_vade"])
     user_content = ""
     if portfolio_ctx:
@@ -296,6 +330,14 @@ def _analyze_with_image_sync(
     user_content += (
         "Review the chart image and provide a short technical analysis. Suggest BUY, SELL, or HOLD. Reply in English."
     )
+    return user_content
+
+
+def _request_agent_completion(model_id: str, user_content: str, image_base64: str) -> tuple[str, dict] | None:
+    """Send prompt + chart image to the model's provider. Returns (content, usage) or None on any failure."""
+    s = get_settings()
+    model_info = MODEL_REGISTRY.get(model_id) or MODEL_REGISTRY.get(DEFAULT_AGENT_MODEL)
+    provider = model_info.get("provider", "glm")
     has_image = bool(image_base64 and image_base64.strip())
     if has_image:
         b64 = image_base64.strip()
@@ -303,32 +345,21 @@ def _analyze_with_image_sync(
         user_msg = [{"type": "text", "text": user_content}, {"type": "image_url", "image_url": {"url": url}}]
     else:
         user_msg = user_content
-    system_content = (
-        "You are a crypto chart analyst and trading assistant. Suggest BUY, SELL, or HOLD. In futures mode BUY=long and SELL=short. Keep it concise."
-    )
-    content = ""
     usage = {"input_tokens": 0, "output_tokens": 0, "cached_input_tokens": 0}
 
     if provider == "openai":
         if not getattr(s, "OPENAI_API_KEY", None) or not s.OPENAI_API_KEY:
-            return ("HOLD", None)
+            return None
         payload = {
             "model": model_id,
-            "messages": [{"role": "system", "content": system_content}, {"role": "user", "content": user_msg}],
+            "messages": [{"role": "system", "content": AGENT_SYSTEM_PROMPT}, {"role": "user", "content": user_msg}],
             "max_tokens": 4096,
             "temperature": 0.6,
         }
-        base = (getattr(s, "OPENAI_BASE_URL", None) or "https://api.openai.com/v1").strip().rstrip("/")
-        url = f"{base}/chat/completions"
         try:
-            with httpx.Client(timeout=httpx.Timeout(30.0, read=180.0)) as client:
-                r = client.post(
-                    url,
-                    headers={"Content-Type": "application/json", "Authorization": f"Bearer {s.OPENAI_API_KEY}"},
-                    json=payload,
-                )
+            r = get_llm_client("openai").post_chat_sync(payload)
             if r.status_code != 200:
-                return ("HOLD", None)
+                return None
             data = r.json()
             content = (data.get("choices") or [{}])[0].get("message", {}).get("content") or ""
             u = data.get("usage") or {}
@@ -336,30 +367,25 @@ def _analyze_with_image_sync(
             usage["output_tokens"] = u.get("completion_tokens") or 0
             usage["cached_input_tokens"] = u.get("prompt_tokens_details", {}).get("cached_tokens") or 0
         except Exception:
-            return ("HOLD", None)
+            return None
     else:
         if not s.GLM5_API_KEY:
-            return ("HOLD", None)
+            return None
         use_vision = has_image and (model_id != "GLM-4.6V-Flash" or bool((s.GLM_VISION_MODEL or "").strip()))
         if has_image and not use_vision and model_id == "GLM-4.6V-Flash":
             user_msg = user_content
         payload = {
             "model": model_id if model_id in MODEL_REGISTRY else (s.GLM_VISION_MODEL or "GLM-4.6V-Flash"),
-            "messages": [{"role": "system", "content": system_content}, {"role": "user", "content": user_msg}],
+            "messages": [{"role": "system", "content": AGENT_SYSTEM_PROMPT}, {"role": "user", "content": user_msg}],
             "max_tokens": 4096,
             "temperature": 0.6,
         }
         if getattr(s, "GLM5_THINKING", True):
             payload["thinking"] = {"type": "enabled"}
         try:
-            with httpx.Client(timeout=httpx.Timeout(30.0, read=180.0)) as client:
-                r = client.post(
-                    f"{s.GLM5_BASE_URL.rstrip('/')}/chat/completions",
-                    headers={"Content-Type": "application/json", "Authorization": f"Bearer {s.GLM5_API_KEY}"},
-                    json=payload,
-                )
+            r = get_llm_client("glm").post_chat_sync(payload)
             if r.status_code != 200:
-                return ("HOLD", None)
+                return None
             data = r.json()
             content = data.get("choices", [{}])[0].get("message", {}).get("content") or ""
             u = data.get("usage") or {}
@@ -367,8 +393,23 @@ def _analyze_with_image_sync(
             usage["output_tokens"] = u.get("completion_tokens") or 0
             usage["cached_input_tokens"] = u.get("input_tokens_details", {}).get("cached_tokens") or 0
         except Exception:
-            return ("HOLD", None)
+            return None
+    return content, usage
+
 
+def _store_agent_analysis(
+    user_id: int,
+    symbol: str,
+    interval: str,
+    strategy: str,
+    market_type: str,
+    model_id: str,
+    content: str,
+    parsed: AgentAnalyzeResponse,
+    usage: dict,
+    shared_from_id: int | None = None,
+) -> tuple[str, int | None]:
+    """Deduct the cost of `usage`, save the analysis row and push it. Returns (action, analysis_id)."""
     cost = _compute_cost(
         model_id,
         usage["input_tokens"],
@@ -378,33 +419,187 @@ def _analyze_with_image_sync(
     balance = _get_balance(user_id)
     if cost > 0 and balance < cost:
         return ("HOLD", None)
-    parsed = _parse_agent_response(content)
     try:
         with get_db() as conn:
-            if cost > 0:
-                if not _deduct_balance(user_id, cost, conn):
-                    return (parsed.action, None)
             with conn.cursor(pymysql.cursors.DictCursor) as cur:
                 cur.execute(
-                    """INSERT INTO agent_analyses (user_id, symbol, `interval`, strategy, action, analysis_text, message_short, buy_at, sell_at, market_type, model, input_tokens, output_tokens, cached_input_tokens, cost_usd)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                    """INSERT INTO agent_analyses (user_id, symbol, `interval`, strategy, action, analysis_text, message_short, buy_at, sell_at, market_type, model, input_tokens, output_tokens, cached_input_tokens, cost_usd, shared_from_id)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
                     (
                         user_id, symbol, interval, strategy, parsed.action, content[:65535], (parsed.message or "")[:500],
                         parsed.buy_at, parsed.sell_at, market_type, model_id,
-                        usage["input_tokens"], usage["output_tokens"], usage["cached_input_tokens"], cost,
+                        usage["input_tokens"], usage["output_tokens"], usage["cached_input_tokens"], cost, shared_from_id,
                     ),
                 )
-                conn.commit()
                 aid = cur.lastrowid
+                # The row and its charge commit together.
+                if not _deduct_balance(cur, user_id, max(cost, 0.0)):
+                    conn.rollback()
+                    return (parsed.action, None)
+            conn.commit()
+        _publish_balance(user_id, max(cost, 0.0))
+        publish_event(user_id, "analysis", {
+            "id": aid, "action": parsed.action, "message": parsed.message or "", "buy_at": parsed.buy_at,
+            "sell_at": parsed.sell_at, "symbol": symbol, "interval": interval, "market_type": market_type,
+        })
         return (parsed.action, aid)
     except Exception:
         return (parsed.action, None)
 
 
+def _apply_portfolio_decision(user_id: int, action: str, symbol: str, market_type: str) -> tuple[str, str | None]:
+    """Per-user step on top of a shared analysis: turn a spot BUY without cash or a spot SELL
+    without holdings into HOLD. Futures BUY/SELL open long/short and pass through.
+    Returns (action, note) where note explains a change."""
+    if market_type == "futures" or action not in ("BUY", "SELL"):
+        return (action, None)
+    base = symbol.upper()[:-4] if symbol.upper().endswith("USDT") else symbol.upper()
+    try:
+        with get_db() as conn:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute(
+                    """
+                    SELECT u.demo_balance, COALESCE(h.quantity, 0) AS quantity
+                    FROM users u LEFT JOIN demo_holdings h ON h.user_id = u.id AND h.asset = %s
+                    WHERE u.id = %s
+                    """,
+                    (base, user_id),
+                )
+                row = cur.fetchone()
+    except Exception:
+        return (action, None)
+    if not row:
+        return (action, None)
+    if action == "BUY" and float(row["demo_balance"] or 0) <= 0:
+        return ("HOLD", "no USDT available to buy")
+    if action == "SELL" and float(row["quantity"] or 0) <= 0:
+        return ("HOLD", f"no {base} holding to sell")
+    return (action, None)
+
+
+def _shared_agent_analysis(
+    user_id: int,
+    image_base64: str,
+    symbol: str,
+    interval: str,
+    strategy: str,
+    market_type: str,
+    model_id: str,
+    candle: int,
+) -> tuple[str, int | None]:
+    """Market analysis shared by every agent with the same model/strategy/market/chart in this candle.
+
+    The first agent (leader) makes the LLM call without portfolio context and pays for it in full;
+    the others reuse the cached reply and are billed its prompt at the cached-input rate. Each user's
+    portfolio is then applied by `_apply_portfolio_decision` and stored as that user's own row.
+    The reply is cached only after the leader's charge succeeded; otherwise the first waiting agent
+    to claim it pays in full, and later agents make a new call.
+    """
+    from services.analysis_cache import get_analysis_cache
+
+    cache = get_analysis_cache()
+    key = (model_id, strategy, market_type, symbol.upper(), interval, candle)
+    user_content = _agent_user_content(symbol, interval, strategy, "", market_type, "")
+
+    def store(content: str, usage: dict, shared_from_id: int | None) -> tuple[str, int | None]:
+        parsed = _parse_agent_response(content)
+        action, note = _apply_portfolio_decision(user_id, parsed.action, symbol, market_type)
+        if note:
+            content = f"{content}\n\n[Portfolio check: {parsed.action} -> {action}, {note}.]"
+            parsed = parsed.model_copy(update={"action": action, "analysis": content[:2000]})
+        return _store_agent_analysis(
+            user_id, symbol, interval, strategy, market_type, model_id, content, parsed, usage, shared_from_id,
+        )
+
+    leader_result: tuple[str, int | None] = ("HOLD", None)
+
+    def compute() -> dict | None:
+        nonlocal leader_result
+        result = _request_agent_completion(model_id, user_content, image_base64)
+        if result is None:
+            return None
+        content, usage = result
+        # Charge the leader before the reply is published to other agents.
+        leader_result = store(content, usage, None)
+        aid = leader_result[1]
+        return {"content": content, "usage": usage, "analysis_id": aid, "paid": aid is not None}
+
+    shared, leader = cache.get_or_compute(key, compute, cacheable=lambda v: v["paid"])
+    if leader:
+        return leader_result
+    if shared is None:
+        return ("HOLD", None)
+    claimed: tuple[str, int | None] = ("HOLD", None)
+
+    def pay() -> dict | None:
+        # Nobody paid for this reply yet: this agent takes the full cost; others wait for the outcome.
+        nonlocal claimed
+        claimed = store(shared["content"], shared["usage"], None)
+        return {"analysis_id": claimed[1]} if claimed[1] is not None else None
+
+    if cache.pay_once(shared, pay):
+        return claimed
+    u = shared["usage"]
+    usage = {"input_tokens": 0, "output_tokens": 0,
+             "cached_input_tokens": (u["input_tokens"] or 0) + (u["cached_input_tokens"] or 0)}
+    return store(shared["content"], usage, shared.get("analysis_id"))
+
+
+def _analyze_with_image_sync(
+    user_id: int,
+    image_base64: str,
+    symbol: str,
+    interval: str,
+    strategy: str,
+    custom_prompt: str,
+    market_type: str,
+    model_id: str = DEFAULT_AGENT_MODEL,
+    shared: bool = False,
+) -> tuple[str, int | None]:
+    """Send sync request with image + context to selected model (GLM/OpenAI), return action and analysis_id, deduct balance, and log usage.
+
+    shared=True reuses one analysis per model/strategy/market/chart candle when there is no custom prompt.
+    """
+    if shared and not (custom_prompt or "").strip() and (image_base64 or "").strip():
+        from services.chart_cache import current_candle_open_ms
+
+        candle = current_candle_open_ms(interval)
+        if candle is not None:
+            return _shared_agent_analysis(
+                user_id, image_base64, symbol, interval, strategy, market_type, model_id, candle,
+            )
+    is_futures = market_type == "futures"
+    portfolio_ctx = _get_demo_futures_context(user_id) if is_futures else _get_demo_portfolio_context(user_id)
+    user_content = _agent_user_content(symbol, interval, strategy, custom_prompt, market_type, portfolio_ctx)
+    result = _request_agent_completion(model_id, user_content, image_base64)
+    if result is None:
+        return ("HOLD", None)
+    content, usage = result
+    parsed = _parse_agent_response(content)
+    return _store_agent_analysis(user_id, symbol, interval, strategy, market_type, model_id, content, parsed, usage)
+
+
+def _analysis_level(analysis_id: int | None, column: str) -> float | None:
+    """buy_at or sell_at of a stored analysis."""
+    if analysis_id is None:
+        return None
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute("SELECT buy_at, sell_at FROM agent_analyses WHERE id = %s", (analysis_id,))
+            row = cur.fetchone()
+    level = (row or {}).get(column)
+    return float(level) if level is not None else None
+
+
+def _analysis_exit_level(analysis_id: int | None, side: str) -> float | None:
+    """Agent's suggested exit for a new futures position: sell_at for LONG, buy_at for SHORT."""
+    return _analysis_level(analysis_id, "sell_at" if side == "LONG" else "buy_at")
+
+
 def _run_agent_cycle_sync(user_id: int) -> None:
     """Single agent cycle for one user: render chart, analyze, log output, and place order if enabled."""
-    from services.chart_render import fetch_klines, render_candlestick_base64
-    from routers.demo_router import place_demo_order_impl, place_demo_futures_order_impl
+    from services.chart_cache import get_chart_cache
+    from routers.demo_router import place_demo_order_impl, place_demo_order_at_level, place_demo_futures_order_impl
 
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
@@ -419,8 +614,7 @@ def _run_agent_cycle_sync(user_id: int) -> None:
     interval = job["interval"] or "1m"
     model_id = (job.get("model") or DEFAULT_AGENT_MODEL).strip() or DEFAULT_AGENT_MODEL
     try:
-        klines = fetch_klines(symbol, interval, 100)
-        image_b64 = render_candlestick_base64(klines, symbol)
+        image_b64 = get_chart_cache().get_chart_base64(symbol, interval, 100)
     except Exception as e:
         reason = getattr(e, "detail", None) or str(e) or e.__class__.__name__
         _append_agent_log(user_id, f"Failed to fetch chart: {reason}", "log")
@@ -429,15 +623,15 @@ def _run_agent_cycle_sync(user_id: int) -> None:
     action, analysis_id = _analyze_with_image_sync(
         user_id, image_b64, symbol, interval,
         job["strategy"] or "kisa_vade", (job["custom_prompt"] or "") or "", job["market_type"] or "spot",
-        model_id=model_id,
+        model_id=model_id, shared=get_settings().AGENT_SHARED_ANALYSIS,
     )
     if analysis_id is None:
         msg = "AI response could not be retrieved."
     else:
         msg = "Suggestion: Hold" if action == "HOLD" else ("Suggestion: Buy" if action == "BUY" else "Suggestion: Sell")
+    _append_agent_log(user_id, msg, "result", analysis_id)
     with get_db() as conn:
         with conn.cursor() as cur:
-            cur.execute("INSERT INTO agent_log (user_id, message, analysis_id, log_type) VALUES (%s, %s, %s, %s)", (user_id, msg, analysis_id, "result"))
             cur.execute("UPDATE agent_job SET last_run_at = %s WHERE user_id = %s", (datetime.utcnow(), user_id))
             conn.commit()
     if not job["trade_enabled"] and action in ("BUY", "SELL"):
@@ -460,6 +654,7 @@ def _run_agent_cycle_sync(user_id: int) -> None:
                 return
 
             amount_to_use = float(job["order_amount"] or 100)
+            resting_msg = None
             if market_type == "futures":
                 with get_db() as conn:
                     with conn.cursor(pymysql.cursors.DictCursor) as cur:
@@ -499,6 +694,7 @@ def _run_agent_cycle_sync(user_id: int) -> None:
                 place_demo_futures_order_impl(
                     user_id, target_futures_side, symbol,
                     amount_to_use, int(job["leverage"] or 10),
+                    exit_level=_analysis_exit_level(analysis_id, target_futures_side),
                 )
             else:
                 if order_mode == "max" and action == "BUY":
@@ -511,7 +707,15 @@ def _run_agent_cycle_sync(user_id: int) -> None:
                                 _append_agent_log(user_id, "Maximum mode: no available balance.", "log")
                                 return
                             amount_to_use = balance_now
-                if action == "BUY":
+                if get_settings().AGENT_SPOT_LIMIT_ORDERS:
+                    # Rest at the suggested level (buy_at for BUY, sell_at for SELL) when it beats the market.
+                    level = _analysis_level(analysis_id, "buy_at" if action == "BUY" else "sell_at")
+                    result = place_demo_order_at_level(
+                        user_id, action, symbol, level, quote_order_qty=amount_to_use if action == "BUY" else None,
+                    )
+                    if result.get("order_id"):
+                        resting_msg = f"Limit order placed: {action} @ {level:.8g}"
+                elif action == "BUY":
                     place_demo_order_impl(user_id, action, symbol, quote_order_qty=amount_to_use)
                 else:
                     place_demo_order_impl(user_id, action, symbol)
@@ -522,7 +726,7 @@ def _run_agent_cycle_sync(user_id: int) -> None:
                         conn.commit()
             _append_agent_log(
                 user_id,
-                f"Trade executed: {target_futures_side if market_type == 'futures' else action}",
+                resting_msg or f"Trade executed: {target_futures_side if market_type == 'futures' else action}",
                 "log",
             )
         except Exception as e:
@@ -530,37 +734,168 @@ def _run_agent_cycle_sync(user_id: int) -> None:
             _append_agent_log(user_id, f"Trade failed: {reason}", "log")
 
 
-def _agent_runner_loop() -> None:
-    while not _agent_runner_stop.is_set():
-        try:
-            now = datetime.utcnow()
-            with get_db() as conn:
-                with conn.cursor(pymysql.cursors.DictCursor) as cur:
+# Runner identity for agent_job leases. Each process claims jobs with a lease
+# (lease_owner + lease_expires_at) so N workers / hosts never run the same job twice.
+AGENT_RUNNER_ID = f"{socket.gethostname()[:64]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _claim_agent_jobs() -> list[dict]:
+    """Renew held leases, claim free or expired ones up to a fair share, and return owned jobs.
+
+    Claiming uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent runners never block on or
+    double-claim the same rows. Returned last_run_at is epoch seconds; provider comes from model.
+    """
+    s = get_settings()
+    ttl = int(s.AGENT_LEASE_TTL_SEC)
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute(
+                "UPDATE agent_job SET lease_expires_at = UTC_TIMESTAMP() + INTERVAL %s SECOND WHERE lease_owner = %s AND is_running = 1",
+                (ttl, AGENT_RUNNER_ID),
+            )
+            conn.commit()
+            cur.execute(
+                """SELECT COUNT(*) AS total,
+                    COUNT(DISTINCT CASE WHEN lease_expires_at > UTC_TIMESTAMP() THEN lease_owner END) AS owners,
+                    SUM(CASE WHEN lease_owner = %s THEN 1 ELSE 0 END) AS mine
+                FROM agent_job WHERE is_running = 1""",
+                (AGENT_RUNNER_ID,),
+            )
+            counts = cur.fetchone() or {}
+            total = int(counts.get("total") or 0)
+            mine = int(counts.get("mine") or 0)
+            owners = int(counts.get("owners") or 0) + (0 if mine else 1)
+            fair_share = -(-total // max(1, owners))
+            if s.AGENT_LEASE_MAX_JOBS > 0:
+                fair_share = min(fair_share, s.AGENT_LEASE_MAX_JOBS)
+            want = min(s.AGENT_LEASE_CLAIM_BATCH, fair_share - mine)
+            if want > 0:
+                cur.execute(
+                    """SELECT user_id FROM agent_job
+                    WHERE is_running = 1 AND (lease_owner IS NULL OR lease_expires_at IS NULL OR lease_expires_at < UTC_TIMESTAMP())
+                    ORDER BY last_run_at IS NOT NULL, last_run_at
+                    LIMIT %s FOR UPDATE SKIP LOCKED""",
+                    (want,),
+                )
+                claim_ids = [r["user_id"] for r in cur.fetchall()]
+                if claim_ids:
+                    placeholders = ", ".join(["%s"] * len(claim_ids))
                     cur.execute(
-                        """SELECT user_id, interval_sec, last_run_at FROM agent_job WHERE is_running = 1"""
+                        f"UPDATE agent_job SET lease_owner = %s, lease_expires_at = UTC_TIMESTAMP() + INTERVAL %s SECOND WHERE user_id IN ({placeholders})",
+                        (AGENT_RUNNER_ID, ttl, *claim_ids),
                     )
-                    jobs = cur.fetchall()
-            for j in jobs:
-                uid = j["user_id"]
-                sec = int(j["interval_sec"] or 60)
-                last = j["last_run_at"]
-                if last is None or (now - last).total_seconds() >= sec:
-                    try:
-                        _run_agent_cycle_sync(uid)
-                    except Exception:
-                        pass
-        except Exception:
-            pass
-        _agent_runner_stop.wait(timeout=5)
+                conn.commit()
+            cur.execute(
+                "SELECT user_id, interval_sec, last_run_at, model FROM agent_job WHERE is_running = 1 AND lease_owner = %s",
+                (AGENT_RUNNER_ID,),
+            )
+            rows = cur.fetchall()
+    jobs = []
+    for r in rows:
+        last = r["last_run_at"]
+        model_info = MODEL_REGISTRY.get((r.get("model") or "").strip()) or MODEL_REGISTRY[DEFAULT_AGENT_MODEL]
+        jobs.append({
+            "user_id": r["user_id"],
+            "interval_sec": int(r["interval_sec"] or 60),
+            "last_run_at": last.replace(tzinfo=timezone.utc).timestamp() if last else None,
+            "provider": model_info.get("provider", "glm"),
+        })
+    return jobs
+
+
+def _run_leased_agent_cycle(user_id: int) -> None:
+    """Extend the lease and run the cycle only if this runner still owns the job."""
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE agent_job SET lease_expires_at = UTC_TIMESTAMP() + INTERVAL %s SECOND WHERE user_id = %s AND lease_owner = %s AND is_running = 1",
+                (int(get_settings().AGENT_LEASE_TTL_SEC), user_id, AGENT_RUNNER_ID),
+            )
+            owned = cur.rowcount > 0
+            conn.commit()
+    if owned:
+        _run_agent_cycle_sync(user_id)
+
+
+def _release_agent_leases(still_running: set[int] = frozenset()) -> None:
+    """Hand held leases back so other runners take over immediately (graceful shutdown).
+
+    Jobs whose cycle is still running keep their lease, extended by one TTL, so no other runner
+    starts a second cycle for them while this one finishes.
+    """
+    keep = sorted(still_running)
+    not_kept = f" AND user_id NOT IN ({', '.join(['%s'] * len(keep))})" if keep else ""
+    try:
+        with get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE agent_job SET lease_owner = NULL, lease_expires_at = NULL WHERE lease_owner = %s" + not_kept,
+                    (AGENT_RUNNER_ID, *keep),
+                )
+                if keep:
+                    cur.execute(
+                        f"UPDATE agent_job SET lease_expires_at = UTC_TIMESTAMP() + INTERVAL %s SECOND"
+                        f" WHERE lease_owner = %s AND user_id IN ({', '.join(['%s'] * len(keep))})",
+                        (int(get_settings().AGENT_LEASE_TTL_SEC), AGENT_RUNNER_ID, *keep),
+                    )
+                conn.commit()
+    except Exception:
+        pass
+
+
+def agent_stream_targets() -> list[tuple[str, str | None]]:
+    """Symbol/interval pairs the market stream should keep live: running agents and open futures."""
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT symbol, `interval` FROM agent_job WHERE is_running = 1")
+            pairs = [(r[0], r[1]) for r in cur.fetchall()]
+            cur.execute("SELECT DISTINCT symbol FROM demo_futures_positions")
+            pairs += [(r[0], None) for r in cur.fetchall()]
+    return pairs
 
 
 def start_agent_runner() -> None:
-    global _agent_runner_thread
-    if _agent_runner_thread is not None and _agent_runner_thread.is_alive():
-        return
-    _agent_runner_stop.clear()
-    _agent_runner_thread = threading.Thread(target=_agent_runner_loop, daemon=True)
-    _agent_runner_thread.start()
+    global _agent_scheduler, _agent_log_writer
+    with _agent_scheduler_lock:
+        s = get_settings()
+        if _agent_log_writer is None:
+            _agent_log_writer = BatchWriter(
+                _write_agent_log_rows,
+                flush_rows=s.AGENT_LOG_FLUSH_ROWS,
+                flush_interval_sec=s.AGENT_LOG_FLUSH_INTERVAL_SEC,
+                max_buffer=s.AGENT_LOG_MAX_BUFFER,
+                name="agent-log-writer",
+            )
+        _agent_log_writer.start()
+        if _agent_scheduler is None:
+            _agent_scheduler = AgentScheduler(
+                load_jobs=_claim_agent_jobs,
+                run_cycle=_run_leased_agent_cycle,
+                max_workers=s.AGENT_RUNNER_WORKERS,
+                provider_limits=s.AGENT_PROVIDER_CONCURRENCY,
+                refresh_sec=s.AGENT_RUNNER_REFRESH_SEC,
+            )
+        _agent_scheduler.start()
+
+
+def stop_agent_runner() -> None:
+    with _agent_scheduler_lock:
+        if _agent_scheduler is not None:
+            still_running = _agent_scheduler.stop(drain_sec=get_settings().AGENT_RUNNER_DRAIN_SEC)
+            _release_agent_leases(still_running)
+        # After the drain so lines of the finished cycles are flushed; cycles still running past
+        # it have their lines written directly (BatchWriter.add after stop()).
+        if _agent_log_writer is not None:
+            _agent_log_writer.stop()
+
+
+def agent_runner_stats() -> dict:
+    if _agent_scheduler is None:
+        return {}
+    out = {**_agent_scheduler.stats(), "runner_id": AGENT_RUNNER_ID}
+    if _agent_log_writer is not None:
+        out["log_writer"] = _agent_log_writer.stats()
+    return out
 
 
 @router.post("/agent/analyze", response_model=AgentAnalyzeResponse)
@@ -657,9 +992,9 @@ class AgentStartRequest(BaseModel):
 
 
 @router.get("/balance")
-def get_balance(user_id: int = Depends(get_current_user_id)):
+def get_balance(user: dict = Depends(get_current_user)):
     """User AI balance (USD)."""
-    return {"balance": _get_balance(user_id)}
+    return {"balance": user["balance"]}
 
 
 @router.get("/models")
@@ -668,6 +1003,50 @@ def list_models():
     return {"models": [{"id": k, "label": k, "provider": v["provider"]} for k, v in MODEL_REGISTRY.items()]}
 
 
+@router.get("/models/quality")
+def models_quality(
+    horizon: Optional[str] = Query(None, max_length=10),
+    market_type: Optional[Literal["spot", "futures"]] = None,
+    interval: Optional[str] = Query(None, max_length=10),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Forward-return quality of past agent decisions per model / strategy / horizon (precomputed by scripts/evaluate_decisions.py)."""
+    where, args = [], []
+    for col, val in (("horizon", horizon), ("market_type", market_type), ("`interval`", interval)):
+        if val:
+            where.append(f"{col} = %s")
+            args.append(val)
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute(
+                f"""SELECT model, strategy, market_type, horizon, SUM(decisions) AS decisions, SUM(hits) AS hits,
+                           SUM(sum_return) AS sum_return, SUM(sum_return_sq) AS sum_return_sq, SUM(sum_edge) AS sum_edge,
+                           MAX(updated_at) AS updated_at
+                    FROM agent_decision_quality {'WHERE ' + ' AND '.join(where) if where else ''}
+                    GROUP BY model, strategy, market_type, horizon ORDER BY model, strategy, market_type, horizon""",
+                tuple(args),
+            )
+            rows = cur.fetchall()
+    out = []
+    for r in rows:
+        n = int(r["decisions"])
+        mean = float(r["sum_return"]) / n
+        var = max(0.0, float(r["sum_return_sq"]) / n - mean * mean)
+        out.append({
+            "model": r["model"] or None,
+            "strategy": r["strategy"],
+            "market_type": r["market_type"],
+            "horizon": r["horizon"],
+            "decisions": n,
+            "hit_rate": round(int(r["hits"]) / n, 4),
+            "avg_return_pct": round(mean * 100.0, 4),
+            "return_std_pct": round(var ** 0.5 * 100.0, 4),
+            "avg_edge_pct": round(float(r["sum_edge"]) / n * 100.0, 4),
+            "updated_at": r["updated_at"].isoformat() if r["updated_at"] else None,
+        })
+    return {"quality": out}
+
+
 @router.post("/agent/start")
 def agent_start(body: AgentStartRequest, user_id: int = Depends(get_current_user_id)):
     """Start agent in background. Keeps running even when page is closed."""
@@ -697,8 +1076,8 @@ def agent_start(body: AgentStartRequest, user_id: int = Depends(get_current_user
                 ),
             )
             conn.commit()
-            cur.execute("INSERT INTO agent_log (user_id, message, log_type) VALUES (%s, %s, %s)", (user_id, "Agent started in background.", "log"))
-            conn.commit()
+    _append_agent_log(user_id, "Agent started in background.")
+    _agent_scheduler.wake()
     return {"ok": True, "message": "Agent started in background. It continues running even if you leave the page."}
 
 
@@ -707,31 +1086,71 @@ def agent_stop(user_id: int = Depends(get_current_user_id)):
     """Stop agent."""
     with get_db() as conn:
         with conn.cursor() as cur:
-            cur.execute("UPDATE agent_job SET is_running = 0 WHERE user_id = %s", (user_id,))
-            conn.commit()
-            cur.execute("INSERT INTO agent_log (user_id, message, log_type) VALUES (%s, %s, %s)", (user_id, "Agent stopped.", "log"))
+            cur.execute("UPDATE agent_job SET is_running = 0, lease_owner = NULL, lease_expires_at = NULL WHERE user_id = %s", (user_id,))
             conn.commit()
+    _append_agent_log(user_id, "Agent stopped.")
     return {"ok": True, "message": "Agent stopped."}
 
 
+_AGENT_JOB_COLUMNS = (
+    "is_running", "symbol", "interval", "strategy", "custom_prompt", "market_type", "trade_enabled", "order_amount",
+    "order_amount_mode", "max_open_positions", "single_trade_if_max", "max_mode_used", "min_trade_interval_sec",
+    "leverage", "interval_sec", "model", "started_at", "last_run_at",
+)
+# Log lines per status reply (the dashboard shows at most this many).
+_AGENT_STATUS_LOGS = 100
+
+
 @router.get("/agent/status")
-def agent_status(user_id: int = Depends(get_current_user_id)):
-    """Agent running status + settings + latest logs."""
+def agent_status(
+    request: Request,
+    user_id: int = Depends(get_current_user_id),
+    since_id: int = Query(0, ge=0),
+    known_analysis_id: int | None = Query(None),
+):
+    """
+    Agent running status + settings + latest logs.
+    - since_id: only log rows with id > since_id (use `last_log_id` of the previous reply). When more
+      than one page arrived since, the newest page is sent with `incremental: false`.
+    - known_analysis_id: latest analysis the client already has; its full text is not resent.
+    Replies carry an ETag; If-None-Match with an unchanged state returns 304 without reading logs.
+    """
+    job_cols = ", ".join(f"j.`{c}`" for c in _AGENT_JOB_COLUMNS)
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
             cur.execute(
-                "SELECT is_running, symbol, `interval`, strategy, custom_prompt, market_type, trade_enabled, order_amount, order_amount_mode, max_open_positions, single_trade_if_max, max_mode_used, min_trade_interval_sec, leverage, interval_sec, model, started_at, last_run_at FROM agent_job WHERE user_id = %s",
-                (user_id,),
+                f"""
+                SELECT {job_cols},
+                    (SELECT l.id FROM agent_log l WHERE l.user_id = j.user_id ORDER BY l.id DESC LIMIT 1) AS last_log_id,
+                    a.id AS a_id, a.action AS a_action, a.message_short AS a_message, a.buy_at AS a_buy_at,
+                    a.sell_at AS a_sell_at, a.created_at AS a_created_at,
+                    CASE WHEN a.id = %s THEN NULL ELSE a.analysis_text END AS a_text
+                FROM agent_job j
+                LEFT JOIN agent_analyses a ON a.id = (
+                    SELECT x.id FROM agent_analyses x WHERE x.user_id = j.user_id ORDER BY x.created_at DESC, x.id DESC LIMIT 1
+                )
+                WHERE j.user_id = %s
+                """,
+                (known_analysis_id, user_id),
             )
-            job = cur.fetchone()
+            row = cur.fetchone()
+            if not row:
+                return {"is_running": False, "job": None, "logs": [], "last_log_id": 0}
+            etag = '"' + hashlib.sha1(
+                repr((tuple(row[c] for c in _AGENT_JOB_COLUMNS), row["last_log_id"], row["a_id"], since_id, known_analysis_id)).encode()
+            ).hexdigest()[:20] + '"'
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers={"ETag": etag})
             cur.execute(
-                "SELECT id, created_at, message, analysis_id, log_type FROM agent_log WHERE user_id = %s ORDER BY created_at DESC LIMIT 100",
-                (user_id,),
+                "SELECT id, created_at, message, analysis_id, log_type FROM agent_log WHERE user_id = %s AND id > %s ORDER BY id DESC LIMIT %s",
+                (user_id, since_id, _AGENT_STATUS_LOGS + 1),
             )
             logs = cur.fetchall()
-    if not job:
-        return {"is_running": False, "job": None, "logs": []}
-    job_out = {k: v for k, v in job.items()}
+    # More new lines than one page: send the newest page as a full replacement (the client keeps
+    # only that many) instead of an increment that would silently skip the older ones.
+    truncated = len(logs) > _AGENT_STATUS_LOGS
+    logs = logs[:_AGENT_STATUS_LOGS]
+    job_out = {c: row[c] for c in _AGENT_JOB_COLUMNS}
     if job_out.get("started_at") and hasattr(job_out["started_at"], "isoformat"):
         job_out["started_at"] = job_out["started_at"].isoformat()
     if job_out.get("last_run_at") and hasattr(job_out["last_run_at"], "isoformat"):
@@ -741,27 +1160,162 @@ def agent_status(user_id: int = Depends(get_current_user_id)):
         for r in logs
     ]
     last_analysis = None
-    for r in logs:
-        if r.get("analysis_id"):
-            with get_db() as conn2:
-                with conn2.cursor(pymysql.cursors.DictCursor) as cur2:
-                    cur2.execute(
-                        "SELECT id, action, analysis_text, message_short, buy_at, sell_at FROM agent_analyses WHERE id = %s AND user_id = %s",
-                        (r["analysis_id"], user_id),
-                    )
-                    row = cur2.fetchone()
-            if row:
-                created_at = r.get("created_at")
-                last_analysis = {
-                    "action": row["action"],
-                    "analysis": row["analysis_text"] or "",
-                    "message": row["message_short"] or row["analysis_text"] or "",
-                    "buy_at": float(row["buy_at"]) if row["buy_at"] is not None else None,
-                    "sell_at": float(row["sell_at"]) if row["sell_at"] is not None else None,
-                    "time": created_at.isoformat() if hasattr(created_at, "isoformat") else str(created_at),
-                }
-            break
-    return {"is_running": bool(job["is_running"]), "job": job_out, "logs": logs_out, "last_analysis": last_analysis}
+    if row["a_id"] is not None:
+        created_at = row["a_created_at"]
+        last_analysis = {
+            "id": row["a_id"],
+            "action": row["a_action"],
+            "message": row["a_message"] or row["a_text"] or "",
+            "buy_at": float(row["a_buy_at"]) if row["a_buy_at"] is not None else None,
+            "sell_at": float(row["a_sell_at"]) if row["a_sell_at"] is not None else None,
+            "time": created_at.isoformat() if hasattr(created_at, "isoformat") else str(created_at),
+        }
+        if row["a_id"] != known_analysis_id:
+            last_analysis["analysis"] = row["a_text"] or ""
+    body = {
+        "is_running": bool(row["is_running"]),
+        "job": job_out,
+        "logs": logs_out,
+        "incremental": since_id > 0 and not truncated,
+        "last_log_id": logs[0]["id"] if logs else since_id,
+        "last_analysis": last_analysis,
+    }
+    return JSONResponse(jsonable_encoder(body), headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def _chat_usage_tokens(u: dict) -> tuple[int, int, int]:
+    """(input, output, cached input) token counts from an OpenAI/GLM usage object."""
+    u = u or {}
+    input_tok = u.get("prompt_tokens") or 0
+    output_tok = u.get("completion_tokens") or 0
+    cached_tok = (u.get("prompt_tokens_details") or {}).get("cached_tokens") or (u.get("input_tokens_details") or {}).get("cached_tokens") or 0
+    return input_tok, output_tok, cached_tok
+
+
+def _bill_chat_usage(user_id: int, model_id: str, usage: dict) -> None:
+    """Deduct chat cost and log chat_usage. Raises 402 when the balance does not cover it."""
+    input_tok, output_tok, cached_tok = _chat_usage_tokens(usage)
+    cost = _compute_cost(model_id, input_tok, output_tok, cached_tok)
+    if cost <= 0:
+        return
+    if _get_balance(user_id) < cost:
+        raise HTTPException(status_code=402, detail="Insufficient balance. Please top up your balance.")
+    if not _charge_balance(user_id, cost):
+        raise HTTPException(status_code=402, detail="Insufficient balance.")
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO chat_usage (user_id, model, input_tokens, output_tokens, cached_input_tokens, cost_usd) VALUES (%s, %s, %s, %s, %s, %s)",
+                (user_id, model_id, input_tok, output_tok, cached_tok, cost),
+            )
+            conn.commit()
+
+
+def _sse(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# Rough characters per token for estimates before the provider reports usage (low on purpose: over-estimates).
+_CHARS_PER_TOKEN = 3
+
+
+def _estimate_tokens(text_chars: int) -> int:
+    return text_chars // _CHARS_PER_TOKEN + 1
+
+
+def _settle_chat_usage(user_id: int, model_id: str, reserved: float, usage: dict, estimated: tuple[int, int]) -> None:
+    """Replace the reservation by the actual cost and log chat_usage.
+
+    Uses the provider's usage when it arrived, else the estimated (input, output) tokens of what was relayed.
+    """
+    input_tok, output_tok, cached_tok = _chat_usage_tokens(usage)
+    if not usage:
+        input_tok, output_tok = estimated
+    cost = _compute_cost(model_id, input_tok, output_tok, cached_tok)
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO chat_usage (user_id, model, input_tokens, output_tokens, cached_input_tokens, cost_usd) VALUES (%s, %s, %s, %s, %s, %s)",
+                (user_id, model_id, input_tok, output_tok, cached_tok, cost),
+            )
+            # Refund the unused part of the reservation, or take the overrun; an overrun the balance
+            # cannot cover is waived and only the usage row is committed.
+            charged = _deduct_balance(cur, user_id, cost - reserved)
+        conn.commit()
+    if charged:
+        _publish_balance(user_id, cost - reserved)
+
+
+class _ChatStream:
+    """Usage of one streamed chat reply; `settle()` runs exactly once, whatever happened to the stream."""
+
+    def __init__(self, user_id: int, model_id: str, reserved: float, input_est: int):
+        self.user_id = user_id
+        self.model_id = model_id
+        self.reserved = reserved
+        self.input_est = input_est
+        self.usage: dict = {}
+        self.chunks = 0
+        self.out_chars = 0
+        self._settled = False
+
+    def settle(self) -> None:
+        if self._settled:
+            return
+        self._settled = True
+        if not self.chunks:
+            # Never started, or the provider failed before answering: nothing is charged.
+            _charge_balance(self.user_id, -self.reserved)
+            return
+        _settle_chat_usage(
+            self.user_id, self.model_id, self.reserved, self.usage,
+            (self.input_est, _estimate_tokens(self.out_chars)),
+        )
+
+
+class _SettledStreamingResponse(StreamingResponse):
+    """Settles the chat reservation once the response is over, also when the body was never iterated."""
+
+    def __init__(self, content, chat_stream: _ChatStream, **kwargs):
+        super().__init__(content, **kwargs)
+        self.chat_stream = chat_stream
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Scheduled before awaiting: a disconnect may cancel this call, the shielded task still finishes.
+            await asyncio.shield(asyncio.ensure_future(asyncio.to_thread(self.chat_stream.settle)))
+
+
+async def _stream_chat_events(client, payload: dict, state: _ChatStream):
+    """Relay provider deltas as SSE `data: {"delta": ...}` events, then send `done`.
+
+    Usage is recorded on `state` for settlement; relaying stops once the estimated cost of the
+    output exceeds the reservation.
+    """
+    chunks = client.stream_chat(payload, timeout=60.0)
+    try:
+        async for chunk in chunks:
+            state.chunks += 1
+            if chunk.get("usage"):
+                state.usage = chunk["usage"]
+            delta = (chunk.get("choices") or [{}])[0].get("delta") or {}
+            # Reasoning (thinking) tokens are billed as output too.
+            state.out_chars += len(delta.get("content") or "") + len(delta.get("reasoning_content") or "")
+            if _compute_cost(state.model_id, state.input_est, _estimate_tokens(state.out_chars)) > state.reserved:
+                yield _sse({"detail": "Reply exceeded the reserved balance.", "status": 402}, event="error")
+                return
+            if delta.get("content"):
+                yield _sse({"delta": delta["content"]})
+        yield _sse({"done": True})
+    except LLMProviderError as e:
+        yield _sse({"detail": e.detail, "status": e.status_code}, event="error")
+    except httpx.HTTPError:
+        yield _sse({"detail": "Connection to model provider failed."}, event="error")
+    finally:
+        await chunks.aclose()
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -769,6 +1323,7 @@ async def chat(
     body: ChatRequest,
     user_id: int = Depends(get_current_user_id),
 ):
+    """Chat completion. With `stream: true` the reply is sent as server-sent events."""
     s = get_settings()
     model_id = (body.model or DEFAULT_CHAT_MODEL).strip() or DEFAULT_CHAT_MODEL
     if model_id not in MODEL_REGISTRY:
@@ -782,22 +1337,28 @@ async def chat(
     payload = {"model": model_id, "messages": messages}
     if provider == "glm" and getattr(s, "GLM5_THINKING", True):
         payload["thinking"] = {"type": "enabled"}
-    if provider == "openai":
-        if not getattr(s, "OPENAI_API_KEY", None) or not s.OPENAI_API_KEY:
-            raise HTTPException(status_code=503, detail="OpenAI API key is not configured.")
-        base = (getattr(s, "OPENAI_BASE_URL", None) or "https://api.openai.com/v1").strip().rstrip("/")
-        url = f"{base}/chat/completions"
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            r = await client.post(url, headers={"Content-Type": "application/json", "Authorization": f"Bearer {s.OPENAI_API_KEY}"}, json=payload)
-    else:
-        if not s.GLM5_API_KEY:
-            raise HTTPException(status_code=503, detail="GLM API key is not configured.")
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            r = await client.post(
-                f"{s.GLM5_BASE_URL.rstrip('/')}/chat/completions",
-                headers={"Content-Type": "application/json", "Authorization": f"Bearer {s.GLM5_API_KEY}"},
-                json=payload,
-            )
+    client = get_llm_client(provider)
+    if not client.configured:
+        name = "OpenAI" if provider == "openai" else "GLM"
+        raise HTTPException(status_code=503, detail=f"{name} API key is not configured.")
+    if body.stream:
+        # Reserve the worst case (estimated prompt + capped output) before the first token is relayed.
+        max_output = s.CHAT_STREAM_MAX_OUTPUT_TOKENS
+        payload["max_completion_tokens" if provider == "openai" else "max_tokens"] = max_output
+        input_est = _estimate_tokens(sum(len(m["content"] or "") for m in messages)) + 8 * len(messages)
+        reserved = _compute_cost(model_id, input_est, max_output)
+        if not await asyncio.to_thread(_charge_balance, user_id, reserved):
+            raise HTTPException(status_code=402, detail="Insufficient balance. Please top up your balance.")
+        if provider == "openai":
+            payload["stream_options"] = {"include_usage": True}
+        state = _ChatStream(user_id, model_id, reserved, input_est)
+        return _SettledStreamingResponse(
+            _stream_chat_events(client, payload, state),
+            state,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    r = await client.post_chat(payload, timeout=60.0)
     if r.status_code != 200:
         raise HTTPException(status_code=r.status_code, detail=r.text or "API error")
     data = r.json()
@@ -805,21 +1366,5 @@ async def chat(
         content = (data.get("choices") or [{}])[0].get("message", {}).get("content") or ""
     except (KeyError, IndexError):
         raise HTTPException(status_code=502, detail="Unexpected response format")
-    u = data.get("usage") or {}
-    input_tok = u.get("prompt_tokens") or 0
-    output_tok = u.get("completion_tokens") or 0
-    cached_tok = u.get("prompt_tokens_details", {}).get("cached_tokens") or u.get("input_tokens_details", {}).get("cached_tokens") or 0
-    cost = _compute_cost(model_id, input_tok, output_tok, cached_tok)
-    if cost > 0:
-        if _get_balance(user_id) < cost:
-            raise HTTPException(status_code=402, detail="Insufficient balance. Please top up your balance.")
-        if not _deduct_balance(user_id, cost, None):
-            raise HTTPException(status_code=402, detail="Insufficient balance.")
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO chat_usage (user_id, model, input_tokens, output_tokens, cached_input_tokens, cost_usd) VALUES (%s, %s, %s, %s, %s, %s)",
-                    (user_id, model_id, input_tok, output_tok, cached_tok, cost),
-                )
-                conn.commit()
+    await asyncio.to_thread(_bill_chat_usage, user_id, model_id, data.get("usage") or {})
     return ChatResponse(content=content)
@@ -1,9 +1,11 @@
 # Vox Trader Backend - Auth routes (login, register)
+import asyncio
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from database import get_db
 from models import UserCreate, UserLogin, UserResponse, TokenResponse
-from auth import hash_password, verify_password, create_access_token, decode_token
+from auth import create_access_token, decode_token_cached
+from services.hash_pool import HashQueueFullError, hash_password_async, verify_password_async
 import pymysql
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -16,20 +18,40 @@ def get_user_by_email(conn, email: str) -> dict | None:
         return cur.fetchone()
 
 
-@router.post("/register", response_model=TokenResponse)
-def register(body: UserCreate):
+def _find_user(email: str) -> dict | None:
+    with get_db() as conn:
+        return get_user_by_email(conn, email)
+
+
+def _create_user(body: UserCreate, password_hash: str) -> dict:
     with get_db() as conn:
-        if get_user_by_email(conn, body.email):
-            raise HTTPException(status_code=400, detail="Email already registered")
-        password_hash = hash_password(body.password)
         with conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO users (email, password_hash, name, balance) VALUES (%s, %s, %s, 10.0)",
                 (body.email, password_hash, body.name or body.email.split("@")[0]),
             )
-            uid = cur.lastrowid
         conn.commit()
-        user = get_user_by_email(conn, body.email)
+        return get_user_by_email(conn, body.email)
+
+
+def _update_password_hash(user_id: int, password_hash: str) -> None:
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+        conn.commit()
+
+
+async def _hashing(coro):
+    """Await a hash-pool call, mapping a full queue to 429 and a stuck worker to 503."""
+    try:
+        return await coro
+    except HashQueueFullError:
+        raise HTTPException(status_code=429, detail="Too many sign-in requests, please retry shortly.", headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Sign-in is temporarily unavailable, please retry.")
+
+
+def _token_response(user: dict) -> TokenResponse:
     user_resp = UserResponse(
         id=user["id"],
         email=user["email"],
@@ -43,36 +65,55 @@ def register(body: UserCreate):
     return TokenResponse(access_token=token, user=user_resp)
 
 
+@router.post("/register", response_model=TokenResponse)
+async def register(body: UserCreate):
+    # bcrypt runs in the hash pool and DB calls in worker threads, so neither blocks the event loop.
+    if await asyncio.to_thread(_find_user, body.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    password_hash = await _hashing(hash_password_async(body.password))
+    user = await asyncio.to_thread(_create_user, body, password_hash)
+    return _token_response(user)
+
+
 @router.post("/login", response_model=TokenResponse)
-def login(body: UserLogin):
-    with get_db() as conn:
-        user = get_user_by_email(conn, body.email)
-    if not user or not verify_password(body.password, user["password_hash"]):
+async def login(body: UserLogin):
+    user = await asyncio.to_thread(_find_user, body.email)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
-    user_resp = UserResponse(
-        id=user["id"],
-        email=user["email"],
-        name=user["name"],
-        demo_balance=float(user.get("demo_balance", 10000)),
-        demo_mode=bool(user.get("demo_mode", 0)),
-        balance=float(user.get("balance", 0)),
-        created_at=user["created_at"],
-    )
-    token = create_access_token({"sub": str(user["id"])})
-    return TokenResponse(access_token=token, user=user_resp)
+    valid, new_hash = await _hashing(verify_password_async(body.password, user["password_hash"]))
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was made; store it at the current cost.
+        await asyncio.to_thread(_update_password_hash, user["id"], new_hash)
+    return _token_response(user)
 
 
 def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int:
     if not credentials:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    payload = decode_token(credentials.credentials)
+    payload = decode_token_cached(credentials.credentials)
     if not payload or "sub" not in payload:
         raise HTTPException(status_code=401, detail="Invalid token")
     return int(payload["sub"])
 
 
-@router.get("/me", response_model=UserResponse)
-def me(user_id: int = Depends(get_current_user_id)):
+def get_optional_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int | None:
+    """User id for a valid bearer token, None for anonymous callers of public endpoints."""
+    if not credentials:
+        return None
+    payload = decode_token_cached(credentials.credentials)
+    if not payload or "sub" not in payload:
+        return None
+    return int(payload["sub"])
+
+
+def get_current_user(user_id: int = Depends(get_current_user_id)) -> dict:
+    """The caller's user row (id, email, name, demo_balance, demo_mode, balance, created_at).
+
+    FastAPI caches dependencies per request, so every handler / dependency asking for it shares one
+    SELECT. A snapshot for reads only: balance changes still lock the row with SELECT ... FOR UPDATE.
+    """
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
             cur.execute(
@@ -85,4 +126,9 @@ def me(user_id: int = Depends(get_current_user_id)):
     row["demo_balance"] = float(row.get("demo_balance", 10000))
     row["demo_mode"] = bool(row.get("demo_mode", 0))
     row["balance"] = float(row.get("balance", 0))
-    return UserResponse(**row)
+    return row
+
+
+@router.get("/me", response_model=UserResponse)
+def me(user: dict = Depends(get_current_user)):
+    return UserResponse(**user)
@@ -11,6 +11,7 @@ from pydantic import BaseModel, EmailStr, Field
 from config import get_settings
 from database import get_db
 from routers.auth_router import get_current_user_id
+from services.event_bus import publish_event
 
 router = APIRouter(prefix="/billing", tags=["billing"])
 
@@ -184,6 +185,7 @@ def topup_callback(
                     (payment_id, payload_log[:65535], datetime.utcnow(), datetime.utcnow(), row["id"]),
                 )
                 conn.commit()
+                publish_event(row["user_id"], "ai_balance", {"topup_usd": float(row["amount_usd"])})
                 return RedirectResponse(_frontend_redirect_url("success", order_number, float(row["amount_usd"])), status_code=302)
 
             cur.execute(
@@ -1,12 +1,17 @@
 # Vox Trader Backend - Binance proxy (klines public, myTrades signed)
+import asyncio
 import time
 import hmac
 import hashlib
 import urllib.parse
 from fastapi import APIRouter, HTTPException, Depends, Query
 from database import get_db
-from routers.auth_router import get_current_user_id
+from routers.auth_router import get_current_user_id, get_optional_user_id
 from encryption import decrypt_api_value
+from services.credential_cache import get_credential_cache
+from services.market_stream import KLINE_INTERVALS, get_market_stream
+from services.price_cache import get_price_cache
+from services.kline_store import KlineFetchError, get_kline_store
 import pymysql
 import httpx
 
@@ -14,7 +19,7 @@ router = APIRouter(prefix="/binance", tags=["binance"])
 BINANCE_BASE = "https://api.binance.com"
 
 
-def _get_user_credentials(user_id: int) -> tuple[str, str]:
+def _load_user_credentials(user_id: int) -> tuple[str, str]:
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
             cur.execute(
@@ -32,13 +37,48 @@ def _get_user_credentials(user_id: int) -> tuple[str, str]:
     return key, secret
 
 
+async def _get_user_credentials(user_id: int) -> tuple[str, str]:
+    """Decrypted (api_key, api_secret): from the short-TTL cache, else loaded off the event loop."""
+    cache = get_credential_cache()
+    credentials = cache.get(user_id)
+    if credentials is None:
+        epoch = cache.epoch()
+        credentials = await asyncio.to_thread(_load_user_credentials, user_id)
+        cache.put(user_id, credentials, epoch)
+    return credentials
+
+
 @router.get("/klines")
 async def get_klines(
     symbol: str = Query("BTCUSDT", description="Symbol"),
     interval: str = Query("1m", description="1m, 3m, 5m, 15m, 30m, 1h, 2h, 4h, 1d"),
     limit: int = Query(500, ge=1, le=1000),
+    user_id: int | None = Depends(get_optional_user_id),
 ):
-    """Binance mum verisi (public)."""
+    """Binance mum verisi (public). Canlı WebSocket tamponunda yeterli mum varsa oradan döner,
+    yoksa kapanmış mumlar yerel kline deposundan okunur (eksik aralıklar Binance'ten tamamlanır).
+    Canlı akışa yalnızca giriş yapmış kullanıcıların istediği geçerli semboller eklenir."""
+    if interval not in KLINE_INTERVALS:
+        raise HTTPException(status_code=400, detail="Invalid interval")
+    symbol = symbol.upper()
+    stream = get_market_stream()
+    if stream is not None:
+        live = stream.get_raw_klines(symbol, interval, limit)
+        if live is not None:
+            return live
+    # Not buffered yet: reject symbols Binance does not list before touching the stream or the store.
+    listed = await asyncio.to_thread(get_price_cache().is_listed, symbol)
+    if listed is False:
+        raise HTTPException(status_code=400, detail="Invalid symbol")
+    if stream is not None and user_id is not None and listed:
+        stream.track(symbol, interval)
+    store = get_kline_store()
+    if store is not None and store.supports(interval):
+        current = stream.get_raw_klines(symbol, interval, 1) if stream is not None else None
+        try:
+            return await asyncio.to_thread(store.get_latest, symbol, interval, limit, current[-1] if current else None)
+        except KlineFetchError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
     async with httpx.AsyncClient() as client:
         r = await client.get(
             f"{BINANCE_BASE}/api/v3/klines",
@@ -53,7 +93,7 @@ async def get_klines(
 @router.get("/account")
 async def get_account_balances(user_id: int = Depends(get_current_user_id)):
     """User Binance spot balances (only assets with total > 0)."""
-    api_key, api_secret = _get_user_credentials(user_id)
+    api_key, api_secret = await _get_user_credentials(user_id)
     params = {
         "timestamp": int(time.time() * 1000),
         "recvWindow": 60000,
@@ -84,7 +124,7 @@ async def get_my_trades(
     limit: int = Query(50, ge=1, le=1000),
 ):
     """User Binance trade history (API key required)."""
-    api_key, api_secret = _get_user_credentials(user_id)
+    api_key, api_secret = await _get_user_credentials(user_id)
     params = {
         "symbol": symbol.upper(),
         "limit": limit,
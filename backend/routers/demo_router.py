@@ -1,13 +1,22 @@
 # Vox Trader Backend - Demo trading (demo_balance + demo_holdings)
+import math
+import threading
+import time
 from decimal import Decimal
 from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel
 from typing import Literal
 from datetime import datetime
+from config import get_settings
 from database import get_db
-from routers.auth_router import get_current_user_id
+from routers.auth_router import get_current_user, get_current_user_id
+from services.price_cache import get_price_cache, PriceUnavailableError
+from services.market_stream import get_market_stream
+from services.event_bus import publish_event
+from services.futures_mtm import mark_positions, mark_users
+from services.trigger_engine import get_trigger_engine, position_triggers
+from services.order_book import LIMIT, get_order_book, order_direction
 import pymysql
-import httpx
 
 router = APIRouter(prefix="/demo", tags=["demo"])
 BINANCE_BASE = "https://api.binance.com"
@@ -22,13 +31,30 @@ COMMISSION_RATE = 0.001
 FUTURES_COMMISSION_RATE = 0.0004
 
 
+def _track_symbols(symbols) -> None:
+    """Ask the market stream to keep these symbols live (no-op when streaming is off)."""
+    stream = get_market_stream()
+    if stream is not None:
+        for sym in symbols:
+            stream.track(sym)
+
+
 def _get_price(symbol: str) -> float:
-    """Fetch current price from Binance (public)."""
-    with httpx.Client(timeout=5.0) as client:
-        r = client.get(f"{BINANCE_BASE}/api/v3/ticker/price", params={"symbol": symbol.upper()})
-    if r.status_code != 200:
+    """Current price from the shared process-wide cache (live stream or Binance public ticker)."""
+    try:
+        price = get_price_cache().get_price(symbol)
+    except PriceUnavailableError:
         raise HTTPException(status_code=502, detail="Failed to fetch price")
-    return float(r.json()["price"])
+    # Only symbols the exchange priced are worth a stream subscription.
+    _track_symbols([symbol])
+    return price
+
+
+def _get_prices(symbols) -> dict[str, float]:
+    """Batch price lookup; symbols without a price are left out."""
+    symbols = list(symbols)
+    _track_symbols(symbols)
+    return get_price_cache().get_prices(symbols)
 
 
 def _base_asset(symbol: str) -> str:
@@ -42,15 +68,12 @@ def _base_asset(symbol: str) -> str:
 
 
 @router.get("/account")
-def get_demo_account(user_id: int = Depends(get_current_user_id)):
+def get_demo_account(user: dict = Depends(get_current_user)):
     """Demo balance and positions."""
+    user_id = user["id"]
+    demo_balance = user["demo_balance"]
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute("SELECT demo_balance FROM users WHERE id = %s", (user_id,))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="User not found")
-            demo_balance = float(row["demo_balance"])
             cur.execute("SELECT asset, quantity FROM demo_holdings WHERE user_id = %s AND quantity > 0", (user_id,))
             holdings = [{"asset": r["asset"], "quantity": float(r["quantity"])} for r in cur.fetchall()]
     return {"demo_balance": demo_balance, "holdings": holdings}
@@ -101,108 +124,200 @@ INITIAL_DEMO_BALANCE = 10000.0
 
 def _holdings_value(holdings: list[dict]) -> float:
     """USDT value of positions with current market prices."""
+    prices = _get_prices(h["asset"] + "USDT" for h in holdings if h["asset"] != "USDT")
     total = 0.0
     for h in holdings:
         asset, qty = h["asset"], float(h["quantity"])
         if asset == "USDT":
             total += qty
             continue
-        try:
-            price = _get_price(asset + "USDT")
+        price = prices.get(asset + "USDT")
+        if price is not None:
             total += qty * price
-        except Exception:
-            pass
     return total
 
 
+def _iso(ts) -> str:
+    return ts.isoformat() if hasattr(ts, "isoformat") else str(ts)
+
+
+def _ensure_spot_state(cur, user_id: int) -> dict:
+    """Spot ledger row for the user; built once from demo_trades for accounts that predate it.
+
+    Call with the users row locked (FOR UPDATE) so the one-off replay cannot race an order.
+    Equity checkpoints of the replay mark every asset at its own last fill price.
+    """
+    cur.execute("SELECT * FROM demo_spot_state WHERE user_id = %s", (user_id,))
+    state = cur.fetchone()
+    if state:
+        return state
+    cur.execute(
+        "SELECT id, side, base_asset, quantity, price_usdt, usdt_amount, commission_usdt, created_at FROM demo_trades WHERE user_id = %s ORDER BY id ASC",
+        (user_id,),
+    )
+    cash = INITIAL_DEMO_BALANCE
+    counts = {"BUY": 0, "SELL": 0}
+    commission = realized = 0.0
+    positions: dict[str, list[float]] = {}  # asset -> [quantity, cost_basis, last_price, avg_entry_price]
+    checkpoints = []
+    last_trade_id = None
+    for r in cur.fetchall():
+        base, qty, price, usdt_amt = r["base_asset"], float(r["quantity"]), float(r["price_usdt"]), float(r["usdt_amount"])
+        pos = positions.setdefault(base, [0.0, 0.0, price, 0.0])
+        cash += usdt_amt
+        commission += float(r.get("commission_usdt") or 0)
+        counts[r["side"]] = counts.get(r["side"], 0) + 1
+        pos[2] = price
+        if r["side"] == "BUY":
+            pos[3] = (pos[0] * pos[3] + qty * price) / (pos[0] + qty) if pos[0] + qty > 0 else price
+            pos[0] += qty
+            pos[1] += -usdt_amt
+        else:
+            closed_cost = pos[1] * min(1.0, qty / pos[0]) if pos[0] > 0 else 0.0
+            realized += usdt_amt - closed_cost
+            pos[0] -= qty
+            pos[1] -= closed_cost
+            if pos[0] <= 0:
+                positions.pop(base, None)
+        holdings_value = sum(q * p for q, _, p, _ in positions.values())
+        checkpoints.append((user_id, r["id"], cash, holdings_value, round(cash + holdings_value, 2), r["created_at"]))
+        last_trade_id = r["id"]
+    if checkpoints:
+        cur.executemany(
+            "INSERT INTO demo_equity_checkpoints (user_id, trade_id, cash_usdt, holdings_value_usdt, equity_usdt, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
+            checkpoints,
+        )
+    for asset, (qty, cost, price, avg_entry) in positions.items():
+        cur.execute(
+            "UPDATE demo_holdings SET cost_basis_usdt = %s, last_price_usdt = %s, avg_entry_price = %s WHERE user_id = %s AND asset = %s",
+            (cost, price, avg_entry, user_id, asset),
+        )
+    cur.execute(
+        """
+        INSERT INTO demo_spot_state (user_id, cash_usdt, total_trades, buy_count, sell_count, total_commission, realized_pnl, last_trade_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (user_id, cash, len(checkpoints), counts["BUY"], counts["SELL"], commission, realized, last_trade_id),
+    )
+    cur.execute("SELECT * FROM demo_spot_state WHERE user_id = %s", (user_id,))
+    return cur.fetchone()
+
+
+def _record_spot_fill(
+    cur,
+    user_id: int,
+    trade_id: int,
+    side: str,
+    usdt_amount: float,
+    commission_usdt: float,
+    realized_pnl: float = 0.0,
+) -> None:
+    """Advance the spot ledger and append an equity checkpoint (same transaction as the fill).
+
+    demo_holdings must already reflect the fill; holdings are marked at their last fill price.
+    """
+    cur.execute(
+        """
+        UPDATE demo_spot_state
+        SET cash_usdt = cash_usdt + %s, total_trades = total_trades + 1,
+            buy_count = buy_count + %s, sell_count = sell_count + %s,
+            total_commission = total_commission + %s, realized_pnl = realized_pnl + %s, last_trade_id = %s
+        WHERE user_id = %s
+        """,
+        (usdt_amount, int(side == "BUY"), int(side == "SELL"), commission_usdt, realized_pnl, trade_id, user_id),
+    )
+    cur.execute(
+        """
+        INSERT INTO demo_equity_checkpoints (user_id, trade_id, cash_usdt, holdings_value_usdt, equity_usdt)
+        SELECT s.user_id, %s, s.cash_usdt, COALESCE(h.value, 0), ROUND(s.cash_usdt + COALESCE(h.value, 0), 2)
+        FROM demo_spot_state s
+        LEFT JOIN (
+            SELECT user_id, SUM(quantity * last_price_usdt) AS value
+            FROM demo_holdings WHERE user_id = %s AND quantity > 0 GROUP BY user_id
+        ) h ON h.user_id = s.user_id
+        WHERE s.user_id = %s
+        """,
+        (trade_id, user_id, user_id),
+    )
+
+
 @router.get("/performance")
-def get_demo_performance(user_id: int = Depends(get_current_user_id)):
-    """Agent demo stats: total trades, PnL (realized + unrealized), recent trades, equity curve."""
+def get_demo_performance(
+    user_id: int = Depends(get_current_user_id),
+    curve_limit: int = Query(500, ge=1, le=5000),
+    curve_before: int | None = Query(None, ge=1),
+    curve_points: int | None = Query(None, ge=2, le=5000),
+):
+    """Agent demo stats: total trades, PnL (realized + unrealized), recent trades, equity curve.
+
+    Reads the incrementally maintained spot ledger, so cost is O(positions + curve window).
+    The curve holds the latest `curve_limit` checkpoints older than `curve_before` (checkpoint id);
+    `equity_curve_next_before` pages further back. `curve_points` downsamples the window.
+    """
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute("SELECT demo_balance FROM users WHERE id = %s", (user_id,))
+            cur.execute(
+                """
+                SELECT u.demo_balance, s.user_id AS has_state FROM users u
+                LEFT JOIN demo_spot_state s ON s.user_id = u.id
+                WHERE u.id = %s
+                """,
+                (user_id,),
+            )
             row = cur.fetchone()
             if not row:
                 raise HTTPException(status_code=404, detail="User not found")
-            # Note: demo_balance is shared by spot + futures.
-            # To isolate spot performance from futures, we reconstruct
-            # spot cash flow from spot trade history below.
+            # Note: demo_balance is shared by spot + futures; spot performance uses the spot ledger cash.
             wallet_balance_actual = float(row["demo_balance"])
-            cur.execute("SELECT asset, quantity FROM demo_holdings WHERE user_id = %s AND quantity > 0", (user_id,))
-            holdings = [{"asset": r["asset"], "quantity": float(r["quantity"])} for r in cur.fetchall()]
+            if row["has_state"] is None:
+                # End the snapshot taken above, so the replay starts with the users row lock as
+                # _execute_spot_fill does and sees a ledger row a concurrent request just built.
+                conn.rollback()
+                cur.execute("SELECT id FROM users WHERE id = %s FOR UPDATE", (user_id,))
+                _ensure_spot_state(cur, user_id)
+                conn.commit()
+            cur.execute("SELECT * FROM demo_spot_state WHERE user_id = %s", (user_id,))
+            state = cur.fetchone()
             cur.execute(
-                """
-                SELECT
-                    COUNT(*) AS total_trades,
-                    SUM(CASE WHEN side = 'BUY' THEN 1 ELSE 0 END) AS buy_count,
-                    SUM(CASE WHEN side = 'SELL' THEN 1 ELSE 0 END) AS sell_count,
-                    COALESCE(SUM(commission_usdt), 0) AS total_commission
-                FROM demo_trades WHERE user_id = %s
-                """,
+                "SELECT asset, quantity, cost_basis_usdt FROM demo_holdings WHERE user_id = %s AND quantity > 0",
                 (user_id,),
             )
-            stats = cur.fetchone()
+            holdings = [
+                {"asset": r["asset"], "quantity": float(r["quantity"]), "cost_basis_usdt": float(r["cost_basis_usdt"])}
+                for r in cur.fetchall()
+            ]
             cur.execute(
                 """
                 SELECT side, symbol, quantity, price_usdt, usdt_amount, commission_usdt, source, created_at
-                FROM demo_trades WHERE user_id = %s ORDER BY created_at ASC
+                FROM demo_trades WHERE user_id = %s ORDER BY created_at DESC LIMIT 30
                 """,
                 (user_id,),
             )
-            rows_asc = cur.fetchall()
+            rows = cur.fetchall()
             cur.execute(
                 """
-                SELECT side, symbol, quantity, price_usdt, usdt_amount, commission_usdt, source, created_at
-                FROM demo_trades WHERE user_id = %s ORDER BY created_at DESC LIMIT 30
+                SELECT id, equity_usdt, created_at FROM demo_equity_checkpoints
+                WHERE user_id = %s AND (%s IS NULL OR id < %s)
+                ORDER BY id DESC LIMIT %s
                 """,
-                (user_id,),
+                (user_id, curve_before, curve_before, curve_limit + 1),
             )
-            rows = cur.fetchall()
-    total_trades = int(stats["total_trades"] or 0)
-    buy_count = int(stats["buy_count"] or 0)
-    sell_count = int(stats["sell_count"] or 0)
-    total_commission = float(stats.get("total_commission") or 0)
-
-    # Spot cash balance (derived only from demo_trades flow).
-    # usdt_amount is negative spend on BUY and net positive credit on SELL (after commission).
-    running_balance = INITIAL_DEMO_BALANCE
-    running_holdings: dict[str, float] = {}
-    equity_curve: list[dict] = [{"t": "Start", "equity": INITIAL_DEMO_BALANCE}]
-    price_cache: dict[str, float] = {}
-    for r in rows_asc:
-        side = r["side"]
-        sym = r["symbol"]
-        base = _base_asset(sym)
-        qty = float(r["quantity"])
-        usdt_amt = float(r["usdt_amount"])
-        ts = r["created_at"]
-        t_str = ts.isoformat() if hasattr(ts, "isoformat") else str(ts)
-        if side == "BUY":
-            running_balance += usdt_amt
-            running_holdings[base] = running_holdings.get(base, 0) + qty
-        else:
-            running_balance += usdt_amt
-            running_holdings[base] = running_holdings.get(base, 0) - qty
-            if running_holdings.get(base, 0) <= 0:
-                running_holdings.pop(base, None)
-        try:
-            hv = running_balance
-            for a, q in running_holdings.items():
-                if a == "USDT":
-                    hv += q
-                else:
-                    key = a + "USDT"
-                    if key not in price_cache:
-                        price_cache[key] = _get_price(key)
-                    hv += q * price_cache[key]
-            equity_curve.append({"t": t_str, "equity": round(hv, 2)})
-        except Exception:
-            equity_curve.append({"t": t_str, "equity": round(running_balance, 2)})
-    current_balance = running_balance
+            checkpoints = cur.fetchall()
+    has_older = len(checkpoints) > curve_limit
+    checkpoints = checkpoints[:curve_limit][::-1]
+    if curve_points and len(checkpoints) > curve_points:
+        step = len(checkpoints) / (curve_points - 1)
+        picked = [checkpoints[int(i * step)] for i in range(curve_points - 1)]
+        checkpoints = picked + [checkpoints[-1]]
+
+    current_balance = float(state["cash_usdt"])
     holdings_value = _holdings_value(holdings)
     total_equity = current_balance + holdings_value
     equity_change = total_equity - INITIAL_DEMO_BALANCE
-    equity_curve.append({"t": "Now", "equity": round(total_equity, 2)})
+    equity_curve: list[dict] = [] if has_older else [{"t": "Start", "equity": INITIAL_DEMO_BALANCE}]
+    equity_curve += [{"t": _iso(c["created_at"]), "equity": float(c["equity_usdt"])} for c in checkpoints]
+    if curve_before is None:
+        equity_curve.append({"t": "Now", "equity": round(total_equity, 2)})
     last_trades = [
         {
             "side": r["side"],
@@ -212,22 +327,26 @@ def get_demo_performance(user_id: int = Depends(get_current_user_id)):
             "usdt_amount": float(r["usdt_amount"]),
             "commission_usdt": float(r.get("commission_usdt") or 0),
             "source": r["source"],
-            "created_at": r["created_at"].isoformat() if hasattr(r["created_at"], "isoformat") else str(r["created_at"]),
+            "created_at": _iso(r["created_at"]),
         }
         for r in rows
     ]
+    cost_basis = sum(h["cost_basis_usdt"] for h in holdings)
     return {
-        "total_trades": total_trades,
-        "buy_count": buy_count,
-        "sell_count": sell_count,
-        "total_commission": total_commission,
+        "total_trades": int(state["total_trades"]),
+        "buy_count": int(state["buy_count"]),
+        "sell_count": int(state["sell_count"]),
+        "total_commission": float(state["total_commission"]),
         "initial_balance": INITIAL_DEMO_BALANCE,
         "current_balance": round(current_balance, 2),
         "wallet_balance_actual": round(wallet_balance_actual, 2),
         "total_equity": round(total_equity, 2),
         "equity_change": round(equity_change, 2),
+        "realized_pnl": round(float(state["realized_pnl"]), 2),
+        "unrealized_pnl": round(holdings_value - cost_basis, 2),
         "last_trades": last_trades,
         "equity_curve": equity_curve,
+        "equity_curve_next_before": checkpoints[0]["id"] if has_older and checkpoints else None,
     }
 
 
@@ -238,6 +357,90 @@ class DemoOrderRequest(BaseModel):
     quantity: float | None = None  # Coin amount for SELL; sell all if omitted
 
 
+def _execute_spot_fill(
+    cur,
+    user_id: int,
+    side: str,
+    symbol: str,
+    price: float,
+    quote_order_qty: float | None = None,
+    quantity: float | None = None,
+    source: str = "agent",
+) -> dict:
+    """Apply one spot fill at `price` inside the caller's transaction (no commit).
+
+    Locks the user row, validates balance / holding (HTTPException 400 otherwise) and returns the
+    order_fill event payload plus "message" and "trade_id".
+    """
+    base = _base_asset(symbol)
+    cur.execute("SELECT demo_balance FROM users WHERE id = %s FOR UPDATE", (user_id,))
+    row = cur.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="User not found")
+    demo_balance = Decimal(str(row["demo_balance"]))
+    _ensure_spot_state(cur, user_id)
+    if side == "BUY":
+        usdt_spend = Decimal(str(quote_order_qty or DEFAULT_BUY_USDT))
+        if usdt_spend <= 0:
+            raise HTTPException(status_code=400, detail="quote_order_qty must be > 0")
+        if demo_balance < usdt_spend:
+            raise HTTPException(status_code=400, detail=f"Insufficient demo balance. Current: {float(demo_balance):.2f} USDT")
+        commission_usdt = float(usdt_spend) * COMMISSION_RATE
+        qty = float(usdt_spend) * (1 - COMMISSION_RATE) / price
+        cur.execute("UPDATE users SET demo_balance = demo_balance - %s WHERE id = %s", (float(usdt_spend), user_id))
+        # avg_entry_price is assigned before quantity: MySQL applies the SET list left to right.
+        cur.execute(
+            """
+            INSERT INTO demo_holdings (user_id, asset, quantity, cost_basis_usdt, last_price_usdt, avg_entry_price) VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                avg_entry_price = (quantity * avg_entry_price + VALUES(quantity) * VALUES(avg_entry_price)) / (quantity + VALUES(quantity)),
+                quantity = quantity + VALUES(quantity), cost_basis_usdt = cost_basis_usdt + VALUES(cost_basis_usdt),
+                last_price_usdt = VALUES(last_price_usdt)
+            """,
+            (user_id, base, qty, float(usdt_spend), price, price),
+        )
+        cur.execute(
+            "INSERT INTO demo_trades (user_id, side, symbol, base_asset, quantity, price_usdt, usdt_amount, commission_usdt, source) VALUES (%s, 'BUY', %s, %s, %s, %s, %s, %s, %s)",
+            (user_id, symbol, base, qty, price, -float(usdt_spend), commission_usdt, source),
+        )
+        trade_id = cur.lastrowid
+        _record_spot_fill(cur, user_id, trade_id, "BUY", -float(usdt_spend), commission_usdt)
+        return {
+            "market": "spot", "side": "BUY", "symbol": symbol, "quantity": qty, "price": price, "usdt_amount": -float(usdt_spend),
+            "message": f"Demo buy: {qty:.8f} {base} (~{float(usdt_spend):.2f} USDT)", "trade_id": trade_id,
+        }
+    if side == "SELL":
+        cur.execute("SELECT quantity, cost_basis_usdt FROM demo_holdings WHERE user_id = %s AND asset = %s FOR UPDATE", (user_id, base))
+        hold = cur.fetchone()
+        if not hold or float(hold["quantity"]) <= 0:
+            raise HTTPException(status_code=400, detail=f"You do not have an open {base} position")
+        sell_qty = float(quantity) if quantity and quantity > 0 else float(hold["quantity"])
+        if sell_qty > float(hold["quantity"]):
+            sell_qty = float(hold["quantity"])
+        gross_usdt = sell_qty * price
+        commission_usdt = gross_usdt * COMMISSION_RATE
+        usdt_credit = gross_usdt - commission_usdt
+        closed_cost = float(hold["cost_basis_usdt"]) * sell_qty / float(hold["quantity"])
+        cur.execute("UPDATE users SET demo_balance = demo_balance + %s WHERE id = %s", (usdt_credit, user_id))
+        cur.execute(
+            "UPDATE demo_holdings SET quantity = quantity - %s, cost_basis_usdt = GREATEST(cost_basis_usdt - %s, 0), last_price_usdt = %s WHERE user_id = %s AND asset = %s",
+            (sell_qty, closed_cost, price, user_id, base),
+        )
+        cur.execute("DELETE FROM demo_holdings WHERE user_id = %s AND quantity <= 0", (user_id,))
+        cur.execute(
+            "INSERT INTO demo_trades (user_id, side, symbol, base_asset, quantity, price_usdt, usdt_amount, commission_usdt, source) VALUES (%s, 'SELL', %s, %s, %s, %s, %s, %s, %s)",
+            (user_id, symbol, base, sell_qty, price, usdt_credit, commission_usdt, source),
+        )
+        trade_id = cur.lastrowid
+        _record_spot_fill(cur, user_id, trade_id, "SELL", usdt_credit, commission_usdt, usdt_credit - closed_cost)
+        return {
+            "market": "spot", "side": "SELL", "symbol": symbol, "quantity": sell_qty, "price": price,
+            "usdt_amount": usdt_credit, "realized_pnl": round(usdt_credit - closed_cost, 2),
+            "message": f"Demo sell: {sell_qty:.8f} {base} (~{usdt_credit:.2f} USDT)", "trade_id": trade_id,
+        }
+    raise HTTPException(status_code=400, detail="Invalid side")
+
+
 def place_demo_order_impl(
     user_id: int,
     side: Literal["BUY", "SELL"],
@@ -247,61 +450,358 @@ def place_demo_order_impl(
 ) -> dict:
     """Demo spot buy/sell (called from agent background with user_id)."""
     symbol = symbol.upper()
-    base = _base_asset(symbol)
     price = _get_price(symbol)
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute("SELECT demo_balance FROM users WHERE id = %s FOR UPDATE", (user_id,))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="User not found")
-            demo_balance = Decimal(str(row["demo_balance"]))
-            if side == "BUY":
-                usdt_spend = Decimal(str(quote_order_qty or DEFAULT_BUY_USDT))
-                if usdt_spend <= 0:
-                    raise HTTPException(status_code=400, detail="quote_order_qty must be > 0")
-                if demo_balance < usdt_spend:
-                    raise HTTPException(status_code=400, detail=f"Insufficient demo balance. Current: {float(demo_balance):.2f} USDT")
-                commission_usdt = float(usdt_spend) * COMMISSION_RATE
-                qty = float(usdt_spend) * (1 - COMMISSION_RATE) / price
-                cur.execute("UPDATE users SET demo_balance = demo_balance - %s WHERE id = %s", (float(usdt_spend), user_id))
+            fill = _execute_spot_fill(cur, user_id, side, symbol, price, quote_order_qty, quantity)
+            conn.commit()
+    message = fill.pop("message")
+    fill.pop("trade_id")
+    publish_event(user_id, "order_fill", fill)
+    return {"ok": True, "message": message}
+
+
+@router.post("/order")
+def place_demo_order(body: DemoOrderRequest, user_id: int = Depends(get_current_user_id)):
+    """Demo buy/sell. BUY spends quote_order_qty USDT. SELL uses quantity or closes all."""
+    return place_demo_order_impl(user_id, body.side, body.symbol, body.quote_order_qty, body.quantity)
+
+
+# --- Demo spot limit / stop orders ---
+
+class DemoSpotOrderRequest(BaseModel):
+    side: Literal["BUY", "SELL"]
+    symbol: str  # BTCUSDT
+    order_type: Literal["LIMIT", "STOP"] = "LIMIT"
+    price: float  # Limit price, or stop trigger price
+    quote_order_qty: float | None = None  # USDT amount for BUY
+    quantity: float | None = None  # Coin amount for SELL; sell all held at fill time if omitted
+
+
+_SPOT_ORDER_COLUMNS = (
+    "id, user_id, symbol, side, order_type, price, quote_order_qty, quantity, status, source, "
+    "trade_id, fill_price, filled_quantity, reject_reason, created_at, closed_at"
+)
+
+
+def _spot_order_out(r: dict) -> dict:
+    def num(v):
+        return float(v) if v is not None else None
+    return {
+        "id": r["id"], "symbol": r["symbol"], "side": r["side"], "order_type": r["order_type"], "price": float(r["price"]),
+        "quote_order_qty": num(r["quote_order_qty"]), "quantity": num(r["quantity"]), "status": r["status"],
+        "source": r["source"], "trade_id": r["trade_id"], "fill_price": num(r["fill_price"]),
+        "filled_quantity": num(r["filled_quantity"]), "reject_reason": r["reject_reason"],
+        "created_at": _iso(r["created_at"]) if r["created_at"] else None,
+        "closed_at": _iso(r["closed_at"]) if r["closed_at"] else None,
+    }
+
+
+def _index_spot_order(order: dict) -> None:
+    book = get_order_book()
+    if book is not None:
+        book.add(order)
+
+
+def _unindex_spot_order(order_id: int) -> None:
+    book = get_order_book()
+    if book is not None:
+        book.cancel(order_id)
+
+
+def place_demo_resting_order_impl(
+    user_id: int,
+    side: Literal["BUY", "SELL"],
+    symbol: str,
+    order_type: Literal["LIMIT", "STOP"],
+    price: float,
+    quote_order_qty: float | None = None,
+    quantity: float | None = None,
+    source: str = "user",
+    replace: bool = False,
+) -> dict:
+    """Rest a spot limit/stop order; it fills at `price` when the market crosses it.
+
+    Funds are checked at fill time (an order that cannot be covered then is rejected). With
+    `replace`, open orders of the same source / symbol / side are cancelled in the same transaction.
+    """
+    symbol = symbol.upper()
+    if price <= 0:
+        raise HTTPException(status_code=400, detail="price must be > 0")
+    if side == "BUY":
+        quote_order_qty = float(quote_order_qty or DEFAULT_BUY_USDT)
+        if quote_order_qty <= 0:
+            raise HTTPException(status_code=400, detail="quote_order_qty must be > 0")
+        quantity = None
+    else:
+        quote_order_qty = None
+        quantity = quantity if quantity and quantity > 0 else None
+    current = _get_price(symbol)
+    # A level already crossed would fill at once: that is a market order.
+    if order_direction(side, order_type) == "below" and price >= current:
+        raise HTTPException(status_code=400, detail=f"{side} {order_type} price must be below {current:.8g}")
+    if order_direction(side, order_type) == "above" and price <= current:
+        raise HTTPException(status_code=400, detail=f"{side} {order_type} price must be above {current:.8g}")
+    replaced = []
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            if replace:
                 cur.execute(
-                    "INSERT INTO demo_holdings (user_id, asset, quantity) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)",
-                    (user_id, base, qty),
+                    "SELECT id FROM demo_spot_orders WHERE user_id = %s AND status = 'open' AND symbol = %s AND side = %s AND source = %s FOR UPDATE",
+                    (user_id, symbol, side, source),
+                )
+                replaced = [r["id"] for r in cur.fetchall()]
+                if replaced:
+                    cur.execute(
+                        f"UPDATE demo_spot_orders SET status = 'cancelled', closed_at = %s WHERE id IN ({', '.join(['%s'] * len(replaced))})",
+                        (datetime.utcnow(), *replaced),
+                    )
+            cur.execute(
+                "INSERT INTO demo_spot_orders (user_id, symbol, side, order_type, price, quote_order_qty, quantity, source) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                (user_id, symbol, side, order_type, price, quote_order_qty, quantity, source),
+            )
+            order_id = cur.lastrowid
+            conn.commit()
+    for oid in replaced:
+        _unindex_spot_order(oid)
+    _index_spot_order({"id": order_id, "symbol": symbol, "side": side, "order_type": order_type, "price": price})
+    publish_event(user_id, "order_update", {
+        "market": "spot", "order_id": order_id, "status": "open", "side": side, "symbol": symbol,
+        "order_type": order_type, "price": price, "replaced": replaced,
+    })
+    return {
+        "ok": True, "order_id": order_id, "replaced": replaced,
+        "message": f"Demo {order_type.lower()} {side.lower()} placed: {symbol} @ {price:.8g}",
+    }
+
+
+def place_demo_order_at_level(
+    user_id: int,
+    side: Literal["BUY", "SELL"],
+    symbol: str,
+    level: float | None,
+    quote_order_qty: float | None = None,
+) -> dict:
+    """Agent entry: rest a LIMIT at `level` when it beats the market (BUY below / SELL above), else trade now.
+
+    The agent's previous open orders for the same symbol and side are replaced.
+    """
+    if level is not None and level > 0:
+        current = _get_price(symbol)
+        if (side == "BUY" and level < current) or (side == "SELL" and level > current):
+            return place_demo_resting_order_impl(
+                user_id, side, symbol, LIMIT, level, quote_order_qty=quote_order_qty, source="agent", replace=True,
+            )
+    return place_demo_order_impl(user_id, side, symbol, quote_order_qty=quote_order_qty)
+
+
+def load_open_spot_orders() -> list[dict]:
+    """Every open resting spot order with the columns the order book indexes (one query)."""
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute("SELECT id, symbol, side, order_type, price FROM demo_spot_orders WHERE status = 'open'")
+            return cur.fetchall()
+
+
+def fill_resting_orders(order_ids: list[int]) -> dict[int, str]:
+    """Order book callback: settle a batch of crossed orders in one transaction.
+
+    Rows still open are locked, then filled at their own price user by user (users in id order,
+    so concurrent batches from other processes cannot deadlock). An order whose balance or holding
+    no longer covers it is rolled back to its savepoint and marked rejected.
+    """
+    if not order_ids:
+        return {}
+    results: dict[int, str] = {}
+    events: list[tuple[int, str, dict]] = []
+    now = datetime.utcnow()
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute(
+                f"SELECT {_SPOT_ORDER_COLUMNS} FROM demo_spot_orders WHERE id IN ({', '.join(['%s'] * len(order_ids))}) AND status = 'open' ORDER BY id FOR UPDATE",
+                tuple(order_ids),
+            )
+            orders = sorted(cur.fetchall(), key=lambda o: (o["user_id"], o["id"]))
+            filled, rejected = [], []
+            for o in orders:
+                cur.execute("SAVEPOINT spot_order_fill")
+                try:
+                    fill = _execute_spot_fill(
+                        cur, o["user_id"], o["side"], o["symbol"], float(o["price"]),
+                        quote_order_qty=float(o["quote_order_qty"]) if o["quote_order_qty"] is not None else None,
+                        quantity=float(o["quantity"]) if o["quantity"] is not None else None,
+                        source=o["order_type"].lower(),
+                    )
+                except HTTPException as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT spot_order_fill")
+                    reason = str(e.detail)[:255]
+                    rejected.append((reason, now, o["id"]))
+                    results[o["id"]] = "rejected"
+                    events.append((o["user_id"], "order_update", {
+                        "market": "spot", "order_id": o["id"], "status": "rejected", "symbol": o["symbol"], "reason": reason,
+                    }))
+                    continue
+                filled.append((fill["trade_id"], fill["price"], fill["quantity"], now, o["id"]))
+                results[o["id"]] = "filled"
+                fill.pop("message")
+                fill.pop("trade_id")
+                fill.update(order_id=o["id"], order_type=o["order_type"])
+                events.append((o["user_id"], "order_fill", fill))
+            if filled:
+                cur.executemany(
+                    "UPDATE demo_spot_orders SET status = 'filled', trade_id = %s, fill_price = %s, filled_quantity = %s, closed_at = %s WHERE id = %s",
+                    filled,
+                )
+            if rejected:
+                cur.executemany(
+                    "UPDATE demo_spot_orders SET status = 'rejected', reject_reason = %s, closed_at = %s WHERE id = %s",
+                    rejected,
                 )
+            conn.commit()
+    for user_id, event_type, data in events:
+        publish_event(user_id, event_type, data)
+    return results
+
+
+@router.post("/orders")
+def place_demo_spot_order(body: DemoSpotOrderRequest, user_id: int = Depends(get_current_user_id)):
+    """Rest a demo spot limit/stop order. BUY LIMIT / SELL STOP below the market, BUY STOP / SELL LIMIT above."""
+    return place_demo_resting_order_impl(
+        user_id, body.side, body.symbol, body.order_type, body.price, body.quote_order_qty, body.quantity,
+    )
+
+
+@router.get("/orders")
+def get_demo_spot_orders(
+    user_id: int = Depends(get_current_user_id),
+    status: Literal["open", "filled", "cancelled", "rejected", "all"] = Query("open"),
+    limit: int = Query(100, ge=1, le=500),
+):
+    """Resting spot orders, newest first."""
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            if status == "all":
                 cur.execute(
-                    "INSERT INTO demo_trades (user_id, side, symbol, base_asset, quantity, price_usdt, usdt_amount, commission_usdt, source) VALUES (%s, 'BUY', %s, %s, %s, %s, %s, %s, 'agent')",
-                    (user_id, symbol, base, qty, price, -float(usdt_spend), commission_usdt),
+                    f"SELECT {_SPOT_ORDER_COLUMNS} FROM demo_spot_orders WHERE user_id = %s ORDER BY id DESC LIMIT %s",
+                    (user_id, limit),
                 )
-                conn.commit()
-                return {"ok": True, "message": f"Demo buy: {qty:.8f} {base} (~{float(usdt_spend):.2f} USDT)"}
-            if side == "SELL":
-                cur.execute("SELECT quantity FROM demo_holdings WHERE user_id = %s AND asset = %s FOR UPDATE", (user_id, base))
-                hold = cur.fetchone()
-                if not hold or float(hold["quantity"]) <= 0:
-                    raise HTTPException(status_code=400, detail=f"You do not have an open {base} position")
-                sell_qty = float(quantity) if quantity and quantity > 0 else float(hold["quantity"])
-                if sell_qty > float(hold["quantity"]):
-                    sell_qty = float(hold["quantity"])
-                gross_usdt = sell_qty * price
-                commission_usdt = gross_usdt * COMMISSION_RATE
-                usdt_credit = gross_usdt - commission_usdt
-                cur.execute("UPDATE users SET demo_balance = demo_balance + %s WHERE id = %s", (usdt_credit, user_id))
-                cur.execute("UPDATE demo_holdings SET quantity = quantity - %s WHERE user_id = %s AND asset = %s", (sell_qty, user_id, base))
-                cur.execute("DELETE FROM demo_holdings WHERE user_id = %s AND quantity <= 0", (user_id,))
+            else:
                 cur.execute(
-                    "INSERT INTO demo_trades (user_id, side, symbol, base_asset, quantity, price_usdt, usdt_amount, commission_usdt, source) VALUES (%s, 'SELL', %s, %s, %s, %s, %s, %s, 'agent')",
-                    (user_id, symbol, base, sell_qty, price, usdt_credit, commission_usdt),
+                    f"SELECT {_SPOT_ORDER_COLUMNS} FROM demo_spot_orders WHERE user_id = %s AND status = %s ORDER BY id DESC LIMIT %s",
+                    (user_id, status, limit),
                 )
-                conn.commit()
-                return {"ok": True, "message": f"Demo sell: {sell_qty:.8f} {base} (~{usdt_credit:.2f} USDT)"}
-    raise HTTPException(status_code=400, detail="Invalid side")
+            rows = cur.fetchall()
+    return {"orders": [_spot_order_out(r) for r in rows]}
 
 
-@router.post("/order")
-def place_demo_order(body: DemoOrderRequest, user_id: int = Depends(get_current_user_id)):
-    """Demo buy/sell. BUY spends quote_order_qty USDT. SELL uses quantity or closes all."""
-    return place_demo_order_impl(user_id, body.side, body.symbol, body.quote_order_qty, body.quantity)
+@router.delete("/orders/{order_id}")
+def cancel_demo_spot_order(order_id: int, user_id: int = Depends(get_current_user_id)):
+    """Cancel an open resting spot order."""
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE demo_spot_orders SET status = 'cancelled', closed_at = %s WHERE id = %s AND user_id = %s AND status = 'open'",
+                (datetime.utcnow(), order_id, user_id),
+            )
+            cancelled = cur.rowcount
+            conn.commit()
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="Open order not found or does not belong to you")
+    _unindex_spot_order(order_id)
+    publish_event(user_id, "order_update", {"market": "spot", "order_id": order_id, "status": "cancelled"})
+    return {"ok": True, "order_id": order_id}
+
+
+def _settle_futures_position(cur, user_id: int, pos: dict, exit_price: float, reason: str) -> tuple[float, float]:
+    """Close one locked position row at exit_price: credit margin + PnL - commission, record the trade.
+
+    Liquidation forfeits the whole margin (PnL = -margin, no commission, nothing credited).
+    Returns (pnl, commission).
+    """
+    side = pos["side"]
+    qty = float(pos["quantity"])
+    entry_price = float(pos["entry_price"])
+    margin_used = float(pos["margin_used"])
+    if reason == "liquidation":
+        pnl, commission = -margin_used, 0.0
+    else:
+        pnl = (exit_price - entry_price) * qty if side == "LONG" else (entry_price - exit_price) * qty
+        commission = qty * exit_price * FUTURES_COMMISSION_RATE
+    settlement = margin_used + pnl - commission
+    cur.execute("DELETE FROM demo_futures_positions WHERE id = %s AND user_id = %s", (pos["id"], user_id))
+    if settlement:
+        cur.execute("UPDATE users SET demo_balance = demo_balance + %s WHERE id = %s", (float(settlement), user_id))
+    cur.execute(
+        """
+        INSERT INTO demo_futures_trades (user_id, symbol, side, quantity, entry_price, exit_price, pnl_usdt, commission_usdt, close_reason)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (user_id, pos["symbol"], side, qty, entry_price, exit_price, pnl, commission, reason),
+    )
+    return pnl, commission
+
+
+def _exit_levels(side: str, price: float, stop_loss_price: float | None, take_profit_price: float | None) -> tuple[float | None, float | None]:
+    """Validate stop/target against the entry side: LONG needs stop < price < target, SHORT the reverse."""
+    long = side == "LONG"
+    if stop_loss_price is not None and stop_loss_price > 0 and (stop_loss_price >= price if long else stop_loss_price <= price):
+        raise HTTPException(status_code=400, detail=f"stop_loss_price must be {'below' if long else 'above'} {price:.8g}")
+    if take_profit_price is not None and take_profit_price > 0 and (take_profit_price <= price if long else take_profit_price >= price):
+        raise HTTPException(status_code=400, detail=f"take_profit_price must be {'above' if long else 'below'} {price:.8g}")
+    return (stop_loss_price or None, take_profit_price or None)
+
+
+def _track_trigger(pos: dict) -> None:
+    engine = get_trigger_engine()
+    if engine is not None:
+        engine.track(pos)
+
+
+def _untrack_trigger(position_id: int) -> None:
+    engine = get_trigger_engine()
+    if engine is not None:
+        engine.untrack(position_id)
+
+
+_TRIGGER_COLUMNS = "id, user_id, symbol, side, quantity, entry_price, margin_used, stop_loss_price, take_profit_price"
+
+
+def load_trigger_positions() -> list[dict]:
+    """Every open futures position with the columns the trigger engine indexes (one query)."""
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute(f"SELECT {_TRIGGER_COLUMNS} FROM demo_futures_positions")
+            return cur.fetchall()
+
+
+def close_triggered_position(position_id: int, kind: str, price: float) -> dict | bool | None:
+    """Trigger engine callback: re-check the crossing under row lock and close through the normal path.
+
+    Returns True when closed, None when the position is gone, or the fresh row when its levels
+    no longer cross at `price` (e.g. the user moved the stop).
+    """
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute(f"SELECT {_TRIGGER_COLUMNS} FROM demo_futures_positions WHERE id = %s FOR UPDATE", (position_id,))
+            pos = cur.fetchone()
+            if not pos:
+                conn.rollback()
+                return None
+            still = [
+                (k, level) for direction, k, level in position_triggers(pos)
+                if k == kind and (price <= level if direction == "below" else price >= level)
+            ]
+            if not still:
+                conn.rollback()
+                return pos
+            user_id = pos["user_id"]
+            pnl, commission = _settle_futures_position(cur, user_id, pos, price, kind)
+            conn.commit()
+    publish_event(user_id, "order_fill", {
+        "market": "futures", "close": True, "reason": kind, "side": pos["side"], "symbol": pos["symbol"],
+        "quantity": float(pos["quantity"]), "price": price, "pnl_usdt": round(pnl, 2),
+    })
+    return True
 
 
 # --- Demo futures ---
@@ -311,70 +811,73 @@ class DemoFuturesOrderRequest(BaseModel):
     symbol: str  # BTCUSDT
     margin_usdt: float = 100.0  # Margin allocated to position (USDT)
     leverage: int = 10
+    stop_loss_price: float | None = None  # Close when price crosses against the position
+    take_profit_price: float | None = None  # Close when price reaches the target
 
 
 class DemoFuturesCloseRequest(BaseModel):
     position_id: int  # Position id to close (returned by futures-account)
 
 
+class DemoFuturesLevelsRequest(BaseModel):
+    position_id: int
+    stop_loss_price: float | None = None  # None or 0 clears the level
+    take_profit_price: float | None = None
+
+
+def _mark_futures_positions(positions_raw: list[dict]) -> tuple[list[dict], float, float]:
+    """Mark open futures positions with one price lookup and vectorized PnL.
+
+    Returns (positions payload, total unrealized PnL, total margin used).
+    """
+    marked = mark_positions(positions_raw, _get_prices(r["symbol"] for r in positions_raw))
+    positions = []
+    for i, r in enumerate(positions_raw):
+        ratio = float(marked["margin_ratio"][i])
+        positions.append({
+            "id": r["id"],
+            "symbol": r["symbol"],
+            "side": r["side"],
+            "quantity": float(r["quantity"]),
+            "entry_price": float(r["entry_price"]),
+            "leverage": r["leverage"],
+            "margin_used": float(r["margin_used"]),
+            "current_price": float(marked["current_price"][i]),
+            "unrealized_pnl": round(float(marked["unrealized_pnl"][i]), 2) + 0.0,  # no "-0.0"
+            "margin_ratio": round(ratio, 4) if math.isfinite(ratio) else None,
+            "liquidation_price": round(float(marked["liquidation_price"][i]), 8),
+            "stop_loss_price": float(r["stop_loss_price"]) if r.get("stop_loss_price") is not None else None,
+            "take_profit_price": float(r["take_profit_price"]) if r.get("take_profit_price") is not None else None,
+            "created_at": _iso(r["created_at"]),
+        })
+    return positions, float(marked["unrealized_pnl"].sum()), float(marked["margin_used"].sum())
+
+
 @router.get("/futures-account")
-def get_demo_futures_account(user_id: int = Depends(get_current_user_id)):
+def get_demo_futures_account(user: dict = Depends(get_current_user)):
     """Demo futures account: available margin and open positions with live unrealized PnL."""
+    user_id = user["id"]
+    margin_available = user["demo_balance"]
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute("SELECT demo_balance FROM users WHERE id = %s", (user_id,))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="User not found")
-            margin_available = float(row["demo_balance"])
             cur.execute(
-                "SELECT id, symbol, side, quantity, entry_price, leverage, margin_used, created_at FROM demo_futures_positions WHERE user_id = %s ORDER BY created_at ASC",
+                "SELECT id, symbol, side, quantity, entry_price, leverage, margin_used, stop_loss_price, take_profit_price, created_at FROM demo_futures_positions WHERE user_id = %s ORDER BY created_at ASC",
                 (user_id,),
             )
             positions_raw = cur.fetchall()
-    positions = []
-    total_unrealized = 0.0
-    for r in positions_raw:
-        symbol = r["symbol"]
-        side = r["side"]
-        qty = float(r["quantity"])
-        entry = float(r["entry_price"])
-        try:
-            current_price = _get_price(symbol)
-        except Exception:
-            current_price = entry
-        if side == "LONG":
-            unrealized_pnl = (current_price - entry) * qty
-        else:
-            unrealized_pnl = (entry - current_price) * qty
-        total_unrealized += unrealized_pnl
-        positions.append({
-            "id": r["id"],
-            "symbol": symbol,
-            "side": side,
-            "quantity": qty,
-            "entry_price": entry,
-            "leverage": r["leverage"],
-            "margin_used": float(r["margin_used"]),
-            "current_price": current_price,
-            "unrealized_pnl": round(unrealized_pnl, 2),
-            "created_at": r["created_at"].isoformat() if hasattr(r["created_at"], "isoformat") else str(r["created_at"]),
-        })
+    positions, total_unrealized, _ = _mark_futures_positions(positions_raw)
     return {"margin_available": margin_available, "positions": positions, "total_unrealized_pnl": round(total_unrealized, 2)}
 
 
 @router.get("/futures-performance")
-def get_demo_futures_performance(user_id: int = Depends(get_current_user_id)):
+def get_demo_futures_performance(user: dict = Depends(get_current_user)):
     """Demo futures performance: margin, open positions, realized/unrealized PnL, commission, and closed trades."""
+    user_id = user["id"]
+    margin_available = user["demo_balance"]
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute("SELECT demo_balance FROM users WHERE id = %s", (user_id,))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="User not found")
-            margin_available = float(row["demo_balance"])
             cur.execute(
-                "SELECT id, symbol, side, quantity, entry_price, leverage, margin_used, created_at FROM demo_futures_positions WHERE user_id = %s ORDER BY created_at ASC",
+                "SELECT id, symbol, side, quantity, entry_price, leverage, margin_used, stop_loss_price, take_profit_price, created_at FROM demo_futures_positions WHERE user_id = %s ORDER BY created_at ASC",
                 (user_id,),
             )
             positions_raw = cur.fetchall()
@@ -396,37 +899,7 @@ def get_demo_futures_performance(user_id: int = Depends(get_current_user_id)):
             trades_rows = cur.fetchall()
     realized_pnl = float(agg.get("realized_pnl") or 0)
     total_commission = float(agg.get("total_commission") or 0)
-    positions = []
-    total_unrealized = 0.0
-    total_margin_used = 0.0
-    for r in positions_raw:
-        symbol = r["symbol"]
-        side = r["side"]
-        qty = float(r["quantity"])
-        entry = float(r["entry_price"])
-        margin_used = float(r["margin_used"])
-        total_margin_used += margin_used
-        try:
-            current_price = _get_price(symbol)
-        except Exception:
-            current_price = entry
-        if side == "LONG":
-            unrealized_pnl = (current_price - entry) * qty
-        else:
-            unrealized_pnl = (entry - current_price) * qty
-        total_unrealized += unrealized_pnl
-        positions.append({
-            "id": r["id"],
-            "symbol": symbol,
-            "side": side,
-            "quantity": qty,
-            "entry_price": entry,
-            "leverage": r["leverage"],
-            "margin_used": margin_used,
-            "current_price": current_price,
-            "unrealized_pnl": round(unrealized_pnl, 2),
-            "created_at": r["created_at"].isoformat() if hasattr(r["created_at"], "isoformat") else str(r["created_at"]),
-        })
+    positions, total_unrealized, total_margin_used = _mark_futures_positions(positions_raw)
     total_equity = margin_available + total_margin_used + total_unrealized
     equity_change = total_equity - INITIAL_DEMO_BALANCE
     last_trades = [
@@ -455,6 +928,45 @@ def get_demo_futures_performance(user_id: int = Depends(get_current_user_id)):
     }
 
 
+_leaderboard: tuple[float, list[tuple[int, dict]]] | None = None
+_leaderboard_lock = threading.Lock()
+
+
+def _futures_leaderboard() -> list[tuple[int, dict]]:
+    """(user_id, totals) of every user with an open futures position, highest equity first.
+
+    One batch mark (futures_mtm.mark_users) shared by all callers for FUTURES_LEADERBOARD_TTL_SEC.
+    """
+    global _leaderboard
+    with _leaderboard_lock:
+        if _leaderboard is None or _leaderboard[0] <= time.monotonic():
+            marked = mark_users()
+            ranked = [(uid, marked["users"][uid]) for uid in marked["leaderboard"]]
+            _leaderboard = (time.monotonic() + get_settings().FUTURES_LEADERBOARD_TTL_SEC, ranked)
+        return _leaderboard[1]
+
+
+@router.get("/futures-leaderboard")
+def get_demo_futures_leaderboard(
+    user_id: int = Depends(get_current_user_id),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Demo futures ranking by marked equity among users with open positions (other users stay anonymous)."""
+    ranked = _futures_leaderboard()
+    your_rank = next((i + 1 for i, (uid, _) in enumerate(ranked) if uid == user_id), None)
+    entries = [
+        {
+            "rank": i + 1,
+            "equity": round(t["equity"], 2),
+            "equity_change": round(t["equity"] - INITIAL_DEMO_BALANCE, 2),
+            "unrealized_pnl": round(t["unrealized_pnl"], 2) + 0.0,
+            "you": uid == user_id,
+        }
+        for i, (uid, t) in enumerate(ranked[:limit])
+    ]
+    return {"entries": entries, "your_rank": your_rank, "total_users": len(ranked)}
+
+
 @router.post("/futures-performance/reset")
 def reset_demo_futures_performance(user_id: int = Depends(get_current_user_id)):
     """
@@ -464,20 +976,23 @@ def reset_demo_futures_performance(user_id: int = Depends(get_current_user_id)):
     """
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            # Spot cash = initial balance + sum(demo_trades.usdt_amount)
-            cur.execute(
-                "SELECT COALESCE(SUM(usdt_amount), 0) AS spot_cash_flow FROM demo_trades WHERE user_id = %s",
-                (user_id,),
-            )
-            row = cur.fetchone() or {"spot_cash_flow": 0}
-            spot_cash = float(INITIAL_DEMO_BALANCE + float(row.get("spot_cash_flow") or 0))
+            # Spot cash = initial balance + spot trade cash flow (kept in the spot ledger)
+            cur.execute("SELECT id FROM users WHERE id = %s FOR UPDATE", (user_id,))
+            if not cur.fetchone():
+                raise HTTPException(status_code=404, detail="User not found")
+            spot_cash = float(_ensure_spot_state(cur, user_id)["cash_usdt"])
             if spot_cash < 0:
                 spot_cash = 0.0
 
+            cur.execute("SELECT id FROM demo_futures_positions WHERE user_id = %s FOR UPDATE", (user_id,))
+            position_ids = [r["id"] for r in cur.fetchall()]
             cur.execute("DELETE FROM demo_futures_positions WHERE user_id = %s", (user_id,))
             cur.execute("DELETE FROM demo_futures_trades WHERE user_id = %s", (user_id,))
             cur.execute("UPDATE users SET demo_balance = %s WHERE id = %s", (round(spot_cash, 2), user_id))
             conn.commit()
+    for pid in position_ids:
+        _untrack_trigger(pid)
+    publish_event(user_id, "order_fill", {"market": "futures", "reset": True})
     return {"ok": True, "message": "Futures performance reset.", "demo_balance": round(spot_cash, 2)}
 
 
@@ -487,12 +1002,26 @@ def place_demo_futures_order_impl(
     symbol: str,
     margin_usdt: float = 100.0,
     leverage: int = 10,
+    stop_loss_price: float | None = None,
+    take_profit_price: float | None = None,
+    exit_level: float | None = None,
 ) -> dict:
-    """Demo futures trade (called from agent background with user_id)."""
+    """Demo futures trade (called from agent background with user_id).
+
+    exit_level (agent's suggested exit) becomes the target when it is on the profit side of the
+    fill and the stop otherwise; explicit stop_loss_price / take_profit_price take precedence.
+    """
     symbol = symbol.upper()
     margin_usdt = Decimal(str(max(1, min(10000, margin_usdt))))
     leverage = max(1, min(125, leverage))
     price = _get_price(symbol)
+    stop_loss_price, take_profit_price = _exit_levels(side, price, stop_loss_price, take_profit_price)
+    if exit_level and exit_level > 0 and exit_level != price:
+        in_profit = exit_level > price if side == "LONG" else exit_level < price
+        if in_profit and take_profit_price is None:
+            take_profit_price = exit_level
+        elif not in_profit and stop_loss_price is None:
+            stop_loss_price = exit_level
     opposite_side = "SHORT" if side == "LONG" else "LONG"
     with get_db() as conn:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
@@ -502,25 +1031,21 @@ def place_demo_futures_order_impl(
                 raise HTTPException(status_code=404, detail="User not found")
             demo_balance = Decimal(str(row["demo_balance"]))
             cur.execute(
-                "SELECT id, side, quantity, entry_price, margin_used FROM demo_futures_positions WHERE user_id = %s AND symbol = %s AND side = %s FOR UPDATE",
+                "SELECT id, symbol, side, quantity, entry_price, margin_used FROM demo_futures_positions WHERE user_id = %s AND symbol = %s AND side = %s FOR UPDATE",
                 (user_id, symbol, opposite_side),
             )
+            closed = []
             for pos in cur.fetchall():
-                ex_side = pos["side"]
-                ex_qty = float(pos["quantity"])
-                ex_price = float(pos["entry_price"])
-                ex_margin = float(pos["margin_used"])
-                pnl = (price - ex_price) * ex_qty if ex_side == "LONG" else (ex_price - price) * ex_qty
-                notional_close = ex_qty * price
-                commission = notional_close * FUTURES_COMMISSION_RATE
-                settlement = ex_margin + pnl - commission
-                cur.execute("DELETE FROM demo_futures_positions WHERE id = %s AND user_id = %s", (pos["id"], user_id))
-                cur.execute("UPDATE users SET demo_balance = demo_balance + %s WHERE id = %s", (float(settlement), user_id))
-                cur.execute(
-                    "INSERT INTO demo_futures_trades (user_id, symbol, side, quantity, entry_price, exit_price, pnl_usdt, commission_usdt) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
-                    (user_id, symbol, ex_side, ex_qty, ex_price, price, pnl, commission),
-                )
+                pnl, commission = _settle_futures_position(cur, user_id, pos, price, "reverse")
+                closed.append((pos, pnl))
             conn.commit()
+            # The reverse closes are final even if the new position is refused below.
+            for pos, pnl in closed:
+                _untrack_trigger(pos["id"])
+                publish_event(user_id, "order_fill", {
+                    "market": "futures", "close": True, "reason": "reverse", "side": pos["side"], "symbol": symbol,
+                    "quantity": float(pos["quantity"]), "price": price, "pnl_usdt": round(pnl, 2),
+                })
             cur.execute("SELECT demo_balance FROM users WHERE id = %s FOR UPDATE", (user_id,))
             row = cur.fetchone()
             demo_balance = Decimal(str(row["demo_balance"]))
@@ -530,17 +1055,29 @@ def place_demo_futures_order_impl(
             qty = notional / price
             cur.execute("UPDATE users SET demo_balance = demo_balance - %s WHERE id = %s", (float(margin_usdt), user_id))
             cur.execute(
-                "INSERT INTO demo_futures_positions (user_id, symbol, side, quantity, entry_price, leverage, margin_used) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                (user_id, symbol, side, qty, price, leverage, float(margin_usdt)),
+                "INSERT INTO demo_futures_positions (user_id, symbol, side, quantity, entry_price, leverage, margin_used, stop_loss_price, take_profit_price) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                (user_id, symbol, side, qty, price, leverage, float(margin_usdt), stop_loss_price, take_profit_price),
             )
+            position_id = cur.lastrowid
             conn.commit()
-    return {"ok": True, "message": f"Demo {side}: {qty:.8f} {symbol} @ {price:.2f}, {leverage}x"}
+    _track_trigger({
+        "id": position_id, "user_id": user_id, "symbol": symbol, "side": side, "quantity": qty, "entry_price": price,
+        "margin_used": float(margin_usdt), "stop_loss_price": stop_loss_price, "take_profit_price": take_profit_price,
+    })
+    publish_event(user_id, "order_fill", {
+        "market": "futures", "side": side, "symbol": symbol, "quantity": qty, "price": price,
+        "leverage": leverage,
+    })
+    return {"ok": True, "position_id": position_id, "message": f"Demo {side}: {qty:.8f} {symbol} @ {price:.2f}, {leverage}x"}
 
 
 @router.post("/futures-order")
 def place_demo_futures_order(body: DemoFuturesOrderRequest, user_id: int = Depends(get_current_user_id)):
     """Demo futures trade: open LONG or SHORT. Opposite positions on same symbol are closed first. Commission 0.04%."""
-    return place_demo_futures_order_impl(user_id, body.side, body.symbol, body.margin_usdt, body.leverage)
+    return place_demo_futures_order_impl(
+        user_id, body.side, body.symbol, body.margin_usdt, body.leverage,
+        stop_loss_price=body.stop_loss_price, take_profit_price=body.take_profit_price,
+    )
 
 
 @router.get("/futures-trades")
@@ -589,35 +1126,44 @@ def close_demo_futures_position(body: DemoFuturesCloseRequest, user_id: int = De
             symbol = row["symbol"]
             side = row["side"]
             qty = float(row["quantity"])
-            entry_price = float(row["entry_price"])
-            margin_used = float(row["margin_used"])
             try:
                 exit_price = _get_price(symbol)
             except Exception:
                 raise HTTPException(status_code=502, detail="Failed to fetch price")
-            if side == "LONG":
-                pnl = (exit_price - entry_price) * qty
-            else:
-                pnl = (entry_price - exit_price) * qty
-            notional = qty * exit_price
-            commission = notional * FUTURES_COMMISSION_RATE
-            settlement = margin_used + pnl - commission
-            cur.execute("DELETE FROM demo_futures_positions WHERE id = %s AND user_id = %s", (body.position_id, user_id))
-            cur.execute(
-                "UPDATE users SET demo_balance = demo_balance + %s WHERE id = %s",
-                (float(settlement), user_id),
-            )
-            cur.execute(
-                """
-                INSERT INTO demo_futures_trades (user_id, symbol, side, quantity, entry_price, exit_price, pnl_usdt, commission_usdt)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (user_id, symbol, side, qty, entry_price, exit_price, pnl, commission),
-            )
+            pnl, commission = _settle_futures_position(cur, user_id, row, exit_price, "manual")
             conn.commit()
+    _untrack_trigger(body.position_id)
+    publish_event(user_id, "order_fill", {
+        "market": "futures", "close": True, "side": side, "symbol": symbol, "quantity": qty,
+        "price": exit_price, "pnl_usdt": round(pnl, 2),
+    })
     return {
         "ok": True,
         "message": f"Position closed. PnL: {pnl:+.2f} USDT, commission: {commission:.2f} USDT",
         "pnl_usdt": round(pnl, 2),
         "commission_usdt": round(commission, 2),
     }
+
+
+@router.post("/futures-levels")
+def set_demo_futures_levels(body: DemoFuturesLevelsRequest, user_id: int = Depends(get_current_user_id)):
+    """Set or clear stop-loss / take-profit of an open position (relative to the current price)."""
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute(
+                f"SELECT {_TRIGGER_COLUMNS} FROM demo_futures_positions WHERE id = %s AND user_id = %s FOR UPDATE",
+                (body.position_id, user_id),
+            )
+            pos = cur.fetchone()
+            if not pos:
+                raise HTTPException(status_code=404, detail="Position not found or does not belong to you")
+            price = _get_price(pos["symbol"])
+            stop_loss_price, take_profit_price = _exit_levels(pos["side"], price, body.stop_loss_price, body.take_profit_price)
+            cur.execute(
+                "UPDATE demo_futures_positions SET stop_loss_price = %s, take_profit_price = %s WHERE id = %s",
+                (stop_loss_price, take_profit_price, body.position_id),
+            )
+            conn.commit()
+    pos.update(stop_loss_price=stop_loss_price, take_profit_price=take_profit_price)
+    _track_trigger(pos)
+    return {"ok": True, "position_id": body.position_id, "stop_loss_price": stop_loss_price, "take_profit_price": take_profit_price}
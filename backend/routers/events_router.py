@@ -0,0 +1,42 @@
+# Vox Trader Backend - Push channel (server-sent events per user)
+import json
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from config import get_settings
+from routers.auth_router import get_current_user_id
+from services.event_bus import get_event_bus
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _event_stream(user_id: int):
+    bus = get_event_bus()
+    bus.start()
+    sub = bus.subscribe(user_id)
+    heartbeat = get_settings().EVENT_STREAM_HEARTBEAT_SEC
+    try:
+        yield "retry: 5000\n" + _sse({"type": "ready", "data": {}})
+        while True:
+            event = await sub.get(timeout=heartbeat)
+            # Comment line keeps proxies from closing an idle stream.
+            yield _sse(event) if event is not None else ": ping\n\n"
+    finally:
+        bus.unsubscribe(sub)
+
+
+@router.get("/stream")
+async def event_stream(user_id: int = Depends(get_current_user_id)):
+    """
+    Per-user push stream (text/event-stream). Event types: agent_log, analysis,
+    order_fill, ai_balance. Each `data:` line is {"type", "data", "ts"}.
+    """
+    return StreamingResponse(
+        _event_stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
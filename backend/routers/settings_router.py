@@ -2,9 +2,10 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from database import get_db
-from routers.auth_router import get_current_user_id
+from routers.auth_router import get_current_user, get_current_user_id
 from models import BinanceKeysUpdate, BinanceKeysResponse
 from encryption import encrypt_api_value, decrypt_api_value
+from services.credential_cache import get_credential_cache
 import pymysql
 
 router = APIRouter(prefix="/settings", tags=["settings"])
@@ -55,6 +56,7 @@ def save_binance_keys(
                 """,
                 (user_id, encrypted_key, encrypted_secret),
             )
+    get_credential_cache().invalidate(user_id)
     return {"ok": True, "message": "Binance API credentials saved."}
 
 
@@ -63,14 +65,8 @@ class DemoModeUpdate(BaseModel):
 
 
 @router.get("/demo-mode")
-def get_demo_mode(user_id: int = Depends(get_current_user_id)):
-    with get_db() as conn:
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute("SELECT demo_mode FROM users WHERE id = %s", (user_id,))
-            row = cur.fetchone()
-    if not row:
-        raise HTTPException(status_code=404, detail="User not found")
-    return {"demo_mode": bool(row.get("demo_mode", 0))}
+def get_demo_mode(user: dict = Depends(get_current_user)):
+    return {"demo_mode": user["demo_mode"]}
 
 
 @router.put("/demo-mode")
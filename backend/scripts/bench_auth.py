@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - İstek başına kimlik doğrulama maliyeti benchmark'ı.
+1) JWT doğrulama: her istekte python-jose ile decode/verify ile doğrulanmış token LRU cache'i (isabet) karşılaştırılır.
+2) Uçtan uca (FastAPI TestClient): handler ve bir alt bağımlılık kullanıcı satırını ayrı ayrı SELECT ederken
+   (eski yol) ile istek kapsamlı get_current_user bağımlılığı (tek SELECT, cache'li token) karşılaştırılır.
+   Veritabanı sahte; --query-ms sorgu başına gecikmeyi simüle eder.
+Kullanım: python scripts/bench_auth.py [--users 500] [--requests 20000] [--query-ms 0.3]
+"""
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import routers.auth_router as auth_router
+from auth import TokenCache, create_access_token, decode_token
+
+
+class FakeCursor:
+    def __init__(self, counter: list, query_ms: float):
+        self.counter, self.query_ms, self.uid = counter, query_ms, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args=None):
+        self.counter[0] += 1
+        self.uid = args[0]
+        if self.query_ms:
+            time.sleep(self.query_ms / 1000.0)
+
+    def fetchone(self):
+        return {"id": self.uid, "email": f"u{self.uid}@x.io", "name": "u", "demo_balance": 10000, "demo_mode": 1,
+                "balance": 5, "created_at": datetime(2026, 1, 1)}
+
+
+def fake_get_db(counter: list, query_ms: float):
+    class Conn:
+        def cursor(self, *a):
+            return FakeCursor(counter, query_ms)
+
+    @contextmanager
+    def get_db():
+        yield Conn()
+    return get_db
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--http-requests", type=int, default=2000)
+    parser.add_argument("--query-ms", type=float, default=0.3, help="simulated users SELECT latency")
+    args = parser.parse_args()
+    tokens = [create_access_token({"sub": str(i + 1)}) for i in range(args.users)]
+    seq = [tokens[i % args.users] for i in range(args.requests)]
+
+    t0 = time.perf_counter()
+    for tok in seq:
+        decode_token(tok)
+    jose_us = (time.perf_counter() - t0) / len(seq) * 1e6
+    cache = TokenCache(max_entries=args.users * 2)
+    for tok in tokens:
+        cache.decode(tok)
+    t0 = time.perf_counter()
+    for tok in seq:
+        cache.decode(tok)
+    cached_us = (time.perf_counter() - t0) / len(seq) * 1e6
+    print(f"token verify: jose {jose_us:.1f} us, cached {cached_us:.2f} us ({jose_us / cached_us:.0f}x), "
+          f"hit rate {cache.stats()['hits'] / max(1, cache.stats()['hits'] + cache.stats()['misses']):.3f}")
+
+    counter = [0]
+    auth_router.get_db = fake_get_db(counter, args.query_ms)
+    get_db = auth_router.get_db
+
+    def old_user_id(credentials=Depends(auth_router.security)) -> int:
+        return int(decode_token(credentials.credentials)["sub"])
+
+    def select_balance(user_id: int) -> float:
+        with get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT demo_balance FROM users WHERE id = %s", (user_id,))
+                return float(cur.fetchone()["demo_balance"])
+
+    def old_mode(user_id: int = Depends(old_user_id)) -> bool:
+        with get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT demo_mode FROM users WHERE id = %s", (user_id,))
+                return bool(cur.fetchone()["demo_mode"])
+
+    def new_mode(user: dict = Depends(auth_router.get_current_user)) -> bool:
+        return user["demo_mode"]
+
+    app = FastAPI()
+
+    @app.get("/old")
+    def old(user_id: int = Depends(old_user_id), mode: bool = Depends(old_mode)):
+        return {"demo_balance": select_balance(user_id), "demo_mode": mode}
+
+    @app.get("/new")
+    def new(user: dict = Depends(auth_router.get_current_user), mode: bool = Depends(new_mode)):
+        return {"demo_balance": user["demo_balance"], "demo_mode": mode}
+
+    client = TestClient(app)
+    print(f"{'path':>5} {'ms/req':>8} {'SELECTs/req':>12}")
+    for path in ("/old", "/new"):
+        for tok in tokens[:50]:
+            client.get(path, headers={"Authorization": f"Bearer {tok}"})
+        counter[0] = 0
+        t0 = time.perf_counter()
+        for i in range(args.http_requests):
+            client.get(path, headers={"Authorization": f"Bearer {tokens[i % args.users]}"})
+        ms = (time.perf_counter() - t0) / args.http_requests * 1000.0
+        print(f"{path:>5} {ms:>8.3f} {counter[0] / args.http_requests:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - Agent grafik render benchmark'ı.
+Eski (mum başına ax.plot + Rectangle) render ile vektörel render'ı 100 / 500 / 1000 mumda karşılaştırır.
+Kullanım: python scripts/bench_chart_render.py [--repeat 20]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from services.chart_render import render_candlestick_png
+
+
+def make_ohlc(n: int, seed: int = 0) -> list[list[float]]:
+    rng = np.random.default_rng(seed)
+    closes = 50000 + np.cumsum(rng.normal(0, 50, n))
+    opens = np.r_[closes[0], closes[:-1]]
+    highs = np.maximum(opens, closes) + rng.uniform(0, 40, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 40, n)
+    return np.column_stack((opens, highs, lows, closes)).tolist()
+
+
+def render_legacy(klines: list[list[float]], title: str = "BTCUSDT") -> bytes:
+    """Previous renderer: fresh pyplot figure, one plot call + one Rectangle per candle."""
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Rectangle
+
+    n = len(klines)
+    opens = np.array([k[0] for k in klines])
+    highs = np.array([k[1] for k in klines])
+    lows = np.array([k[2] for k in klines])
+    closes = np.array([k[3] for k in klines])
+    fig, ax = plt.subplots(figsize=(8, 4), facecolor="#18181b")
+    ax.set_facecolor("#18181b")
+    ax.tick_params(colors="#a1a1aa", labelsize=8)
+    for side in ("bottom", "top", "left", "right"):
+        ax.spines[side].set_color("#3f3f46")
+    ax.set_title(title, color="#e4e4e7", fontsize=10)
+    for i in range(n):
+        o, h, l, c = opens[i], highs[i], lows[i], closes[i]
+        color = "#22c55e" if c >= o else "#ef4444"
+        ax.plot([i, i], [l, h], color=color, linewidth=0.8, solid_capstyle="round")
+        body_height = abs(c - o) or ((h - l) * 0.01 if h != l else 1e-12)
+        ax.add_patch(Rectangle((i - 0.3, min(o, c)), 0.6, body_height, facecolor=color, edgecolor=color))
+    ax.set_xlim(-0.5, n - 0.5)
+    ax.set_ylim(lows.min() * 0.998, highs.max() * 1.002)
+    ax.xaxis.set_major_locator(plt.MaxNLocator(8))
+    fig.tight_layout(pad=0.5)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=100, bbox_inches="tight", facecolor="#18181b", edgecolor="none")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def bench(fn, klines, repeat: int) -> float:
+    fn(klines)  # warm-up (font cache, first figure)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(klines)
+    return (time.perf_counter() - t0) / repeat * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'candles':>8} {'legacy ms':>10} {'vector ms':>10} {'speedup':>8}")
+    for n in (100, 500, 1000):
+        klines = make_ohlc(n)
+        legacy = bench(render_legacy, klines, args.repeat)
+        vector = bench(render_candlestick_png, klines, args.repeat)
+        print(f"{n:>8} {legacy:>10.1f} {vector:>10.1f} {legacy / vector:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
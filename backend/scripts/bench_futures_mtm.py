@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - Demo futures mark-to-market benchmark'ı.
+Pozisyon başına fiyat sorgulayan eski Python döngüsü ile tek toplu fiyat sorgusu + NumPy vektörel
+hesaplamayı (services/futures_mtm) 10k açık pozisyonda karşılaştırır. Fiyatlar gerçek PriceCache
+üzerinden okunur; --lookup-ms ile her sorguya ek gecikme verilebilir (ör. 50 = Binance HTTP).
+Kullanım: python scripts/bench_futures_mtm.py [--positions 10000] [--users 2000] [--repeat 5] [--lookup-ms 0]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from services.futures_mtm import aggregate_by_user, mark_positions
+from services.price_cache import PriceCache
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT", "DOGEUSDT", "ADAUSDT", "AVAXUSDT"]
+
+
+def make_positions(n: int, users: int, seed: int = 0) -> tuple[list[dict], dict[int, float], dict[str, float]]:
+    rng = np.random.default_rng(seed)
+    base = {s: float(p) for s, p in zip(SYMBOLS, rng.uniform(0.1, 60000, len(SYMBOLS)))}
+    rows = []
+    for i in range(n):
+        sym = SYMBOLS[int(rng.integers(len(SYMBOLS)))]
+        entry = base[sym] * float(rng.uniform(0.95, 1.05))
+        leverage = int(rng.integers(1, 126))
+        margin = float(rng.uniform(10, 1000))
+        rows.append({
+            "id": i + 1, "user_id": int(rng.integers(1, users + 1)), "symbol": sym,
+            "side": "LONG" if rng.random() < 0.5 else "SHORT", "quantity": margin * leverage / entry,
+            "entry_price": entry, "leverage": leverage, "margin_used": margin, "created_at": datetime.now(),
+        })
+    balances = {uid: float(rng.uniform(0, 10000)) for uid in range(1, users + 1)}
+    return rows, balances, base
+
+
+def mark_legacy(rows: list[dict], balances: dict[int, float], get_price) -> dict[int, float]:
+    """Previous endpoint logic generalized to many users: price lookup + PnL per position in Python."""
+    equity = dict(balances)
+    for r in rows:
+        qty, entry = float(r["quantity"]), float(r["entry_price"])
+        price = get_price(r["symbol"])
+        pnl = (price - entry) * qty if r["side"] == "LONG" else (entry - price) * qty
+        equity[r["user_id"]] = equity.get(r["user_id"], 0.0) + float(r["margin_used"]) + pnl
+    return equity
+
+
+def bench(fn, repeat: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--positions", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--lookup-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    rows, balances, prices = make_positions(args.positions, args.users)
+    cache = PriceCache(ttl_sec=3600.0, fetch_all=lambda: prices)
+    lookups = 0
+
+    def get_price(symbol: str) -> float:
+        nonlocal lookups
+        lookups += 1
+        if args.lookup_ms:
+            time.sleep(args.lookup_ms / 1000.0)
+        return cache.get_price(symbol)
+
+    def mark_vector():
+        nonlocal lookups
+        lookups += 1
+        if args.lookup_ms:
+            time.sleep(args.lookup_ms / 1000.0)
+        batch = cache.get_prices(r["symbol"] for r in rows)
+        return aggregate_by_user(rows, mark_positions(rows, batch), balances)
+
+    legacy = bench(lambda: mark_legacy(rows, balances, get_price), args.repeat)
+    legacy_lookups = lookups // (args.repeat + 1)
+    lookups = 0
+    vector = bench(mark_vector, args.repeat)
+    vector_lookups = lookups // (args.repeat + 1)
+
+    # Sanity check: both paths agree on equity.
+    expected = mark_legacy(rows, balances, prices.__getitem__)
+    got = aggregate_by_user(rows, mark_positions(rows, prices), balances)
+    worst = max(abs(expected[uid] - got[uid]["equity"]) for uid in expected)
+
+    print(f"positions={args.positions} users={args.users} lookup_ms={args.lookup_ms}")
+    print(f"{'path':>8} {'ms':>10} {'lookups':>8}")
+    print(f"{'legacy':>8} {legacy:>10.1f} {legacy_lookups:>8}")
+    print(f"{'vector':>8} {vector:>10.1f} {vector_lookups:>8}")
+    print(f"speedup {legacy / vector:.1f}x, max equity diff {worst:.2e}")
+
+
+if __name__ == "__main__":
+    main()
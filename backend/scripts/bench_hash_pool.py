@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - Giriş (bcrypt) yığılmasında diğer senkron endpoint'lerin gecikmesi benchmark'ı.
+Aynı anda --logins adet şifre doğrulaması başlatılır; bu sırada senkron bir "demo emir" işi (--order-ms)
+periyodik olarak thread havuzuna gönderilip bekleme süresi ölçülür. Eski yol: bcrypt senkron handler gibi
+Starlette/anyio thread havuzunda (40 thread) çalışır. Yeni yol: ayrı hash havuzu (süreç veya thread),
+--max-pending üstü anında 429 (HashQueueFullError) alır.
+Kullanım: python scripts/bench_hash_pool.py [--logins 200] [--workers 2] [--max-pending 32] (maliyet: BCRYPT_ROUNDS)
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anyio.to_thread
+
+from auth import pwd_context
+from services.hash_pool import HashPool, HashQueueFullError
+
+
+def demo_order(order_ms: float) -> None:
+    time.sleep(order_ms / 1000.0)
+
+
+async def probe(stop: asyncio.Event, order_ms: float, out: list) -> None:
+    """Latency of a sync endpoint's work item submitted to the shared request threadpool."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await anyio.to_thread.run_sync(demo_order, order_ms)
+        out.append((time.perf_counter() - t0) * 1000.0 - order_ms)
+        await asyncio.sleep(0.02)
+
+
+async def burst(verify, logins: int, order_ms: float) -> tuple[float, list, int]:
+    stop = asyncio.Event()
+    waits: list[float] = []
+    prober = asyncio.create_task(probe(stop, order_ms, waits))
+    await asyncio.sleep(0.1)
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(verify() for _ in range(logins)), return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await prober
+    rejected = sum(isinstance(r, HashQueueFullError) for r in results)
+    return elapsed, waits, rejected
+
+
+def summary(waits: list) -> str:
+    if not waits:
+        return "no samples"
+    waits = sorted(waits)
+    return f"median {statistics.median(waits):.1f} ms, p95 {waits[int(len(waits) * 0.95) - 1]:.1f} ms, max {waits[-1]:.1f} ms"
+
+
+async def main_async(args) -> None:
+    hashed = pwd_context.hash("secret")  # at BCRYPT_ROUNDS, so verify never rehashes here
+    t0 = time.perf_counter()
+    pwd_context.verify("secret", hashed)
+    print(f"one bcrypt verify: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    elapsed, waits, _ = await burst(lambda: anyio.to_thread.run_sync(pwd_context.verify, "secret", hashed), args.logins, args.order_ms)
+    print(f"request threadpool: {args.logins} logins in {elapsed:.1f} s; demo order wait {summary(waits)}")
+
+    for processes in (True, False):
+        pool = HashPool(workers=args.workers, processes=processes, max_pending=args.max_pending, timeout_sec=600)
+        pool.start()
+        await pool.verify("warm", hashed)
+        elapsed, waits, rejected = await burst(lambda: pool.verify("secret", hashed), args.logins, args.order_ms)
+        pool.stop()
+        kind = "process" if processes else "thread"
+        print(f"hash pool ({kind} x{args.workers}): {args.logins - rejected} verified, {rejected} got 429 in {elapsed:.1f} s; "
+              f"demo order wait {summary(waits)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--order-ms", type=float, default=5.0, help="work of one sync demo-order request")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
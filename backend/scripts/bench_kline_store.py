@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - Yerel kline deposu benchmark'ı.
+Sahte bir Binance REST'i (--rest-ms gecikmeli) kullanarak: soğuk okuma (eksik aralıklar indirilir), sıcak okuma
+(diskten, yalnızca açık mum canlı akıştan), 100k mumluk aralık okuması ve aynı aralığı isteyen eşzamanlı
+thread'lerin kaç REST çağrısına yol açtığını (tekilleştirme) ölçer.
+Kullanım: python scripts/bench_kline_store.py [--limit 500] [--rest-ms 80] [--threads 16]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.kline_store import INTERVAL_MS, KlineStore
+
+NOW_MS = 1_760_000_000_000
+
+
+def fake_binance(rest_ms: float, calls: list):
+    def fetch(symbol, interval, limit, start_ms=None, end_ms=None):
+        calls.append(limit)
+        time.sleep(rest_ms / 1000.0)
+        ims = INTERVAL_MS[interval]
+        cur = NOW_MS // ims * ims
+        if start_ms is None:
+            times = [cur - (limit - 1 - i) * ims for i in range(limit)]
+        else:
+            times = list(range(start_ms, min(end_ms, cur) + 1, ims))[:limit]
+        return [[t, "100.1", "101.2", "99.3", "100.4", "12.5", t + ims - 1, "1250.0", 42, "6.1", "610.0", "0"] for t in times]
+    return fetch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--rest-ms", type=float, default=80.0, help="simulated Binance REST latency per call")
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--range-candles", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+    root = tempfile.mkdtemp(prefix="klines-")
+    calls: list[int] = []
+    try:
+        store = KlineStore(root, fetch=fake_binance(args.rest_ms, calls), now_ms=lambda: NOW_MS)
+        current = [NOW_MS // 60_000 * 60_000, "100", "101", "99", "100", "1", NOW_MS, "1", 1, "1", "1", "0"]
+
+        t0 = time.perf_counter()
+        store.get_latest("BTCUSDT", "1m", args.limit, current)
+        cold_ms = (time.perf_counter() - t0) * 1000.0
+        cold_calls = len(calls)
+
+        t0 = time.perf_counter()
+        for _ in range(args.reads):
+            store.get_latest("BTCUSDT", "1m", args.limit, current)
+        warm_ms = (time.perf_counter() - t0) * 1000.0 / args.reads
+
+        start = NOW_MS - args.range_candles * 60_000
+        t0 = time.perf_counter()
+        store.get_range("ETHUSDT", "1m", start, NOW_MS)
+        range_cold_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        arr = store.get_range("ETHUSDT", "1m", start, NOW_MS)
+        range_warm_ms = (time.perf_counter() - t0) * 1000.0
+
+        calls.clear()
+        threads = [
+            threading.Thread(target=store.get_range, args=("SOLUSDT", "5m", NOW_MS - 20_000 * 300_000, NOW_MS))
+            for _ in range(args.threads)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        dedup_calls = len(calls)
+
+        print(f"get_latest(limit={args.limit}): cold {cold_ms:.0f} ms ({cold_calls} REST calls), "
+              f"warm {warm_ms:.2f} ms (no REST, open candle from stream) vs ~{args.rest_ms:.0f} ms per REST proxy call")
+        print(f"get_range({args.range_candles:,} x 1m): cold {range_cold_s:.1f} s, warm {range_warm_ms:.2f} ms "
+              f"({len(arr):,} candles, {arr.nbytes / 1e6:.1f} MB)")
+        print(f"{args.threads} threads, same cold 20k x 5m range: {dedup_calls} REST calls "
+              f"(one set of {-(-20_000 // 1000)} chunks when deduplicated)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
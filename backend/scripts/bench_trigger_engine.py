@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - Futures trigger engine benchmark'ı.
+~100k açık tetik (46k pozisyon: likidasyon + stop + hedef) için fiyat tick'i başına kontrol süresini, tüm
+pozisyonları tarayan doğrusal kontrol ile karşılaştırır; index kurulum süresini de ölçer.
+Kullanım: python scripts/bench_trigger_engine.py [--positions 46000] [--ticks 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from services.trigger_engine import TriggerEngine, position_triggers
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT", "DOGEUSDT", "ADAUSDT", "AVAXUSDT"]
+
+
+def make_positions(n: int, seed: int = 0) -> tuple[list[dict], dict[str, float]]:
+    rng = np.random.default_rng(seed)
+    base = {s: float(p) for s, p in zip(SYMBOLS, rng.uniform(1, 60000, len(SYMBOLS)))}
+    rows = []
+    for i in range(n):
+        sym = SYMBOLS[int(rng.integers(len(SYMBOLS)))]
+        entry = base[sym] * float(rng.uniform(0.98, 1.02))
+        long = rng.random() < 0.5
+        leverage = int(rng.integers(2, 126))
+        margin = float(rng.uniform(10, 1000))
+        sl = entry * (0.9 if long else 1.1) if rng.random() < 0.6 else None
+        tp = entry * (1.1 if long else 0.9) if rng.random() < 0.6 else None
+        rows.append({
+            "id": i + 1, "symbol": sym, "side": "LONG" if long else "SHORT", "quantity": margin * leverage / entry,
+            "entry_price": entry, "margin_used": margin, "stop_loss_price": sl, "take_profit_price": tp,
+        })
+    return rows, base
+
+
+def linear_check(triggers: list[tuple[str, str, str, float]], symbol: str, price: float) -> int:
+    """Per-tick scan of every trigger (what a DB/array scan per tick amounts to)."""
+    hits = 0
+    for sym, direction, _, level in triggers:
+        if sym == symbol and (price <= level if direction == "below" else price >= level):
+            hits += 1
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--positions", type=int, default=46000)
+    parser.add_argument("--ticks", type=int, default=20000)
+    parser.add_argument("--linear-ticks", type=int, default=50)
+    args = parser.parse_args()
+    rows, base = make_positions(args.positions)
+    engine = TriggerEngine(load=lambda: rows, close=lambda pid, kind, price: None)
+
+    t0 = time.perf_counter()
+    engine.resync()
+    build_ms = (time.perf_counter() - t0) * 1000.0
+    n_triggers = engine.stats()["triggers"]
+
+    # Ticks wander +-0.5% around the base price, so only a handful of levels cross.
+    rng = np.random.default_rng(1)
+    symbols = [SYMBOLS[i] for i in rng.integers(len(SYMBOLS), size=args.ticks)]
+    moves = rng.uniform(0.995, 1.005, args.ticks)
+    t0 = time.perf_counter()
+    fired = 0
+    for sym, m in zip(symbols, moves):
+        fired += engine.on_tick(sym, base[sym] * m)
+    indexed_us = (time.perf_counter() - t0) / args.ticks * 1e6
+
+    flat = [(r["symbol"], d, k, lvl) for r in rows for d, k, lvl in position_triggers(r)]
+    t0 = time.perf_counter()
+    for sym, m in zip(symbols[: args.linear_ticks], moves[: args.linear_ticks]):
+        linear_check(flat, sym, base[sym] * m)
+    linear_us = (time.perf_counter() - t0) / args.linear_ticks * 1e6
+
+    print(f"positions={args.positions} triggers={n_triggers} index build {build_ms:.0f} ms")
+    print(f"{'path':>8} {'us/tick':>10}")
+    print(f"{'linear':>8} {linear_us:>10.1f}")
+    print(f"{'indexed':>8} {indexed_us:>10.1f}")
+    print(f"speedup {linear_us / indexed_us:.0f}x, fired {fired} over {args.ticks} ticks")
+
+
+if __name__ == "__main__":
+    main()
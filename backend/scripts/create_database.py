@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 """
 Vox Trader - MySQL veritabanı ve tabloları oluşturur.
-Kullanım: python scripts/create_database.py
+Kullanım: python scripts/create_database.py [--partition]
+  --partition: agent_log ve agent_analyses tablolarını created_at üzerinden aylık RANGE
+               partition'lara çevirir (retention eski ayları DROP PARTITION ile siler).
 Ortam değişkenleri veya .env: MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
 """
+import argparse
 import os
 import sys
 
@@ -23,6 +26,10 @@ MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "vox_trader")
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--partition", action="store_true", help="agent_log / agent_analyses için aylık partition")
+    args = parser.parse_args()
+
     # Önce database olmadan bağlan
     conn = pymysql.connect(
         host=MYSQL_HOST,
@@ -91,6 +98,21 @@ def main():
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """)
             print("Tablo 'demo_holdings' hazır.")
+            # Maliyet bazı, son işlem fiyatı ve ortalama giriş fiyatı (performans/equity ve agent bağlamı için artımlı tutulur)
+            backfill_avg_entry = False
+            for col, spec in [
+                ("cost_basis_usdt", "DECIMAL(24, 8) NOT NULL DEFAULT 0"),
+                ("last_price_usdt", "DECIMAL(20, 8) NOT NULL DEFAULT 0"),
+                ("avg_entry_price", "DECIMAL(20, 8) NOT NULL DEFAULT 0"),
+            ]:
+                try:
+                    cur.execute(f"ALTER TABLE demo_holdings ADD COLUMN {col} {spec}")
+                    print(f"Sütun 'demo_holdings.{col}' eklendi.")
+                    if col == "avg_entry_price":
+                        backfill_avg_entry = True
+                except pymysql.err.OperationalError as e:
+                    if "Duplicate column name" not in str(e):
+                        raise
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS demo_trades (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -115,6 +137,73 @@ def main():
             except pymysql.err.OperationalError as e:
                 if "Duplicate column name" not in str(e):
                     raise
+            if backfill_avg_entry:
+                # Mevcut pozisyonlar: ortalama giriş = BUY işlemlerinin miktar ağırlıklı ortalama fiyatı
+                cur.execute("""
+                    UPDATE demo_holdings h
+                    JOIN (
+                        SELECT user_id, base_asset, SUM(quantity * price_usdt) / SUM(quantity) AS avg_price
+                        FROM demo_trades WHERE side = 'BUY' GROUP BY user_id, base_asset
+                    ) t ON t.user_id = h.user_id AND t.base_asset = h.asset
+                    SET h.avg_entry_price = t.avg_price
+                    WHERE h.quantity > 0
+                """)
+                print(f"demo_holdings.avg_entry_price dolduruldu ({cur.rowcount} satır).")
+            # Spot demo özet durumu: her emirle aynı transaction'da güncellenir (geçmişi yeniden oynatmaya gerek kalmaz)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS demo_spot_state (
+                    user_id INT NOT NULL PRIMARY KEY,
+                    cash_usdt DECIMAL(24, 8) NOT NULL,
+                    total_trades INT NOT NULL DEFAULT 0,
+                    buy_count INT NOT NULL DEFAULT 0,
+                    sell_count INT NOT NULL DEFAULT 0,
+                    total_commission DECIMAL(24, 8) NOT NULL DEFAULT 0,
+                    realized_pnl DECIMAL(24, 8) NOT NULL DEFAULT 0,
+                    last_trade_id INT NULL,
+                    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            print("Tablo 'demo_spot_state' hazır.")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS demo_equity_checkpoints (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    user_id INT NOT NULL,
+                    trade_id INT NULL,
+                    cash_usdt DECIMAL(24, 8) NOT NULL,
+                    holdings_value_usdt DECIMAL(24, 8) NOT NULL,
+                    equity_usdt DECIMAL(24, 2) NOT NULL,
+                    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_user_id_id (user_id, id),
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            print("Tablo 'demo_equity_checkpoints' hazır.")
+            # Spot limit / stop emirleri: açık olanlar bellekteki emir defterinde tutulur, fiyat tick'lerinde eşleşir
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS demo_spot_orders (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    user_id INT NOT NULL,
+                    symbol VARCHAR(20) NOT NULL,
+                    side VARCHAR(4) NOT NULL,
+                    order_type VARCHAR(5) NOT NULL,
+                    price DECIMAL(20, 8) NOT NULL,
+                    quote_order_qty DECIMAL(20, 2) NULL,
+                    quantity DECIMAL(24, 8) NULL,
+                    status VARCHAR(10) NOT NULL DEFAULT 'open',
+                    source VARCHAR(20) NOT NULL DEFAULT 'user',
+                    trade_id INT NULL,
+                    fill_price DECIMAL(20, 8) NULL,
+                    filled_quantity DECIMAL(24, 8) NULL,
+                    reject_reason VARCHAR(255) NULL,
+                    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    closed_at DATETIME NULL,
+                    INDEX idx_status_symbol (status, symbol),
+                    INDEX idx_user_status (user_id, status),
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            print("Tablo 'demo_spot_orders' hazır.")
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS binance_api_keys (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -147,6 +236,7 @@ def main():
                     output_tokens INT NULL,
                     cached_input_tokens INT NULL,
                     cost_usd DECIMAL(12, 6) NULL,
+                    shared_from_id INT NULL,
                     INDEX idx_user_created (user_id, created_at),
                     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
@@ -159,6 +249,7 @@ def main():
                 ("output_tokens", "INT NULL"),
                 ("cached_input_tokens", "INT NULL"),
                 ("cost_usd", "DECIMAL(12, 6) NULL"),
+                ("shared_from_id", "INT NULL"),  # paylaşılan analizin lider kaydı (AGENT_SHARED_ANALYSIS)
             ]:
                 try:
                     cur.execute(f"ALTER TABLE agent_analyses ADD COLUMN {col} {spec}")
@@ -166,6 +257,33 @@ def main():
                 except pymysql.err.OperationalError as e:
                     if "Duplicate column name" not in str(e):
                         raise
+            # Agent karar kalitesi özeti (services/decision_eval.py, scripts/evaluate_decisions.py doldurur)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS agent_decision_quality (
+                    model VARCHAR(64) NOT NULL,
+                    strategy VARCHAR(20) NOT NULL,
+                    market_type VARCHAR(10) NOT NULL,
+                    `interval` VARCHAR(10) NOT NULL,
+                    action VARCHAR(10) NOT NULL,
+                    horizon VARCHAR(10) NOT NULL,
+                    decisions INT NOT NULL DEFAULT 0,
+                    hits INT NOT NULL DEFAULT 0,
+                    sum_return DOUBLE NOT NULL DEFAULT 0,
+                    sum_return_sq DOUBLE NOT NULL DEFAULT 0,
+                    sum_edge DOUBLE NOT NULL DEFAULT 0,
+                    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (model, strategy, market_type, `interval`, action, horizon)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            print("Tablo 'agent_decision_quality' hazır.")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS agent_decision_eval_state (
+                    name VARCHAR(32) PRIMARY KEY,
+                    last_analysis_id BIGINT NOT NULL DEFAULT 0,
+                    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            print("Tablo 'agent_decision_eval_state' hazır.")
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS demo_futures_positions (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -190,6 +308,17 @@ def main():
                     pass
             except Exception:
                 pass
+            # Kullanıcı / agent stop-loss ve take-profit seviyeleri (trigger engine izler)
+            for col, spec in [
+                ("stop_loss_price", "DECIMAL(20, 8) NULL"),
+                ("take_profit_price", "DECIMAL(20, 8) NULL"),
+            ]:
+                try:
+                    cur.execute(f"ALTER TABLE demo_futures_positions ADD COLUMN {col} {spec}")
+                    print(f"Sütun 'demo_futures_positions.{col}' eklendi.")
+                except pymysql.err.OperationalError as e:
+                    if "Duplicate column name" not in str(e):
+                        raise
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS agent_job (
                     user_id INT PRIMARY KEY,
@@ -211,6 +340,8 @@ def main():
                     started_at DATETIME NULL,
                     last_run_at DATETIME NULL,
                     model VARCHAR(64) NOT NULL DEFAULT 'GLM-4.6V-Flash',
+                    lease_owner VARCHAR(96) NULL,
+                    lease_expires_at DATETIME NULL,
                     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """)
@@ -227,6 +358,8 @@ def main():
                 ("single_trade_if_max", "TINYINT(1) NOT NULL DEFAULT 1"),
                 ("max_mode_used", "TINYINT(1) NOT NULL DEFAULT 0"),
                 ("min_trade_interval_sec", "INT NOT NULL DEFAULT 0"),
+                ("lease_owner", "VARCHAR(96) NULL"),
+                ("lease_expires_at", "DATETIME NULL"),
             ]:
                 try:
                     cur.execute(f"ALTER TABLE agent_job ADD COLUMN {col} {spec}")
@@ -234,6 +367,13 @@ def main():
                 except pymysql.err.OperationalError as e:
                     if "Duplicate column name" not in str(e):
                         raise
+            # Runner lease taramaları için (is_running + lease_expires_at)
+            try:
+                cur.execute("ALTER TABLE agent_job ADD INDEX idx_running_lease (is_running, lease_expires_at)")
+                print("İndeks 'agent_job.idx_running_lease' eklendi.")
+            except pymysql.err.OperationalError as e:
+                if "Duplicate key name" not in str(e):
+                    raise
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS agent_log (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -247,6 +387,13 @@ def main():
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """)
             print("Tablo 'agent_log' hazır.")
+            # /ai/agent/status since_id imleci ve son log id'si için (user_id, id)
+            try:
+                cur.execute("ALTER TABLE agent_log ADD INDEX idx_user_id_id (user_id, id)")
+                print("İndeks 'agent_log.idx_user_id_id' eklendi.")
+            except pymysql.err.OperationalError as e:
+                if "Duplicate key name" not in str(e):
+                    raise
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS chat_usage (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -298,6 +445,24 @@ def main():
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """)
             print("Tablo 'demo_futures_trades' hazır.")
+            # Kapanış nedeni: manual, reverse, stop_loss, take_profit, liquidation
+            try:
+                cur.execute("ALTER TABLE demo_futures_trades ADD COLUMN close_reason VARCHAR(16) NULL")
+                print("Sütun 'demo_futures_trades.close_reason' eklendi.")
+            except pymysql.err.OperationalError as e:
+                if "Duplicate column name" not in str(e):
+                    raise
+            if args.partition:
+                from services.retention import ensure_future_partitions, partition_table_by_month
+
+                # Partition'lı tabloda FOREIGN KEY olamaz; PK (id, created_at) olur. Silinen kullanıcıların
+                # satırları CASCADE yerine retention ile temizlenir.
+                for table in ("agent_log", "agent_analyses"):
+                    if partition_table_by_month(cur, table):
+                        print(f"Tablo '{table}' aylık partition'lara çevrildi.")
+                    else:
+                        added = ensure_future_partitions(cur, table)
+                        print(f"Tablo '{table}' zaten partition'lı ({added} yeni ay eklendi).")
         conn.commit()
     finally:
         conn.close()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - Agent kararlarının ileri getiri değerlendirmesi.
+agent_analyses tablosundaki olgunlaşmış BUY/SELL kararlarını server-side cursor ile parça parça okur,
+yerel kline deposundaki 1m mumlarla birleştirip her ufuk (varsayılan 15m, 1h, 4h, 1d) için isabet oranı,
+ortalama getiri ve komisyon sonrası kenarı agent_decision_quality özet tablosuna ekler. Artımlıdır:
+kaldığı id'den devam eder, cron ile periyodik çalıştırılabilir.
+Kullanım: python scripts/evaluate_decisions.py [--horizons 15,60,240,1440] [--chunk-rows 5000] [--max-rows 0]
+          [--store-dir /var/lib/vox/klines] [--reset]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_db
+from services.decision_eval import DEFAULT_HORIZONS_MIN, EVAL_STATE_NAME, DecisionEvaluator
+from services.kline_store import KlineStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--horizons", default=",".join(str(h) for h in DEFAULT_HORIZONS_MIN), help="dakika, virgülle")
+    parser.add_argument("--chunk-rows", type=int, default=5000)
+    parser.add_argument("--max-rows", type=int, default=0, help="bu çalıştırmada en fazla satır (0 = hepsi)")
+    parser.add_argument("--store-dir", default="", help="KLINE_STORE_DIR yerine bu dizini kullan")
+    parser.add_argument("--reset", action="store_true", help="özet tabloyu boşaltıp baştan değerlendir")
+    args = parser.parse_args()
+
+    if args.reset:
+        with get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM agent_decision_quality")
+                cur.execute("DELETE FROM agent_decision_eval_state WHERE name = %s", (EVAL_STATE_NAME,))
+            conn.commit()
+        print("Özet tablo sıfırlandı.")
+    store = KlineStore(args.store_dir) if args.store_dir else None
+    evaluator = DecisionEvaluator(
+        store=store, horizons_min=tuple(int(h) for h in args.horizons.split(",") if h.strip()), chunk_rows=args.chunk_rows,
+    )
+    result = evaluator.run(max_rows=args.max_rows)
+    if result.get("skipped_locked"):
+        print("Başka bir değerlendirme çalışıyor, atlandı.")
+        return
+    print(f"{result['rows']} karar okundu ({result['chunks']} parça), {result['evaluated']} karar/ufuk değerlendirildi, "
+          f"{result['missing_candles']} eksik mum, {result['unavailable']} erişilemeyen sembol, {result['elapsed_sec']} s")
+
+
+if __name__ == "__main__":
+    main()
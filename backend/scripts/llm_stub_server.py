@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - Yerel LLM stub sunucusu (OpenAI uyumlu /chat/completions).
+Gerçek sağlayıcıya gitmeden /ai/chat ve agent döngüsünü (stream dahil) denemek içindir.
+Kullanım: python scripts/llm_stub_server.py [--port 8100] [--delay 0.05]
+Ardından .env: GLM5_BASE_URL=http://127.0.0.1:8100  (veya OPENAI_BASE_URL)
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="LLM stub")
+CHUNK_DELAY_SEC = 0.05
+REPLY = 'ACTION: HOLD\nREASON: Stub yanıtı - piyasa yatay, işlem yok.'
+
+
+def _usage(messages: list) -> dict:
+    prompt = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    completion = len(REPLY) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    usage = _usage(body.get("messages") or [])
+    if not body.get("stream"):
+        return {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    async def events():
+        for word in REPLY.split(" "):
+            chunk = {"id": "stub", "model": model, "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(CHUNK_DELAY_SEC)
+        yield f"data: {json.dumps({'id': 'stub', 'model': model, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    global CHUNK_DELAY_SEC
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--delay", type=float, default=0.05, help="stream parçaları arası bekleme (sn)")
+    args = parser.parse_args()
+    CHUNK_DELAY_SEC = args.delay
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Vox Trader - Binance API anahtarlarını yeni şifreleme anahtarıyla yeniden şifreler.
+Önce ENCRYPTION_KEY'i "yeni_anahtar,eski_anahtar" olarak ayarlayın (ilki şifreler, hepsi çözer); bu script
+binance_api_keys satırlarını parça parça okuyup yeni anahtarla yeniden yazar. Bittiğinde eski anahtar
+ENCRYPTION_KEY'den çıkarılabilir. Çözülen değerler değişmediği için çalışan sunucuyu durdurmak gerekmez.
+Kullanım: python scripts/rotate_encryption_key.py [--chunk-rows 500]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymysql
+
+from database import get_db
+from encryption import rotate_api_value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-rows", type=int, default=500)
+    args = parser.parse_args()
+    last_id = 0
+    rotated = failed = 0
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            while True:
+                cur.execute(
+                    "SELECT id, encrypted_api_key, encrypted_api_secret FROM binance_api_keys WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, args.chunk_rows),
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                updates = []
+                for r in rows:
+                    try:
+                        updates.append((
+                            rotate_api_value(r["encrypted_api_key"]), rotate_api_value(r["encrypted_api_secret"]),
+                            r["id"], r["encrypted_api_key"], r["encrypted_api_secret"],
+                        ))
+                    except Exception:
+                        failed += 1
+                        print(f"Satır {r['id']} çözülemedi (anahtar listede yok mu?), atlandı.")
+                if updates:
+                    # Only rows nobody re-saved meanwhile (a fresh PUT is already under the new key).
+                    cur.executemany(
+                        """UPDATE binance_api_keys SET encrypted_api_key = %s, encrypted_api_secret = %s
+                           WHERE id = %s AND encrypted_api_key = %s AND encrypted_api_secret = %s""",
+                        updates,
+                    )
+                conn.commit()
+                rotated += len(updates)
+                last_id = rows[-1]["id"]
+    print(f"{rotated} satır yeniden şifrelendi, {failed} satır atlandı.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# Vox Trader - Agent scheduler (deadline queue + bounded worker pool)
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class AgentScheduler:
+    """Runs agent cycles when they fall due.
+
+    Jobs live in a min-heap keyed by due time (last_run_at + interval_sec). A dispatcher thread
+    pops due jobs and hands them to a bounded thread pool, honouring a per-provider concurrency
+    cap. A user is never dispatched while their previous cycle is still running.
+
+    `load_jobs()` returns dicts with user_id, interval_sec, last_run_at (epoch seconds or None)
+    and provider; `run_cycle(user_id)` runs one cycle.
+    """
+
+    def __init__(
+        self,
+        load_jobs: Callable[[], list[dict]],
+        run_cycle: Callable[[int], None],
+        max_workers: int = 8,
+        provider_limits: dict[str, int] | None = None,
+        refresh_sec: float = 5.0,
+        lag_window: int = 512,
+    ):
+        self._load_jobs = load_jobs
+        self._run_cycle = run_cycle
+        self.max_workers = max(1, int(max_workers))
+        self.provider_limits = dict(provider_limits or {})
+        self.refresh_sec = float(refresh_sec)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._heap: list[tuple[float, int, int]] = []
+        self._seq = itertools.count()
+        self._jobs: dict[int, dict] = {}
+        self._running: set[int] = set()
+        self._provider_in_flight: dict[str, int] = {}
+        self._next_refresh = 0.0
+        self._lags: deque[float] = deque(maxlen=lag_window)
+        self._stats = {
+            "dispatched": 0,
+            "completed": 0,
+            "failed": 0,
+            "refresh_errors": 0,
+            "provider_throttled": 0,
+            "lag_max_ms": 0.0,
+        }
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent-worker")
+        self._thread = threading.Thread(target=self._loop, name="agent-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 5.0, drain_sec: float = 0.0) -> set[int]:
+        """Stop dispatching and wait up to `drain_sec` for running cycles; returns users still running."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        deadline = time.monotonic() + max(0.0, drain_sec)
+        with self._cond:
+            while self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            still_running = set(self._running)
+        self._thread = None
+        self._executor = None
+        return still_running
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wake(self) -> None:
+        """Reload jobs on the next dispatcher tick (e.g. after an agent was started)."""
+        with self._cond:
+            self._next_refresh = 0.0
+            self._cond.notify_all()
+
+    # --- scheduling ---
+
+    def _push_locked(self, user_id: int, due: float) -> None:
+        job = self._jobs[user_id]
+        job["due"] = due
+        heapq.heappush(self._heap, (due, next(self._seq), user_id))
+
+    def _refresh(self) -> None:
+        jobs = self._load_jobs()
+        now = time.time()
+        with self._cond:
+            seen = set()
+            for j in jobs:
+                uid = int(j["user_id"])
+                seen.add(uid)
+                interval = max(1, int(j.get("interval_sec") or 60))
+                last = j.get("last_run_at")
+                due = now if last is None else float(last) + interval
+                cur = self._jobs.get(uid)
+                if cur is None:
+                    self._jobs[uid] = {"interval": interval, "provider": j.get("provider") or "default", "due": due}
+                    self._push_locked(uid, due)
+                    continue
+                cur["interval"] = interval
+                cur["provider"] = j.get("provider") or "default"
+                if uid not in self._running and cur["due"] != due:
+                    self._push_locked(uid, due)
+            for uid in list(self._jobs):
+                if uid not in seen:
+                    del self._jobs[uid]
+
+    def _dispatch_due_locked(self, now: float) -> float | None:
+        """Dispatch every due job that fits the caps; return the next due time still queued."""
+        deferred = []
+        next_due = None
+        while self._heap:
+            due, seq, uid = self._heap[0]
+            job = self._jobs.get(uid)
+            if job is None or job["due"] != due or uid in self._running:
+                heapq.heappop(self._heap)
+                continue
+            if due > now:
+                next_due = due
+                break
+            if len(self._running) >= self.max_workers:
+                break
+            provider = job["provider"]
+            limit = self.provider_limits.get(provider)
+            if limit is not None and self._provider_in_flight.get(provider, 0) >= limit:
+                self._stats["provider_throttled"] += 1
+                deferred.append(heapq.heappop(self._heap))
+                continue
+            heapq.heappop(self._heap)
+            self._running.add(uid)
+            self._provider_in_flight[provider] = self._provider_in_flight.get(provider, 0) + 1
+            lag_ms = max(0.0, (now - due) * 1000.0)
+            self._lags.append(lag_ms)
+            if lag_ms > self._stats["lag_max_ms"]:
+                self._stats["lag_max_ms"] = lag_ms
+            self._stats["dispatched"] += 1
+            future = self._executor.submit(self._run, uid, provider, now)
+            future.add_done_callback(lambda f, uid=uid, provider=provider: self._cancelled(f, uid, provider))
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        return next_due
+
+    def _run(self, user_id: int, provider: str, started_at: float) -> None:
+        failed = False
+        try:
+            self._run_cycle(user_id)
+        except Exception:
+            failed = True
+        finally:
+            with self._cond:
+                self._running.discard(user_id)
+                self._provider_in_flight[provider] = max(0, self._provider_in_flight.get(provider, 1) - 1)
+                self._stats["failed" if failed else "completed"] += 1
+                job = self._jobs.get(user_id)
+                if job is not None:
+                    self._push_locked(user_id, started_at + job["interval"])
+                self._cond.notify_all()
+
+    def _cancelled(self, future, user_id: int, provider: str) -> None:
+        # A cycle cancelled by stop() before it started never reaches _run's cleanup.
+        if not future.cancelled():
+            return
+        with self._cond:
+            self._running.discard(user_id)
+            self._provider_in_flight[provider] = max(0, self._provider_in_flight.get(provider, 1) - 1)
+            self._cond.notify_all()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if time.time() >= self._next_refresh:
+                try:
+                    self._refresh()
+                except Exception:
+                    self._stats["refresh_errors"] += 1
+                with self._cond:
+                    self._next_refresh = time.time() + self.refresh_sec
+            with self._cond:
+                if self._stop.is_set():
+                    break
+                now = time.time()
+                next_due = self._dispatch_due_locked(now)
+                wake_at = self._next_refresh if next_due is None else min(next_due, self._next_refresh)
+                self._cond.wait(max(0.0, wake_at - now))
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            lags = sorted(self._lags)
+            out["jobs"] = len(self._jobs)
+            out["running"] = len(self._running)
+            out["provider_in_flight"] = dict(self._provider_in_flight)
+            out["max_workers"] = self.max_workers
+            out["lag_last_ms"] = round(self._lags[-1], 1) if self._lags else 0.0
+        out["lag_avg_ms"] = round(sum(lags) / len(lags), 1) if lags else 0.0
+        out["lag_p95_ms"] = round(lags[int(0.95 * (len(lags) - 1))], 1) if lags else 0.0
+        out["lag_max_ms"] = round(out["lag_max_ms"], 1)
+        return out
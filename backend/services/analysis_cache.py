@@ -0,0 +1,125 @@
+# Vox Trader - Shared agent market analysis (one LLM call per model/strategy/market/candle)
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from config import get_settings
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: dict | None = None
+        self.error: BaseException | None = None
+
+
+class SharedAnalysisCache:
+    """TTL + LRU cache of shared analyses with single-flight computation.
+
+    Agents with the same configuration ask for the same key within a candle; the first caller
+    (the leader) runs `compute()`, concurrent callers wait for it, later callers hit the cache.
+    `get_or_compute` returns (value, is_leader) so the caller can bill the leader in full and
+    followers as cached. A None result (failed call), or one `cacheable` rejects, is handed to
+    waiting callers but not cached.
+    """
+
+    def __init__(self, ttl_sec: float = 300.0, max_entries: int = 1024):
+        self.ttl_sec = float(ttl_sec)
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._payment = threading.Condition(self._lock)
+        self._entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[tuple, _Flight] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "evictions": 0}
+
+    def get_or_compute(
+        self, key: tuple, compute: Callable[[], dict | None], cacheable: Callable[[dict], bool] | None = None,
+    ) -> tuple[dict | None, bool]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1], False
+            if entry is not None:
+                del self._entries[key]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, False
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight.value is not None and (cacheable is None or cacheable(flight.value)):
+                    self._entries[key] = (time.monotonic() + self.ttl_sec, flight.value)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self._stats["evictions"] += 1
+            flight.event.set()
+        return flight.value, True
+
+    def pay_once(self, value: dict, pay: Callable[[], dict | None]) -> bool:
+        """Bill a value nobody paid for yet (`value["paid"]` false) through one caller at a time.
+
+        Returns False without calling `pay` once the value is paid, waiting while another caller's
+        `pay` runs. `pay` returns fields merged into the value on success, or None when the charge
+        failed, in which case the next waiting caller gets its turn. True when this caller paid or tried.
+        """
+        with self._payment:
+            while value.get("paying"):
+                self._payment.wait()
+            if value.get("paid"):
+                return False
+            value["paying"] = True
+        fields = None
+        try:
+            fields = pay()
+        finally:
+            with self._payment:
+                if fields is not None:
+                    value.update(fields)
+                    value["paid"] = True
+                value["paying"] = False
+                self._payment.notify_all()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+        return out
+
+
+_analysis_cache: SharedAnalysisCache | None = None
+_analysis_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> SharedAnalysisCache:
+    global _analysis_cache
+    if _analysis_cache is None:
+        with _analysis_cache_lock:
+            if _analysis_cache is None:
+                s = get_settings()
+                _analysis_cache = SharedAnalysisCache(
+                    ttl_sec=s.AGENT_SHARED_ANALYSIS_TTL_SEC, max_entries=s.AGENT_SHARED_ANALYSIS_MAX_ENTRIES
+                )
+    return _analysis_cache
@@ -0,0 +1,471 @@
+# Vox Trader - Backtesting of agent trade rules on historical klines (NumPy accounting, parallel sweeps)
+import itertools
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from services.futures_mtm import MAINTENANCE_MARGIN_RATE
+from services.kline_store import INTERVAL_MS
+
+# Same constants as the demo engine (routers.demo_router); kept here so sweep workers stay light.
+COMMISSION_RATE = 0.001
+FUTURES_COMMISSION_RATE = 0.0004
+INITIAL_DEMO_BALANCE = 10000.0
+
+# agent_job columns that drive _run_agent_cycle_sync, with their table defaults.
+DEFAULT_PARAMS = {
+    "market_type": "spot",
+    "order_amount": 100.0,
+    "order_amount_mode": "fixed",
+    "max_open_positions": 1,
+    "single_trade_if_max": True,
+    "min_trade_interval_sec": 0,
+    "leverage": 10,
+    "interval_sec": 60,
+}
+
+BUY, SELL, HOLD = 1, -1, 0
+
+
+def param_grid(base: dict | None = None, **axes) -> list[dict]:
+    """Cartesian product of `axes` (name -> values) over DEFAULT_PARAMS + base."""
+    params = {**DEFAULT_PARAMS, **(base or {})}
+    names = list(axes)
+    return [{**params, **dict(zip(names, combo))} for combo in itertools.product(*(axes[n] for n in names))]
+
+
+# --- signal sources ---
+# A source turns candles into (actions int8: BUY / SELL / HOLD, buy_at, sell_at float with NaN = none),
+# one entry per candle, decided at that candle's close. Dense sources emit on every candle and the
+# engine thins them to the agent's interval_sec; sparse ones (recorded, LLM) already carry a cadence.
+
+class RuleSignals:
+    """Deterministic stub: BUY while the fast SMA is `threshold` above the slow one, SELL while below.
+
+    Like the agent it repeats its view every cycle, so position limits and trade spacing matter.
+    Levels are `band` away from the close.
+    """
+
+    dense = True
+
+    def __init__(self, fast: int = 9, slow: int = 21, threshold: float = 0.001, band: float = 0.01):
+        self.fast, self.slow = int(fast), int(slow)
+        self.threshold, self.band = float(threshold), float(band)
+
+    def signals(self, candles: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        close = np.asarray(candles["close"], dtype=np.float64)
+        n = len(close)
+        actions = np.zeros(n, dtype=np.int8)
+        if n >= self.slow:
+            csum = np.concatenate(([0.0], np.cumsum(close)))
+            fast = (csum[self.fast:] - csum[:-self.fast]) / self.fast
+            slow = (csum[self.slow:] - csum[:-self.slow]) / self.slow
+            ratio = fast[self.slow - self.fast:] / slow  # candles slow-1 .. n-1
+            tail = actions[self.slow - 1:]
+            tail[ratio > 1 + self.threshold] = BUY
+            tail[ratio < 1 - self.threshold] = SELL
+        return actions, close * (1 - self.band), close * (1 + self.band)
+
+
+def _decision_index(candles: np.ndarray, interval: str, times_ms: np.ndarray) -> np.ndarray:
+    """Index of the last candle closed at each time (-1 before the first close)."""
+    closes = np.asarray(candles["open_time"], dtype=np.int64) + INTERVAL_MS[interval]
+    return np.searchsorted(closes, times_ms, side="right") - 1
+
+
+class RecordedSignals:
+    """Stored agent_analyses decisions placed on the last candle closed when each was made.
+
+    Rows carry `created_ts` (Unix seconds), as selected by from_db.
+    """
+
+    dense = False
+
+    def __init__(self, interval: str, rows: list[dict]):
+        self.interval = interval
+        self.rows = rows
+
+    @classmethod
+    def from_db(cls, symbol: str, interval: str, strategy: str | None = None, model: str | None = None,
+                user_id: int | None = None, start=None, end=None) -> "RecordedSignals":
+        import pymysql
+        from database import get_db
+
+        where, args = ["symbol = %s", "`interval` = %s"], [symbol.upper(), interval]
+        for col, val in (("strategy", strategy), ("model", model), ("user_id", user_id)):
+            if val is not None:
+                where.append(f"{col} = %s")
+                args.append(val)
+        if start is not None:
+            where.append("created_at >= %s")
+            args.append(start)
+        if end is not None:
+            where.append("created_at < %s")
+            args.append(end)
+        with get_db() as conn:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                # UNIX_TIMESTAMP() reads the DATETIME in the session zone NOW() wrote it in.
+                cur.execute(
+                    f"SELECT UNIX_TIMESTAMP(created_at) AS created_ts, action, buy_at, sell_at FROM agent_analyses WHERE {' AND '.join(where)} ORDER BY created_at",
+                    tuple(args),
+                )
+                return cls(interval, cur.fetchall())
+
+    def signals(self, candles: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = len(candles)
+        actions = np.zeros(n, dtype=np.int8)
+        buy_at = np.full(n, np.nan)
+        sell_at = np.full(n, np.nan)
+        if not self.rows or not n:
+            return actions, buy_at, sell_at
+        times = np.array([int(r["created_ts"]) * 1000 for r in self.rows], dtype=np.int64)
+        idx = _decision_index(candles, self.interval, times)
+        for i, r in zip(idx.tolist(), self.rows):
+            if 0 <= i < n and r["action"] in ("BUY", "SELL"):  # the latest BUY/SELL on a candle wins
+                actions[i] = BUY if r["action"] == "BUY" else SELL
+                buy_at[i] = float(r["buy_at"]) if r["buy_at"] is not None else np.nan
+                sell_at[i] = float(r["sell_at"]) if r["sell_at"] is not None else np.nan
+        return actions, buy_at, sell_at
+
+
+class CachedLLMSignals:
+    """An agent model asked about the chart every `every` candles, answers cached in a JSON-lines file.
+
+    The prompt is the live agent's (strategy text, no portfolio context, no custom prompt) over the
+    last `window` candles, so re-running a sweep or another parameter set costs no LLM calls.
+    """
+
+    dense = False
+
+    def __init__(self, model_id: str, strategy: str, symbol: str, interval: str, cache_path: str,
+                 market_type: str = "spot", window: int = 100, every: int = 1):
+        self.model_id, self.strategy, self.market_type = model_id, strategy, market_type
+        self.symbol, self.interval = symbol.upper(), interval
+        self.cache_path = cache_path
+        self.window, self.every = int(window), max(1, int(every))
+        self._cache: dict[str, dict] = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        item = json.loads(line)
+                        self._cache[item["key"]] = item
+
+    def _key(self, open_time: int) -> str:
+        return f"{self.model_id}|{self.strategy}|{self.market_type}|{self.symbol}|{self.interval}|{open_time}"
+
+    def _ask(self, ohlc: np.ndarray) -> dict | None:
+        from routers.ai_router import _agent_user_content, _parse_agent_response, _request_agent_completion
+        from services.chart_render import render_candlestick_base64
+
+        image = render_candlestick_base64(ohlc, self.symbol)
+        content = _agent_user_content(self.symbol, self.interval, self.strategy, "", self.market_type, "")
+        result = _request_agent_completion(self.model_id, content, image)
+        if result is None:
+            return None
+        parsed = _parse_agent_response(result[0])
+        return {"action": parsed.action, "buy_at": parsed.buy_at, "sell_at": parsed.sell_at, "usage": result[1]}
+
+    def signals(self, candles: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = len(candles)
+        actions = np.zeros(n, dtype=np.int8)
+        buy_at = np.full(n, np.nan)
+        sell_at = np.full(n, np.nan)
+        ohlc = np.column_stack([candles["open"], candles["high"], candles["low"], candles["close"]]).astype(np.float64)
+        open_times = candles["open_time"].tolist()
+        with open(self.cache_path, "a", encoding="utf-8") as out:
+            for i in range(self.window - 1, n, self.every):
+                key = self._key(open_times[i])
+                item = self._cache.get(key)
+                if item is None:
+                    answer = self._ask(ohlc[i - self.window + 1: i + 1])
+                    if answer is None:
+                        continue  # failed calls are retried on the next run
+                    item = self._cache[key] = {"key": key, **answer}
+                    out.write(json.dumps(item) + "\n")
+                    out.flush()
+                if item["action"] in ("BUY", "SELL"):
+                    actions[i] = BUY if item["action"] == "BUY" else SELL
+                buy_at[i] = item["buy_at"] if item.get("buy_at") is not None else np.nan
+                sell_at[i] = item["sell_at"] if item.get("sell_at") is not None else np.nan
+        return actions, buy_at, sell_at
+
+
+# --- simulation ---
+
+def _trigger_levels(sign: float, qty: float, entry: float, margin: float,
+                    sl: float | None, tp: float | None) -> list[tuple[str, float, bool]]:
+    """(kind, level, below) of a position in trigger-engine priority order; below fires at low <= level."""
+    long = sign > 0
+    liq = max(0.0, (sign * entry * qty - margin) / (qty * (sign - MAINTENANCE_MARGIN_RATE)))
+    out = [("liquidation", liq, long)] if liq > 0 else []
+    if sl:
+        out.append(("stop_loss", sl, long))
+    if tp:
+        out.append(("take_profit", tp, not long))
+    return out
+
+
+def _first_trigger(low: np.ndarray, high: np.ndarray, start: int, end: int,
+                   levels: list[tuple[str, float, bool]]) -> tuple[int, str, float] | None:
+    """(candle, kind, price) of the first level crossed in candles start..end.
+
+    Several levels crossed within one candle resolve liquidation > stop-loss > take-profit.
+    """
+    best = None
+    for kind, level, below in levels:
+        chunk = low[start: end + 1] if below else high[start: end + 1]
+        mask = chunk <= level if below else chunk >= level
+        if mask.any():
+            j = start + int(mask.argmax())
+            if best is None or j < best[0]:
+                best = (j, kind, level)
+    return best
+
+
+def simulate(candles: np.ndarray, actions: np.ndarray, buy_at: np.ndarray, sell_at: np.ndarray,
+             params: dict, dense: bool = True, initial_balance: float = INITIAL_DEMO_BALANCE,
+             interval: str = "1m", with_equity: bool = False) -> dict:
+    """Replay one agent_job configuration over candles with the live order rules.
+
+    Decisions fill at the decision candle's close. Spot: BUY spends order_amount (or the whole
+    balance in max mode), SELL sells the whole holding, 0.1% commission. Futures: max open positions
+    per side, min_trade_interval_sec since the newest same-side open position, opposite positions
+    reversed at the fill, margin capped to 1..10000 and leverage to 1..125, the analysis exit level
+    as stop or target, 0.04% commission on close, liquidation forfeiting the margin. The equity
+    curve and drawdown are computed vectorized from the resulting cash/position ledger.
+    """
+    p = {**DEFAULT_PARAMS, **params}
+    close = np.asarray(candles["close"], dtype=np.float64)
+    low = np.asarray(candles["low"], dtype=np.float64)
+    high = np.asarray(candles["high"], dtype=np.float64)
+    open_time = np.asarray(candles["open_time"], dtype=np.int64)
+    n = len(close)
+    steps = np.flatnonzero(actions)
+    if dense:
+        stride = max(1, int(round(float(p["interval_sec"]) * 1000 / INTERVAL_MS[interval])))
+        steps = steps[steps % stride == 0]
+    max_mode = (p["order_amount_mode"] or "fixed").lower() == "max"
+    single_if_max = bool(p["single_trade_if_max"])
+    futures = p["market_type"] == "futures"
+    stats = {"orders": 0, "closed": 0, "wins": 0, "commission_usdt": 0.0, "skipped": 0, "failed": 0,
+             "liquidation": 0, "stop_loss": 0, "take_profit": 0, "reverse": 0}
+    cash = float(initial_balance)
+    cash_idx, cash_val = [0], [cash]  # cash after all events of each candle (last write wins)
+    # Linear equity terms per open holding over [start, end): a + b * close[t].
+    terms: list[tuple[int, int, float, float]] = []
+    used = False
+
+    def book(i: int) -> None:
+        if cash_idx[-1] == i:
+            cash_val[-1] = cash
+        else:
+            cash_idx.append(i)
+            cash_val.append(cash)
+
+    if not futures:
+        qty = cost = 0.0
+        held_from = 0
+        for i in steps.tolist():
+            if max_mode and single_if_max and used:
+                break
+            price = close[i]
+            if actions[i] == BUY:
+                spend = cash if max_mode else float(p["order_amount"] or 100)
+                if max_mode and spend <= 0:
+                    stats["skipped"] += 1
+                    continue
+                if spend <= 0 or cash < spend:
+                    stats["failed"] += 1
+                    continue
+                commission = spend * COMMISSION_RATE
+                if qty > 0:
+                    terms.append((held_from, i, 0.0, qty))
+                qty += spend * (1 - COMMISSION_RATE) / price
+                cost += spend
+                held_from = i
+                cash -= spend
+            else:
+                if qty <= 0:
+                    stats["failed"] += 1
+                    continue
+                gross = qty * price
+                commission = gross * COMMISSION_RATE
+                credit = gross - commission
+                terms.append((held_from, i, 0.0, qty))
+                stats["closed"] += 1
+                stats["wins"] += int(credit > cost)
+                qty = cost = 0.0
+                cash += credit
+            stats["orders"] += 1
+            stats["commission_usdt"] += commission
+            book(i)
+            if max_mode and single_if_max:
+                used = True
+        if qty > 0:
+            terms.append((held_from, n, 0.0, qty))
+    else:
+        ims_sec = INTERVAL_MS[interval] / 1000.0
+        max_open = max(1, min(50, int(p["max_open_positions"] or 1)))
+        min_gap = max(0, min(86400, int(p["min_trade_interval_sec"] or 0)))
+        leverage = max(1, min(125, int(p["leverage"] or 10)))
+        open_pos: list[dict] = []
+        # Low / high of the candles since the previous decision, so most trigger checks are float compares.
+        starts = np.concatenate(([0], steps[:-1] + 1)) if len(steps) else np.zeros(0, dtype=np.int64)
+        seg_low = np.minimum.reduceat(low, starts).tolist() if len(steps) else []
+        seg_high = np.maximum.reduceat(high, starts).tolist() if len(steps) else []
+
+        def settle(pos: dict, i: int, kind: str, price: float) -> None:
+            nonlocal cash
+            if kind == "liquidation":
+                pnl, commission = -pos["margin"], 0.0
+            else:
+                pnl = pos["sign"] * (price - pos["entry"]) * pos["qty"]
+                commission = pos["qty"] * price * FUTURES_COMMISSION_RATE
+            cash += pos["margin"] + pnl - commission
+            stats["closed"] += 1
+            stats["wins"] += int(pnl - commission > 0)
+            stats["commission_usdt"] += commission
+            stats[kind] += 1
+            terms.append((pos["open"], i, pos["margin"] - pos["sign"] * pos["qty"] * pos["entry"], pos["sign"] * pos["qty"]))
+            book(i)
+
+        def run_triggers(start: int, end: int, lo: float | None = None, hi: float | None = None) -> None:
+            """Close positions whose levels were crossed in candles start..end, in candle order."""
+            hits = []
+            for pos in open_pos:
+                if lo is not None and not any(lo <= lvl if below else hi >= lvl for _, lvl, below in pos["levels"]):
+                    continue
+                hit = _first_trigger(low, high, max(start, pos["open"] + 1), end, pos["levels"])
+                if hit is not None:
+                    hits.append((hit, pos))
+            for (j, kind, price), pos in sorted(hits, key=lambda h: h[0][0]):
+                open_pos.remove(pos)
+                settle(pos, j, kind, price)
+
+        last = -1
+        for k, i in enumerate(steps.tolist()):
+            if open_pos:
+                run_triggers(last + 1, i, seg_low[k], seg_high[k])
+            last = i
+            if max_mode and single_if_max and used:
+                break
+            price = close[i]
+            sign = 1.0 if actions[i] == BUY else -1.0
+            same = [p_ for p_ in open_pos if p_["sign"] == sign]
+            if len(same) >= max_open:
+                stats["skipped"] += 1
+                continue
+            if min_gap and same and (i - max(p_["open"] for p_ in same)) * ims_sec < min_gap:
+                stats["skipped"] += 1
+                continue
+            amount = cash if max_mode else float(p["order_amount"] or 100)
+            if max_mode and amount <= 0:
+                stats["skipped"] += 1
+                continue
+            margin = max(1.0, min(10000.0, amount))
+            exit_level = sell_at[i] if sign > 0 else buy_at[i]
+            sl = tp = None
+            if exit_level > 0 and exit_level != price:  # NaN compares False
+                if (exit_level > price) == (sign > 0):
+                    tp = float(exit_level)
+                else:
+                    sl = float(exit_level)
+            for pos in [p_ for p_ in open_pos if p_["sign"] != sign]:
+                open_pos.remove(pos)
+                settle(pos, i, "reverse", price)
+            if cash < margin:
+                stats["failed"] += 1
+                continue
+            qty = margin * leverage / price
+            cash -= margin
+            book(i)
+            open_pos.append({
+                "sign": sign, "qty": qty, "entry": price, "margin": margin, "open": i,
+                "levels": _trigger_levels(sign, qty, price, margin, sl, tp),
+            })
+            stats["orders"] += 1
+            if max_mode and single_if_max:
+                used = True
+        if open_pos and last + 1 < n:
+            run_triggers(last + 1, n - 1)
+        for pos in open_pos:
+            terms.append((pos["open"], n, pos["margin"] - pos["sign"] * pos["qty"] * pos["entry"], pos["sign"] * pos["qty"]))
+
+    # Equity at each close: piecewise-constant cash + sum of open holdings' linear terms.
+    cash_series = np.asarray(cash_val)[np.searchsorted(np.asarray(cash_idx), np.arange(n), side="right") - 1]
+    a = np.zeros(n + 1)
+    b = np.zeros(n + 1)
+    if terms:
+        ts, te, ta, tb = (np.asarray(col) for col in zip(*terms))
+        np.add.at(a, ts, ta)
+        np.add.at(a, te, -ta)
+        np.add.at(b, ts, tb)
+        np.add.at(b, te, -tb)
+    equity = cash_series + np.cumsum(a)[:n] + np.cumsum(b)[:n] * close
+    peak = np.maximum.accumulate(equity) if n else equity
+    drawdown = float(np.max(1.0 - equity / peak)) if n else 0.0
+    final = float(equity[-1]) if n else float(initial_balance)
+    out = {
+        **stats,
+        "commission_usdt": round(stats["commission_usdt"], 2),
+        "final_equity": round(final, 2),
+        "return_pct": round((final / initial_balance - 1.0) * 100.0, 3),
+        "max_drawdown_pct": round(drawdown * 100.0, 3),
+        "win_rate": round(stats["wins"] / stats["closed"], 4) if stats["closed"] else None,
+        "first_open_time": int(open_time[0]) if n else None,
+        "last_open_time": int(open_time[-1]) if n else None,
+    }
+    if with_equity:
+        out["equity"] = equity
+    return out
+
+
+# --- parallel sweeps ---
+
+_worker_data: dict = {}
+
+
+def _init_worker(candles: np.ndarray, signals: tuple, dense: bool, interval: str, initial_balance: float) -> None:
+    _worker_data.update(candles=candles, signals=signals, dense=dense, interval=interval, initial_balance=initial_balance)
+
+
+def _run_chunk(chunk: list[dict]) -> list[dict]:
+    d = _worker_data
+    return [
+        {**params, **simulate(d["candles"], *d["signals"], params, dense=d["dense"], interval=d["interval"],
+                              initial_balance=d["initial_balance"])}
+        for params in chunk
+    ]
+
+
+def run_sweep(candles: np.ndarray, source, grid: list[dict], interval: str, workers: int = 0,
+              initial_balance: float = INITIAL_DEMO_BALANCE, chunk_size: int = 0) -> list[dict]:
+    """Simulate every parameter set of `grid` against one signal series.
+
+    Signals are computed once in the caller (LLM / DB sources stay here); candles and signals are
+    shipped once per worker process, then only parameter chunks travel. workers=0 runs in-process.
+    """
+    candles = np.ascontiguousarray(candles)  # a memmap view becomes one in-memory copy
+    signals = source.signals(candles)
+    dense = bool(getattr(source, "dense", True))
+    if workers <= 0 or len(grid) < 2:
+        _init_worker(candles, signals, dense, interval, initial_balance)
+        return _run_chunk(grid)
+    chunk_size = chunk_size or max(1, math.ceil(len(grid) / (workers * 4)))
+    chunks = [grid[i: i + chunk_size] for i in range(0, len(grid), chunk_size)]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(candles, signals, dense, interval, initial_balance),
+    ) as pool:
+        results = []
+        for part in pool.map(_run_chunk, chunks):
+            results.extend(part)
+    return results
+
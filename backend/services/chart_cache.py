@@ -0,0 +1,138 @@
+# Vox Trader - Shared rendered-chart cache (symbol, interval, last closed candle)
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from config import get_settings
+from services.chart_render import fetch_closed_klines, fetch_klines
+from services.kline_store import INTERVAL_MS, SETTLE_MS, KlineStore
+from services.render_pool import render_chart_base64
+
+
+def current_candle_open_ms(interval: str, now_ms: int | None = None) -> int | None:
+    """Open time of the candle forming SETTLE_MS ago, or None for intervals the kline store does not align.
+
+    Cached charts end right before this candle. Keying on it only once SETTLE_MS has passed since
+    the close gives Binance time to publish the final row of the candle that just closed.
+    """
+    if interval not in INTERVAL_MS:
+        return None
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    return KlineStore.slot_time(interval, KlineStore.slot(interval, now_ms - SETTLE_MS))
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: str | None = None
+        self.error: BaseException | None = None
+
+
+class ChartCache:
+    """LRU cache of rendered agent charts bounded by total bytes.
+
+    Agents watching the same market within the same candle share one kline fetch and one
+    render. Cached charts show closed candles only and are keyed by the open time of the last
+    closed one, so every hit is identical to a fresh render and a new entry is produced once per
+    candle close. Intervals the kline store does not align (1s, 3d, 1M) are rendered live,
+    forming candle included, and not cached. Concurrent misses for the same key wait for a single build.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        fetch: Callable[[str, str, int, int], list] = fetch_closed_klines,
+        render: Callable[[list, str], str] = render_chart_base64,
+        fetch_live: Callable[[str, str, int], list] = fetch_klines,
+    ):
+        self.max_bytes = int(max_bytes)
+        self._fetch = fetch
+        self._fetch_live = fetch_live
+        self._render = render
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, str] = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[tuple, _Flight] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "uncacheable": 0, "errors": 0}
+
+    def _build(self, symbol: str, interval: str, limit: int, before_ms: int) -> str:
+        return self._render(self._fetch(symbol, interval, limit, before_ms), symbol)
+
+    def get_chart_base64(self, symbol: str, interval: str, limit: int = 100) -> str:
+        symbol = symbol.upper()
+        candle = current_candle_open_ms(interval)
+        if candle is None:
+            with self._lock:
+                self._stats["uncacheable"] += 1
+            return self._render(self._fetch_live(symbol, interval, limit), symbol)
+        key = (symbol, interval, limit, candle - INTERVAL_MS[interval])
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = self._build(symbol, interval, limit, candle)
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight.value is not None:
+                    self._store_locked(key, flight.value)
+            flight.event.set()
+        return flight.value
+
+    def _store_locked(self, key: tuple, value: str) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = value
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+            out["bytes"] = self._bytes
+            out["max_bytes"] = self.max_bytes
+        return out
+
+
+_chart_cache: ChartCache | None = None
+_chart_cache_lock = threading.Lock()
+
+
+def get_chart_cache() -> ChartCache:
+    global _chart_cache
+    if _chart_cache is None:
+        with _chart_cache_lock:
+            if _chart_cache is None:
+                _chart_cache = ChartCache(max_bytes=get_settings().CHART_CACHE_MAX_BYTES)
+    return _chart_cache
@@ -1,13 +1,40 @@
 # Vox Trader - Agent background chart (Binance klines -> PNG base64)
 import base64
 import io
+import threading
+
 import httpx
+import matplotlib
+
+matplotlib.use("Agg")
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+from services.market_stream import get_market_stream
+from services.kline_store import KlineFetchError, get_kline_store
 
 BINANCE_BASE = "https://api.binance.com"
 
 
-def fetch_klines(symbol: str, interval: str, limit: int = 100) -> list[list[float]]:
-    """Fetch OHLC klines from Binance. Each item is [open, high, low, close] (float)."""
+def fetch_raw_klines(symbol: str, interval: str, limit: int = 100) -> list[list]:
+    """Fetch the last `limit` klines in Binance REST layout (the last one is usually still open).
+
+    Served from the live WebSocket buffer when the market stream has enough fresh candles,
+    then from the local kline store (closed candles on disk, only the open one fetched).
+    """
+    stream = get_market_stream()
+    if stream is not None:
+        live = stream.get_raw_klines(symbol, interval, limit, track=True)
+        if live is not None:
+            return live
+    store = get_kline_store()
+    if store is not None and store.supports(interval):
+        try:
+            return store.get_latest(symbol, interval, limit)
+        except KlineFetchError as e:
+            raise ValueError(str(e))
     with httpx.Client(timeout=10.0) as client:
         r = client.get(
             f"{BINANCE_BASE}/api/v3/klines",
@@ -15,64 +42,113 @@ def fetch_klines(symbol: str, interval: str, limit: int = 100) -> list[list[floa
         )
     if r.status_code != 200:
         raise ValueError(f"Failed to fetch klines: {r.status_code}")
-    data = r.json()
-    return [
-        [float(c[1]), float(c[2]), float(c[3]), float(c[4])]
-        for c in data
-    ]
+    return r.json()
 
 
-def render_candlestick_base64(klines: list[list[float]], title: str = "BTCUSDT") -> str:
-    """Render candlestick chart from OHLC list and return PNG base64. Dark theme matches frontend."""
-    import matplotlib
-    matplotlib.use("Agg")
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    from matplotlib.patches import Rectangle
-    from matplotlib.collections import LineCollection
-    import numpy as np
-
-    if not klines:
-        raise ValueError("Klines are empty")
+def _ohlc(rows: list[list]) -> list[list[float]]:
+    return [[float(c[1]), float(c[2]), float(c[3]), float(c[4])] for c in rows]
 
-    n = len(klines)
-    opens = np.array([k[0] for k in klines])
-    highs = np.array([k[1] for k in klines])
-    lows = np.array([k[2] for k in klines])
-    closes = np.array([k[3] for k in klines])
-
-    fig, ax = plt.subplots(figsize=(8, 4), facecolor="#18181b")
-    ax.set_facecolor("#18181b")
-    ax.tick_params(colors="#a1a1aa", labelsize=8)
-    ax.spines["bottom"].set_color("#3f3f46")
-    ax.spines["top"].set_color("#3f3f46")
-    ax.spines["left"].set_color("#3f3f46")
-    ax.spines["right"].set_color("#3f3f46")
-    ax.set_title(title, color="#e4e4e7", fontsize=10)
-
-    x = np.arange(n)
-    width = 0.6
-    for i in range(n):
-        o, h, l, c = opens[i], highs[i], lows[i], closes[i]
-        color = "#22c55e" if c >= o else "#ef4444"
-        # Wick
-        ax.plot([i, i], [l, h], color=color, linewidth=0.8, solid_capstyle="round")
-        # Body
-        body_bottom = min(o, c)
-        body_height = abs(c - o)
-        if body_height < 1e-12:
-            body_height = (h - l) * 0.01 if h != l else 1e-12
-        ax.add_patch(
-            Rectangle((i - width / 2, body_bottom), width, body_height, facecolor=color, edgecolor=color)
-        )
 
+def fetch_klines(symbol: str, interval: str, limit: int = 100) -> list[list[float]]:
+    """Fetch OHLC klines from Binance. Each item is [open, high, low, close] (float)."""
+    return _ohlc(fetch_raw_klines(symbol, interval, limit))
+
+
+def fetch_closed_klines(symbol: str, interval: str, limit: int, before_ms: int) -> list[list[float]]:
+    """OHLC of the last `limit` candles opened before `before_ms` (the forming candle is left out).
+
+    Two extra rows cover the settle window, when `before_ms` is the just-closed candle.
+    """
+    rows = fetch_raw_klines(symbol, interval, limit + 2)
+    return _ohlc([c for c in rows if int(c[0]) < before_ms][-limit:])
+
+
+# Dark theme (matches frontend)
+BG_COLOR = "#18181b"
+TEXT_COLOR = "#a1a1aa"
+TITLE_COLOR = "#e4e4e7"
+SPINE_COLOR = "#3f3f46"
+UP_COLOR = "#22c55e"
+DOWN_COLOR = "#ef4444"
+BODY_WIDTH = 0.6
+
+_local = threading.local()
+
+
+def _get_canvas():
+    """Per-thread reusable figure with empty wick/body collections (pyplot is not thread-safe)."""
+    cached = getattr(_local, "canvas", None)
+    if cached is not None:
+        return cached
+    fig = Figure(figsize=(8, 4), facecolor=BG_COLOR)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    ax.set_facecolor(BG_COLOR)
+    ax.tick_params(colors=TEXT_COLOR, labelsize=8)
+    for side in ("bottom", "top", "left", "right"):
+        ax.spines[side].set_color(SPINE_COLOR)
+    ax.xaxis.set_major_locator(MaxNLocator(8))
+    wicks = LineCollection([], linewidths=0.8, capstyle="round")
+    bodies = PolyCollection([], linewidths=0.5)
+    ax.add_collection(wicks)
+    ax.add_collection(bodies)
+    _local.canvas = (fig, ax, wicks, bodies)
+    return _local.canvas
+
+
+def candlestick_geometry(ohlc: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Wick segments (n, 2, 2), body quads (n, 4, 2) and up-candle mask for an (n, 4) OHLC array."""
+    n = len(ohlc)
+    opens, highs, lows, closes = ohlc[:, 0], ohlc[:, 1], ohlc[:, 2], ohlc[:, 3]
+    x = np.arange(n, dtype=float)
+    up = closes >= opens
+    wicks = np.empty((n, 2, 2))
+    wicks[:, 0, 0] = x
+    wicks[:, 1, 0] = x
+    wicks[:, 0, 1] = lows
+    wicks[:, 1, 1] = highs
+    bottom = np.minimum(opens, closes)
+    height = np.abs(closes - opens)
+    # Doji: give the body a sliver of height so it stays visible
+    flat = height < 1e-12
+    height = np.where(flat, np.where(highs != lows, (highs - lows) * 0.01, 1e-12), height)
+    left = x - BODY_WIDTH / 2
+    right = x + BODY_WIDTH / 2
+    top = bottom + height
+    bodies = np.empty((n, 4, 2))
+    bodies[:, 0] = np.column_stack((left, bottom))
+    bodies[:, 1] = np.column_stack((left, top))
+    bodies[:, 2] = np.column_stack((right, top))
+    bodies[:, 3] = np.column_stack((right, bottom))
+    return wicks, bodies, up
+
+
+def render_candlestick_png(klines, title: str = "BTCUSDT") -> bytes:
+    """Render candlestick chart from OHLC rows (list or (n, 4) array) and return PNG bytes."""
+    ohlc = np.asarray(klines, dtype=float)
+    if ohlc.size == 0:
+        raise ValueError("Klines are empty")
+    ohlc = ohlc.reshape(-1, 4)
+    n = len(ohlc)
+    wick_segs, body_quads, up = candlestick_geometry(ohlc)
+    colors = np.where(up, UP_COLOR, DOWN_COLOR)
+
+    fig, ax, wicks, bodies = _get_canvas()
+    wicks.set_segments(wick_segs)
+    wicks.set_color(colors)
+    bodies.set_verts(body_quads)
+    bodies.set_facecolor(colors)
+    bodies.set_edgecolor(colors)
+    ax.set_title(title, color=TITLE_COLOR, fontsize=10)
     ax.set_xlim(-0.5, n - 0.5)
-    ax.set_ylim(lows.min() * 0.998, highs.max() * 1.002)
-    ax.xaxis.set_major_locator(plt.MaxNLocator(8))
+    ax.set_ylim(ohlc[:, 2].min() * 0.998, ohlc[:, 1].max() * 1.002)
     fig.tight_layout(pad=0.5)
 
     buf = io.BytesIO()
-    fig.savefig(buf, format="png", dpi=100, bbox_inches="tight", facecolor="#18181b", edgecolor="none")
-    plt.close(fig)
-    buf.seek(0)
-    return base64.b64encode(buf.read()).decode("ascii")
+    fig.savefig(buf, format="png", dpi=100, facecolor=BG_COLOR, edgecolor="none")
+    return buf.getvalue()
+
+
+def render_candlestick_base64(klines, title: str = "BTCUSDT") -> str:
+    """Render candlestick chart from OHLC list and return PNG base64. Dark theme matches frontend."""
+    return base64.b64encode(render_candlestick_png(klines, title)).decode("ascii")
@@ -0,0 +1,85 @@
+# Vox Trader - Short-TTL cache of decrypted Binance API credentials
+import threading
+import time
+from collections import OrderedDict
+
+from config import get_settings
+
+
+class CredentialCache:
+    """Per-user (api_key, api_secret) for `ttl_sec`, at most `max_entries` users (LRU).
+
+    Saves the DB round trip and two Fernet decryptions on every signed Binance call. Writers
+    call invalidate(user_id) after changing the row; other API processes see the change once
+    their entry expires, so the TTL bounds cross-process staleness. Missing keys are not cached.
+    A load that started before an invalidation is not stored (epoch check), so a slow reader
+    cannot put the old credentials back.
+    """
+
+    def __init__(self, ttl_sec: float = 60.0, max_entries: int = 10000, clock=time.monotonic):
+        self.ttl_sec = float(ttl_sec)
+        self.max_entries = max(1, int(max_entries))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, tuple[float, tuple[str, str]]] = OrderedDict()
+        self._epoch = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evicted": 0}
+
+    def get(self, user_id: int) -> tuple[str, str] | None:
+        if self.ttl_sec <= 0:
+            return None
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self._stats["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self._stats["misses"] += 1
+        return None
+
+    def epoch(self) -> int:
+        """Take before loading; pass to put()."""
+        with self._lock:
+            return self._epoch
+
+    def put(self, user_id: int, credentials: tuple[str, str], epoch: int) -> None:
+        if self.ttl_sec <= 0:
+            return
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[user_id] = (self._clock() + self.ttl_sec, credentials)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._epoch += 1
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+        out["ttl_sec"] = self.ttl_sec
+        return out
+
+
+_credential_cache: CredentialCache | None = None
+_credential_cache_lock = threading.Lock()
+
+
+def get_credential_cache() -> CredentialCache:
+    global _credential_cache
+    if _credential_cache is None:
+        with _credential_cache_lock:
+            if _credential_cache is None:
+                s = get_settings()
+                _credential_cache = CredentialCache(s.BINANCE_CREDENTIALS_CACHE_TTL_SEC, s.BINANCE_CREDENTIALS_CACHE_MAX_ENTRIES)
+    return _credential_cache
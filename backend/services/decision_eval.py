@@ -0,0 +1,211 @@
+# Vox Trader - Forward-return evaluation of stored agent decisions (streamed, incremental summary table)
+import time
+
+import numpy as np
+import pymysql
+
+from database import get_connection, get_db
+from services.backtest import COMMISSION_RATE, FUTURES_COMMISSION_RATE
+from services.kline_store import KlineFetchError, get_kline_store
+
+# Only one evaluator run at a time across processes (MySQL named lock).
+EVAL_LOCK_NAME = "vox_trader_decision_eval"
+EVAL_STATE_NAME = "agent_analyses"
+
+# Forward horizons in minutes; prices come from 1m candles so every decision interval shares them.
+DEFAULT_HORIZONS_MIN = (15, 60, 240, 1440)
+_MIN_MS = 60_000
+
+# Round-trip commission as a fraction of notional (open + close at the demo engine rates).
+ROUND_TRIP_COST = {"spot": 2 * COMMISSION_RATE, "futures": 2 * FUTURES_COMMISSION_RATE}
+
+
+def horizon_label(minutes: int) -> str:
+    if minutes % 1440 == 0:
+        return f"{minutes // 1440}d"
+    if minutes % 60 == 0:
+        return f"{minutes // 60}h"
+    return f"{minutes}m"
+
+
+def forward_returns(open_time: np.ndarray, close: np.ndarray, times_ms: np.ndarray,
+                    horizons_min: tuple[int, ...]) -> np.ndarray:
+    """Return of the 1m close `h` minutes after each decision, per (decision, horizon); NaN when a candle is missing.
+
+    The entry is the close of the last 1m candle closed at the decision time.
+    """
+    out = np.full((len(times_ms), len(horizons_min)), np.nan)
+    if not len(open_time) or not len(times_ms):
+        return out
+    entry = np.searchsorted(open_time + _MIN_MS, times_ms, side="right") - 1
+    # The entry candle must be the one just before the decision (no gap in the stored series).
+    ok = (entry >= 0) & (open_time[np.maximum(entry, 0)] + 2 * _MIN_MS > times_ms)
+    entry_open = open_time[np.maximum(entry, 0)]
+    entry_close = close[np.maximum(entry, 0)]
+    for k, h in enumerate(horizons_min):
+        target = entry_open + h * _MIN_MS
+        j = np.minimum(np.searchsorted(open_time, target), len(open_time) - 1)
+        hit = ok & (open_time[j] == target)
+        out[hit, k] = close[j[hit]] / entry_close[hit] - 1.0
+    return out
+
+
+class DecisionEvaluator:
+    """Streams matured BUY/SELL rows of agent_analyses past a watermark and folds them into agent_decision_quality.
+
+    The read side is a server-side cursor on its own connection, so rows arrive in chunks of
+    `chunk_rows` instead of one result set. Each chunk's sums (count, hits, signed return and its
+    square, cost-adjusted edge per model/strategy/market/interval/action/horizon) are added to the
+    summary table together with the new watermark in one transaction, so a run can stop anywhere
+    and the next one resumes without double counting. Rows copied from a shared analysis are
+    skipped (the leader row stands for the decision); rows of symbols Binance rejects are skipped.
+    """
+
+    def __init__(self, store=None, horizons_min: tuple[int, ...] = DEFAULT_HORIZONS_MIN, chunk_rows: int = 5000):
+        self.store = store if store is not None else get_kline_store()
+        if self.store is None:
+            raise RuntimeError("KLINE_STORE_DIR is not set; decision evaluation needs the local kline store")
+        self.horizons_min = tuple(sorted({int(h) for h in horizons_min if int(h) > 0}))
+        if not self.horizons_min:
+            raise ValueError("at least one positive horizon is required")
+        self.labels = [horizon_label(h) for h in self.horizons_min]
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.stats = {"chunks": 0, "rows": 0, "evaluated": 0, "missing_candles": 0, "unavailable": 0}
+
+    # --- state ---
+
+    @staticmethod
+    def _watermark(cur) -> int:
+        cur.execute("SELECT last_analysis_id FROM agent_decision_eval_state WHERE name = %s", (EVAL_STATE_NAME,))
+        row = cur.fetchone()
+        return int(row["last_analysis_id"]) if row else 0
+
+    def _upper_bound(self, cur, after_id: int) -> int | None:
+        """First id whose longest horizon has not elapsed yet; rows from there on wait for a later run."""
+        cur.execute(
+            "SELECT MIN(id) AS id FROM agent_analyses WHERE id > %s AND created_at >= NOW() - INTERVAL %s MINUTE",
+            (after_id, self.horizons_min[-1] + 1),
+        )
+        row = cur.fetchone()
+        return int(row["id"]) if row and row["id"] is not None else None
+
+    # --- evaluation ---
+
+    def _chunk_sums(self, rows: list[dict]) -> dict[tuple, list]:
+        """{(model, strategy, market_type, interval, action, horizon): [decisions, hits, sum_return, sum_return_sq, sum_edge]}."""
+        times = np.array([int(r["created_ts"]) * 1000 for r in rows], dtype=np.int64)
+        rets = np.full((len(rows), len(self.horizons_min)), np.nan)
+        by_symbol: dict[str, list[int]] = {}
+        for i, r in enumerate(rows):
+            by_symbol.setdefault(r["symbol"].upper(), []).append(i)
+        for symbol, idx in by_symbol.items():
+            idx = np.asarray(idx)
+            t = times[idx]
+            try:
+                candles = self.store.get_range(
+                    symbol, "1m", int(t.min()) - 2 * _MIN_MS, int(t.max()) + self.horizons_min[-1] * _MIN_MS,
+                )
+            except KlineFetchError as e:
+                if e.status_code != 400:  # transient: leave the chunk for the next run
+                    raise
+                self.stats["unavailable"] += len(idx)
+                continue
+            rets[idx] = forward_returns(
+                np.asarray(candles["open_time"], dtype=np.int64), np.asarray(candles["close"], dtype=np.float64),
+                t, self.horizons_min,
+            )
+        direction = np.array([1.0 if r["action"] == "BUY" else -1.0 for r in rows])
+        cost = np.array([ROUND_TRIP_COST.get(r["market_type"] or "spot", ROUND_TRIP_COST["spot"]) for r in rows])
+        keys: dict[tuple, int] = {}
+        codes = np.array([
+            keys.setdefault((r["model"] or "", r["strategy"], r["market_type"] or "spot", r["interval"], r["action"]), len(keys))
+            for r in rows
+        ], dtype=np.int64)
+        out: dict[tuple, list] = {}
+        for k, label in enumerate(self.labels):
+            valid = ~np.isnan(rets[:, k])
+            self.stats["missing_candles"] += int((~valid).sum())
+            if not valid.any():
+                continue
+            c = codes[valid]
+            signed = direction[valid] * rets[valid, k]
+            sums = (
+                np.bincount(c, minlength=len(keys)),
+                np.bincount(c, weights=(signed > 0).astype(np.float64), minlength=len(keys)),
+                np.bincount(c, weights=signed, minlength=len(keys)),
+                np.bincount(c, weights=signed * signed, minlength=len(keys)),
+                np.bincount(c, weights=signed - cost[valid], minlength=len(keys)),
+            )
+            for key, code in keys.items():
+                if sums[0][code]:
+                    out[key + (label,)] = [int(sums[0][code]), int(sums[1][code])] + [float(s[code]) for s in sums[2:]]
+            self.stats["evaluated"] += int(valid.sum())
+        return out
+
+    def _commit_chunk(self, sums: dict[tuple, list], last_id: int) -> None:
+        with get_db() as conn:
+            with conn.cursor() as cur:
+                if sums:
+                    cur.executemany(
+                        """INSERT INTO agent_decision_quality
+                           (model, strategy, market_type, `interval`, action, horizon, decisions, hits, sum_return, sum_return_sq, sum_edge)
+                           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                           ON DUPLICATE KEY UPDATE decisions = decisions + VALUES(decisions), hits = hits + VALUES(hits),
+                               sum_return = sum_return + VALUES(sum_return), sum_return_sq = sum_return_sq + VALUES(sum_return_sq),
+                               sum_edge = sum_edge + VALUES(sum_edge)""",
+                        [key + tuple(vals) for key, vals in sums.items()],
+                    )
+                cur.execute(
+                    """INSERT INTO agent_decision_eval_state (name, last_analysis_id) VALUES (%s, %s)
+                       ON DUPLICATE KEY UPDATE last_analysis_id = VALUES(last_analysis_id)""",
+                    (EVAL_STATE_NAME, last_id),
+                )
+            conn.commit()
+
+    def run(self, max_rows: int = 0) -> dict:
+        """Evaluate every matured decision after the watermark (at most `max_rows` when > 0)."""
+        started = time.monotonic()
+        with get_db() as conn:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute("SELECT GET_LOCK(%s, 0) AS got", (EVAL_LOCK_NAME,))
+                if not cur.fetchone()["got"]:
+                    return {**self.stats, "skipped_locked": True}
+                try:
+                    after = self._watermark(cur)
+                    bound = self._upper_bound(cur, after)
+                    self._stream(after, bound, max_rows)
+                finally:
+                    cur.execute("SELECT RELEASE_LOCK(%s)", (EVAL_LOCK_NAME,))
+        return {**self.stats, "elapsed_sec": round(time.monotonic() - started, 2)}
+
+    def _stream(self, after: int, bound: int | None, max_rows: int) -> None:
+        # created_at is a DATETIME in the MySQL session time zone; UNIX_TIMESTAMP() converts it
+        # the same way NOW() wrote it, whatever the server or Python process zone is.
+        sql = (
+            "SELECT id, symbol, `interval`, strategy, action, market_type, model,"
+            " UNIX_TIMESTAMP(created_at) AS created_ts FROM agent_analyses"
+            " WHERE id > %s" + (" AND id < %s" if bound is not None else "")
+            + " AND action IN ('BUY', 'SELL') AND shared_from_id IS NULL ORDER BY id"
+            + (" LIMIT %s" if max_rows > 0 else "")
+        )
+        args = (after,) + ((bound,) if bound is not None else ()) + ((max_rows,) if max_rows > 0 else ())
+        # Own connection: an unbuffered result keeps it busy for the whole run, and closing the
+        # connection (not the cursor) on errors avoids draining the remaining rows.
+        conn = get_connection()
+        try:
+            cur = conn.cursor(pymysql.cursors.SSDictCursor)
+            # Candle backfills between fetches can take a while; keep the server from dropping the stream.
+            cur.execute("SET SESSION net_write_timeout = 3600")
+            cur.execute(sql, args)
+            while True:
+                rows = cur.fetchmany(self.chunk_rows)
+                if not rows:
+                    break
+                self._commit_chunk(self._chunk_sums(rows), rows[-1]["id"])
+                self.stats["chunks"] += 1
+                self.stats["rows"] += len(rows)
+        finally:
+            conn.close()
+        # HOLD / follower rows between the last evaluated id and the bound need no work either.
+        if bound is not None and not max_rows:
+            self._commit_chunk({}, bound - 1)
@@ -0,0 +1,201 @@
+# Vox Trader - Per-user event bus for push channels (agent logs, analyses, fills, balances)
+import asyncio
+import json
+import threading
+import time
+
+from config import get_settings
+
+
+class MemoryBackend:
+    """Single-process fan-out: a publish is delivered straight to local subscribers."""
+
+    def start(self, deliver) -> None:
+        self._deliver = deliver
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self._deliver(user_id, event)
+
+    def stop(self) -> None:
+        pass
+
+
+class RedisBackend:
+    """Cross-worker fan-out over Redis pub/sub (needs the `redis` package).
+
+    Every worker publishes to one channel and delivers incoming messages to its own local
+    subscribers, so a fill in one uvicorn worker reaches a dashboard connected to another.
+    """
+
+    def __init__(self, url: str, channel: str = "vox:events"):
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._thread = None
+
+    def start(self, deliver) -> None:
+        import redis
+
+        self._client = redis.Redis.from_url(self.url)
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+
+        def on_message(msg):
+            try:
+                body = json.loads(msg["data"])
+                deliver(int(body["user_id"]), body["event"])
+            except (ValueError, KeyError, TypeError):
+                pass
+
+        pubsub.subscribe(**{self.channel: on_message})
+        self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self._client.publish(self.channel, json.dumps({"user_id": user_id, "event": event}, default=str))
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class Subscription:
+    """One connected client. Events are queued on the client's event loop; the oldest is dropped when full."""
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, max_queue: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def _put(self, event: dict) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    def deliver(self, event: dict) -> None:
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout: float) -> dict | None:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    """Routes events published from any thread (agent runner, sync handlers) to a user's open streams.
+
+    With the memory backend a publish for a user without open streams is a dict lookup, so
+    idle users cost nothing.
+    """
+
+    def __init__(self, backend=None, max_queue: int = 256):
+        self.backend = backend or MemoryBackend()
+        self.max_queue = int(max_queue)
+        self._lock = threading.Lock()
+        self._subs: dict[int, set[Subscription]] = {}
+        self._stats = {"published": 0, "delivered": 0, "skipped": 0, "errors": 0}
+        self._started = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.backend.start(self._deliver_local)
+
+    def stop(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+        self.backend.stop()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Register a stream for user_id. Must be called from the event loop that will consume it."""
+        sub = Subscription(user_id, asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.user_id]
+
+    def publish(self, user_id: int, event_type: str, data: dict | None = None) -> None:
+        if isinstance(self.backend, MemoryBackend) and user_id not in self._subs:
+            with self._lock:
+                self._stats["skipped"] += 1
+            return
+        event = {"type": event_type, "data": data or {}, "ts": time.time()}
+        with self._lock:
+            self._stats["published"] += 1
+        try:
+            self.backend.publish(user_id, event)
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+
+    def _deliver_local(self, user_id: int, event: dict) -> None:
+        with self._lock:
+            subs = list(self._subs.get(user_id, ()))
+            self._stats["delivered"] += len(subs)
+        for sub in subs:
+            try:
+                sub.deliver(event)
+            except RuntimeError:
+                # Event loop already closed (shutdown); the stream is going away.
+                self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["users"] = len(self._subs)
+            out["streams"] = sum(len(s) for s in self._subs.values())
+            out["dropped"] = sum(sub.dropped for s in self._subs.values() for sub in s)
+        out["backend"] = type(self.backend).__name__
+        return out
+
+
+_event_bus: EventBus | None = None
+_event_bus_lock = threading.Lock()
+
+
+def get_event_bus() -> EventBus:
+    global _event_bus
+    if _event_bus is None:
+        with _event_bus_lock:
+            if _event_bus is None:
+                s = get_settings()
+                backend = RedisBackend(s.EVENT_BUS_REDIS_URL) if s.EVENT_BUS_BACKEND == "redis" else MemoryBackend()
+                _event_bus = EventBus(backend, max_queue=s.EVENT_STREAM_QUEUE_SIZE)
+    return _event_bus
+
+
+def start_event_bus() -> EventBus:
+    bus = get_event_bus()
+    bus.start()
+    return bus
+
+
+def stop_event_bus() -> None:
+    if _event_bus is not None:
+        _event_bus.stop()
+
+
+def publish_event(user_id: int, event_type: str, data: dict | None = None) -> None:
+    """Fire-and-forget publish; never raises into the caller (orders, agent cycles)."""
+    try:
+        bus = get_event_bus()
+        bus.start()
+        bus.publish(user_id, event_type, data)
+    except Exception:
+        pass
@@ -0,0 +1,137 @@
+# Vox Trader - Demo futures mark-to-market (vectorized PnL / margin ratio / equity for one or many users)
+from typing import Iterable
+
+import numpy as np
+import pymysql
+
+from database import get_db
+from services.price_cache import get_price_cache
+
+# Maintenance margin rate used for margin ratio and liquidation price (Binance USDT-M first tier is 0.4%).
+MAINTENANCE_MARGIN_RATE = 0.004
+
+_POSITION_COLUMNS = "p.id, p.user_id, p.symbol, p.side, p.quantity, p.entry_price, p.leverage, p.margin_used, p.created_at"
+
+
+def liquidation_prices(side_sign, quantity, entry_price, margin_used, mmr: float = MAINTENANCE_MARGIN_RATE):
+    """Isolated-margin liquidation price: the mark where margin + PnL equals maintenance margin.
+
+    LONG: (entry * qty - margin) / (qty * (1 - mmr)); SHORT: (entry * qty + margin) / (qty * (1 + mmr)).
+    Works on scalars and arrays; side_sign is +1 for LONG, -1 for SHORT.
+    """
+    side_sign = np.asarray(side_sign, dtype=np.float64)
+    quantity = np.asarray(quantity, dtype=np.float64)
+    liq = (side_sign * np.asarray(entry_price, dtype=np.float64) * quantity - np.asarray(margin_used, dtype=np.float64)) / (
+        quantity * (side_sign - mmr)
+    )
+    return np.maximum(liq, 0.0)
+
+
+def mark_positions(rows: list[dict], prices: dict[str, float], mmr: float = MAINTENANCE_MARGIN_RATE) -> dict[str, np.ndarray]:
+    """Mark position rows (demo_futures_positions dicts) at `prices`; symbols without a price use entry.
+
+    Returns float64 arrays aligned with rows: current_price, unrealized_pnl, notional, margin_used,
+    margin_ratio (maintenance / (margin + PnL); >= 1 means liquidatable) and liquidation_price.
+    """
+    nan = float("nan")
+    data = np.array(
+        [(r["quantity"], r["entry_price"], r["margin_used"], r["side"] == "LONG", prices.get(r["symbol"], nan)) for r in rows],
+        dtype=np.float64,
+    ).reshape(len(rows), 5)
+    qty, entry, margin = data[:, 0], data[:, 1], data[:, 2]
+    sign = data[:, 3] * 2.0 - 1.0
+    mark = np.where(np.isnan(data[:, 4]), entry, data[:, 4])
+    pnl = sign * (mark - entry) * qty
+    notional = qty * mark
+    margin_balance = margin + pnl
+    maintenance = notional * mmr
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(margin_balance > 0, maintenance / margin_balance, np.inf)
+        liq = liquidation_prices(sign, qty, entry, margin, mmr)
+    return {
+        "current_price": mark,
+        "unrealized_pnl": pnl,
+        "notional": notional,
+        "margin_used": margin,
+        "margin_ratio": ratio,
+        "liquidation_price": liq,
+    }
+
+
+def aggregate_by_user(rows: list[dict], marked: dict[str, np.ndarray], balances: dict[int, float]) -> dict[int, dict]:
+    """Per-user totals: margin_available, margin_used, unrealized_pnl, equity and account margin_ratio.
+
+    Users in `balances` without positions are included with zero exposure.
+    """
+    position_users = np.fromiter((r["user_id"] for r in rows), dtype=np.int64, count=len(rows))
+    user_ids, idx = np.unique(
+        np.concatenate([position_users, np.fromiter(balances, dtype=np.int64, count=len(balances))]),
+        return_inverse=True,
+    )
+    idx = idx[: len(rows)]
+    k = len(user_ids)
+    margin_used = np.bincount(idx, weights=marked["margin_used"], minlength=k)
+    pnl = np.bincount(idx, weights=marked["unrealized_pnl"], minlength=k)
+    maintenance = np.bincount(idx, weights=marked["notional"] * MAINTENANCE_MARGIN_RATE, minlength=k)
+    available = np.fromiter((balances.get(uid, 0.0) for uid in user_ids.tolist()), dtype=np.float64, count=k)
+    equity = available + margin_used + pnl
+    margin_balance = margin_used + pnl
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(margin_balance > 0, maintenance / margin_balance, np.where(margin_used > 0, np.inf, 0.0))
+    columns = zip(user_ids.tolist(), available.tolist(), margin_used.tolist(), pnl.tolist(), equity.tolist(), ratio.tolist())
+    return {
+        uid: {"margin_available": a, "margin_used": m, "unrealized_pnl": u, "equity": e, "margin_ratio": r}
+        for uid, a, m, u, e, r in columns
+    }
+
+
+def resolve_prices(symbols: Iterable[str]) -> dict[str, float]:
+    """One batched lookup from the shared price cache (live stream or one Binance ticker call)."""
+    from services.market_stream import get_market_stream
+
+    symbols = sorted({s.upper() for s in symbols})
+    stream = get_market_stream()
+    if stream is not None:
+        for sym in symbols:
+            stream.track(sym)
+    return get_price_cache().get_prices(symbols) if symbols else {}
+
+
+def load_open_positions(user_ids: list[int] | None = None) -> tuple[list[dict], dict[int, float]]:
+    """Open positions and demo balances for the given users, or for every user with a position when None."""
+    with get_db() as conn:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            if user_ids is None:
+                cur.execute(
+                    f"""
+                    SELECT {_POSITION_COLUMNS}, u.demo_balance FROM demo_futures_positions p
+                    JOIN users u ON u.id = p.user_id ORDER BY p.user_id, p.created_at
+                    """
+                )
+                rows = cur.fetchall()
+                balances = {int(r["user_id"]): float(r["demo_balance"]) for r in rows}
+                return rows, balances
+            if not user_ids:
+                return [], {}
+            placeholders = ", ".join(["%s"] * len(user_ids))
+            cur.execute(f"SELECT id, demo_balance FROM users WHERE id IN ({placeholders})", tuple(user_ids))
+            balances = {int(r["id"]): float(r["demo_balance"]) for r in cur.fetchall()}
+            cur.execute(
+                f"SELECT {_POSITION_COLUMNS} FROM demo_futures_positions p WHERE p.user_id IN ({placeholders}) ORDER BY p.user_id, p.created_at",
+                tuple(user_ids),
+            )
+            return cur.fetchall(), balances
+
+
+def mark_users(user_ids: list[int] | None = None) -> dict:
+    """Mark-to-market for a set of users, or all users with open positions ("mark all users" batch mode).
+
+    One positions query, one price lookup, vectorized math. Returns rows, the per-position arrays,
+    per-user totals and a leaderboard of user ids ordered by equity (highest first).
+    """
+    rows, balances = load_open_positions(user_ids)
+    prices = resolve_prices(r["symbol"] for r in rows)
+    marked = mark_positions(rows, prices)
+    users = aggregate_by_user(rows, marked, balances)
+    leaderboard = sorted(users, key=lambda uid: users[uid]["equity"], reverse=True)
+    return {"positions": rows, "marked": marked, "users": users, "leaderboard": leaderboard, "prices": prices}
@@ -0,0 +1,168 @@
+# Vox Trader - Password hashing (bcrypt) in a bounded pool off the event loop and request threadpool
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from auth import hash_password, pwd_context, verify_and_update_password
+from config import get_settings
+
+
+class HashQueueFullError(RuntimeError):
+    """HASH_POOL_MAX_PENDING hashes are already queued or running (admission control)."""
+
+
+def _warm_worker() -> None:
+    # Load the bcrypt backend with the cheapest cost before the first login lands on this worker.
+    pwd_context.handler("bcrypt").using(rounds=4).hash("warmup")
+
+
+def _noop() -> None:
+    return None
+
+
+class HashPool:
+    """Dedicated executor for bcrypt so a login burst cannot starve the sync-endpoint threadpool.
+
+    Processes by default (bcrypt is ~0.1-0.3 s of CPU per call); threads when `processes` is off.
+    Admission is non-blocking: with `max_pending` hashes queued or running, further calls fail
+    right away with HashQueueFullError (the routes answer 429) instead of piling up.
+    """
+
+    def __init__(self, workers: int = 2, processes: bool = True, max_pending: int = 32, timeout_sec: float = 10.0):
+        self.workers = max(1, int(workers))
+        self.processes = bool(processes)
+        self.max_pending = max(1, int(max_pending))
+        self.timeout_sec = float(timeout_sec)
+        self._lock = threading.Lock()
+        self._executor: Executor | None = None
+        self._pending = 0
+        self._stats = {"hashed": 0, "verified": 0, "rejected": 0, "timeouts": 0, "errors": 0, "restarts": 0,
+                       "peak_pending": 0}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                return
+            if self.processes:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker,
+                )
+                for _ in range(self.workers):
+                    self._executor.submit(_noop)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hasher")
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _restart(self, broken: Executor) -> None:
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+            self._stats["restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.start()
+
+    async def _run(self, stat: str, fn, *args):
+        with self._lock:
+            executor = self._executor
+            if executor is None:
+                raise RuntimeError("Hash pool is not running")
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise HashQueueFullError("Password hashing queue is full")
+            self._pending += 1
+            self._stats["peak_pending"] = max(self._stats["peak_pending"], self._pending)
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException as e:
+            self._release(None)
+            if isinstance(e, BrokenProcessPool):
+                self._restart(executor)
+            raise
+        # Pending until the worker is done, not until this caller stops waiting: a timed-out
+        # hash still occupies its worker and must keep counting against max_pending.
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout_sec)
+        except asyncio.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise
+        except BrokenProcessPool:
+            self._restart(executor)
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        with self._lock:
+            self._stats[stat] += 1
+        return result
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hashed", hash_password, password)
+
+    async def verify(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """(valid, new hash when the stored one needs a rehash)."""
+        return await self._run("verified", verify_and_update_password, password, hashed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["pending"] = self._pending
+            out["workers"] = self.workers
+            out["processes"] = self.processes
+            out["max_pending"] = self.max_pending
+            out["running"] = self._executor is not None
+        return out
+
+
+_hash_pool: HashPool | None = None
+
+
+def start_hash_pool() -> HashPool | None:
+    """Create and warm the hashing pool (no-op when HASH_POOL_WORKERS is 0)."""
+    global _hash_pool
+    s = get_settings()
+    if s.HASH_POOL_WORKERS <= 0:
+        return None
+    if _hash_pool is None:
+        _hash_pool = HashPool(s.HASH_POOL_WORKERS, s.HASH_POOL_PROCESSES, s.HASH_POOL_MAX_PENDING, s.HASH_POOL_TIMEOUT_SEC)
+    _hash_pool.start()
+    return _hash_pool
+
+
+def stop_hash_pool() -> None:
+    if _hash_pool is not None:
+        _hash_pool.stop()
+
+
+def get_hash_pool() -> HashPool | None:
+    return _hash_pool
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash via the pool when it is running, otherwise in a worker thread."""
+    pool = _hash_pool
+    if pool is not None and pool.stats()["running"]:
+        return await pool.hash(password)
+    return await asyncio.to_thread(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> tuple[bool, str | None]:
+    pool = _hash_pool
+    if pool is not None and pool.stats()["running"]:
+        return await pool.verify(password, hashed)
+    return await asyncio.to_thread(verify_and_update_password, password, hashed)
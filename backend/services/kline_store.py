@@ -0,0 +1,314 @@
+# Vox Trader - Local kline store (memory-mapped NumPy segments per symbol/interval)
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+import numpy as np
+
+from config import get_settings
+
+BINANCE_BASE = "https://api.binance.com"
+
+# One closed candle; the field order follows Binance REST rows (the trailing "ignore" column is dropped).
+KLINE_DTYPE = np.dtype([
+    ("open_time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("volume", "<f8"), ("close_time", "<i8"), ("quote_volume", "<f8"), ("trades", "<i8"),
+    ("taker_base", "<f8"), ("taker_quote", "<f8"),
+])
+# open_time of a slot: 0 = never fetched, EMPTY_SLOT = Binance has no candle there (before listing, outages).
+EMPTY_SLOT = -1
+SEGMENT_CANDLES = 4096
+# A closed candle is stored only once it closed this long ago (late trades, REST lag at the boundary).
+SETTLE_MS = 5_000
+_FETCH_LIMIT = 1000  # Binance max candles per /api/v3/klines call
+
+_MIN = 60_000
+INTERVAL_MS = {
+    "1m": _MIN, "3m": 3 * _MIN, "5m": 5 * _MIN, "15m": 15 * _MIN, "30m": 30 * _MIN,
+    "1h": 60 * _MIN, "2h": 120 * _MIN, "4h": 240 * _MIN, "6h": 360 * _MIN, "8h": 480 * _MIN, "12h": 720 * _MIN,
+    "1d": 1440 * _MIN, "1w": 7 * 1440 * _MIN,
+}
+# Weekly candles open on Monday 00:00 UTC; 1970-01-01 was a Thursday.
+_ORIGIN_MS = {"1w": 4 * 1440 * _MIN}
+
+
+class KlineFetchError(Exception):
+    """Binance refused a kline request (status_code / detail are passed through to the client)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"Failed to fetch klines: {status_code}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def fetch_binance_klines(symbol: str, interval: str, limit: int, start_ms: int | None = None, end_ms: int | None = None) -> list[list]:
+    """Raw Binance REST kline rows."""
+    params = {"symbol": symbol.upper(), "interval": interval, "limit": limit}
+    if start_ms is not None:
+        params["startTime"] = start_ms
+    if end_ms is not None:
+        params["endTime"] = end_ms
+    with httpx.Client(timeout=10.0) as client:
+        r = client.get(f"{BINANCE_BASE}/api/v3/klines", params=params)
+    if r.status_code != 200:
+        raise KlineFetchError(r.status_code, r.text)
+    return r.json()
+
+
+def to_raw_rows(arr: np.ndarray) -> list[list]:
+    """Stored candles back to Binance REST layout (prices as decimal strings, like the exchange)."""
+    out = []
+    for r in arr.tolist():
+        out.append([
+            r[0], f"{r[1]:.8f}", f"{r[2]:.8f}", f"{r[3]:.8f}", f"{r[4]:.8f}", f"{r[5]:.8f}",
+            r[6], f"{r[7]:.8f}", r[8], f"{r[9]:.8f}", f"{r[10]:.8f}", "0",
+        ])
+    return out
+
+
+class KlineStore:
+    """Closed candles on disk, one fixed-size .npy segment per SEGMENT_CANDLES slots.
+
+    A candle's slot is its open time divided by the interval, so a range read is a slice of a
+    memory-mapped segment (no copy when it stays within one segment) and gaps are slots whose
+    open_time is still 0. Missing runs are fetched from Binance at most once at a time: a request
+    overlapping an in-flight fetch of the same symbol/interval waits for it, then re-checks.
+    The still-open candle is never stored, nor a closed one younger than SETTLE_MS; callers take
+    those from the live stream or REST.
+    """
+
+    def __init__(self, root: str, max_open_segments: int = 256, fetch=None, now_ms=None):
+        self.root = root
+        self.max_open_segments = max(1, int(max_open_segments))
+        self._fetch = fetch or fetch_binance_klines
+        self._now_ms = now_ms or (lambda: int(time.time() * 1000))
+        self._lock = threading.Lock()
+        self._segments: OrderedDict[tuple[str, str, int], np.memmap] = OrderedDict()
+        self._inflight: dict[tuple[str, str], list[tuple[int, int, threading.Event]]] = {}
+        self._stats = {"reads": 0, "hits": 0, "fetches": 0, "fetched_candles": 0, "dedup_waits": 0, "errors": 0}
+
+    # --- slots / segments ---
+
+    @staticmethod
+    def supports(interval: str) -> bool:
+        return interval in INTERVAL_MS
+
+    @staticmethod
+    def slot(interval: str, open_ms: int) -> int:
+        return (open_ms - _ORIGIN_MS.get(interval, 0)) // INTERVAL_MS[interval]
+
+    @staticmethod
+    def slot_time(interval: str, slot: int) -> int:
+        return slot * INTERVAL_MS[interval] + _ORIGIN_MS.get(interval, 0)
+
+    def _path(self, symbol: str, interval: str, seg: int) -> str:
+        return os.path.join(self.root, symbol, interval, f"{seg:08d}.npy")
+
+    def _segment(self, symbol: str, interval: str, seg: int, create: bool) -> np.memmap | None:
+        key = (symbol, interval, seg)
+        with self._lock:
+            mm = self._segments.get(key)
+            if mm is not None:
+                self._segments.move_to_end(key)
+                return mm
+        path = self._path(symbol, interval, seg)
+        if not os.path.exists(path):
+            if not create:
+                return None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Build under a private name and link into place so concurrent creators never clobber each other.
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            np.lib.format.open_memmap(tmp, mode="w+", dtype=KLINE_DTYPE, shape=(SEGMENT_CANDLES,)).flush()
+            try:
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp)
+        mm = np.load(path, mmap_mode="r+")
+        with self._lock:
+            mm = self._segments.setdefault(key, mm)
+            self._segments.move_to_end(key)
+            while len(self._segments) > self.max_open_segments:
+                self._segments.popitem(last=False)
+        return mm
+
+    def read_slots(self, symbol: str, interval: str, first: int, last: int) -> np.ndarray:
+        """Slots first..last inclusive, including unfetched (open_time 0) and empty ones."""
+        symbol = symbol.upper()
+        parts = []
+        slot = first
+        while slot <= last:
+            seg, off = divmod(slot, SEGMENT_CANDLES)
+            end = min(last, (seg + 1) * SEGMENT_CANDLES - 1)
+            mm = self._segment(symbol, interval, seg, create=False)
+            parts.append(mm[off: off + end - slot + 1] if mm is not None else np.zeros(end - slot + 1, dtype=KLINE_DTYPE))
+            slot = end + 1
+        if not parts:
+            return np.zeros(0, dtype=KLINE_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _missing(self, symbol: str, interval: str, first: int, last: int) -> list[tuple[int, int]]:
+        idx = np.flatnonzero(self.read_slots(symbol, interval, first, last)["open_time"] == 0)
+        if not len(idx):
+            return []
+        breaks = np.flatnonzero(np.diff(idx) > 1)
+        starts = np.concatenate(([idx[0]], idx[breaks + 1]))
+        ends = np.concatenate((idx[breaks], [idx[-1]]))
+        return [(first + int(a), first + int(b)) for a, b in zip(starts, ends)]
+
+    def _settled_last(self, interval: str) -> int:
+        """Last slot whose candle closed at least SETTLE_MS ago."""
+        return self.slot(interval, self._now_ms() - SETTLE_MS) - 1
+
+    def _write(self, symbol: str, interval: str, rows: list[list], first: int, last: int) -> None:
+        """Store fetched rows of the closed range first..last; settled slots Binance skipped become EMPTY_SLOT.
+
+        A row is stored only when its close_time is the slot's own close time and at least SETTLE_MS
+        in the past, so an open or just-closed candle never lands on disk. Unsettled slots stay
+        unfetched (0) and are fetched again later.
+        """
+        origin, ims = _ORIGIN_MS.get(interval, 0), INTERVAL_MS[interval]
+        settled = self._now_ms() - SETTLE_MS
+        by_slot = {}
+        for r in rows:
+            t = int(r[0])
+            if (t - origin) % ims:
+                continue  # not on this interval's grid; never store it
+            if int(r[6]) != t + ims - 1 or int(r[6]) > settled:
+                continue  # still open, just closed, or truncated
+            slot = (t - origin) // ims
+            if first <= slot <= last:
+                by_slot[slot] = (t, float(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5]),
+                                 int(r[6]), float(r[7]), int(r[8]), float(r[9]), float(r[10]))
+        slot = first
+        while slot <= last:
+            seg, off = divmod(slot, SEGMENT_CANDLES)
+            end = min(last, (seg + 1) * SEGMENT_CANDLES - 1)
+            view = self._segment(symbol, interval, seg, create=True)[off: off + end - slot + 1]
+            found = [s for s in range(slot, end + 1) if s in by_slot]
+            if found:
+                view[np.array(found) - slot] = np.array([by_slot[s] for s in found], dtype=KLINE_DTYPE)
+            open_time = view["open_time"]
+            closes = origin + (np.arange(slot, end + 1) + 1) * ims - 1
+            open_time[(open_time == 0) & (closes <= settled)] = EMPTY_SLOT
+            slot = end + 1
+
+    # --- fill ---
+
+    def ensure(self, symbol: str, interval: str, first: int, last: int) -> bool:
+        """Fetch every never-fetched slot of the closed range first..last (deduplicated across threads).
+
+        Returns False when everything was already on disk.
+        """
+        symbol = symbol.upper()
+        key = (symbol, interval)
+        fetched = False
+        while True:
+            missing = self._missing(symbol, interval, first, last)
+            if not missing:
+                return fetched
+            fetched = True
+            with self._lock:
+                waits = [ev for a, b, ev in self._inflight.get(key, ()) if any(a <= y and x <= b for x, y in missing)]
+                if not waits:
+                    claims = [(a, b, threading.Event()) for a, b in missing]
+                    self._inflight.setdefault(key, []).extend(claims)
+                else:
+                    self._stats["dedup_waits"] += 1
+            if waits:
+                for ev in waits:
+                    ev.wait(timeout=30.0)
+                continue
+            try:
+                for a, b in missing:
+                    for lo in range(a, b + 1, _FETCH_LIMIT):
+                        hi = min(b, lo + _FETCH_LIMIT - 1)
+                        rows = self._fetch(
+                            symbol, interval, hi - lo + 1,
+                            start_ms=self.slot_time(interval, lo), end_ms=self.slot_time(interval, hi + 1) - 1,
+                        )
+                        self._write(symbol, interval, rows, lo, hi)
+                        with self._lock:
+                            self._stats["fetches"] += 1
+                            self._stats["fetched_candles"] += len(rows)
+            except Exception:
+                with self._lock:
+                    self._stats["errors"] += 1
+                raise
+            finally:
+                with self._lock:
+                    pending = self._inflight.get(key, [])
+                    for claim in claims:
+                        pending.remove(claim)
+                        claim[2].set()
+                    if not pending:
+                        self._inflight.pop(key, None)
+            return True
+
+    # --- reads ---
+
+    def get_range(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> np.ndarray:
+        """Closed candles with open time in [start_ms, end_ms], gaps filled from Binance first.
+
+        A view of the memory-mapped segment when the range stays inside one segment.
+        """
+        first = self.slot(interval, start_ms + INTERVAL_MS[interval] - 1)  # first candle opening at/after start
+        last = min(self.slot(interval, end_ms), self._settled_last(interval))
+        if last < first:
+            return np.zeros(0, dtype=KLINE_DTYPE)
+        self.ensure(symbol, interval, first, last)
+        arr = self.read_slots(symbol, interval, first, last)
+        present = arr["open_time"] > 0
+        return arr if present.all() else arr[present]
+
+    def get_latest(self, symbol: str, interval: str, limit: int, current: list | None = None) -> list[list]:
+        """Last `limit` candles in Binance REST layout: stored closed candles plus the open one.
+
+        `current` is the open candle if the caller already has it (live stream); otherwise it is one REST
+        row. Within SETTLE_MS of a candle close the just-closed candle comes from REST along with it.
+        """
+        symbol = symbol.upper()
+        now_slot = self.slot(interval, self._now_ms())
+        first, last = now_slot - limit + 1, self._settled_last(interval)
+        with self._lock:
+            self._stats["reads"] += 1
+        hit = last < first or not self.ensure(symbol, interval, first, last)
+        closed = self.read_slots(symbol, interval, first, last) if last >= first else np.zeros(0, dtype=KLINE_DTYPE)
+        rows = to_raw_rows(closed[closed["open_time"] > 0])
+        tail = now_slot - last  # the open candle plus closed ones not settled yet
+        latest = [current] if current is not None and tail == 1 else self._fetch(symbol, interval, tail)
+        for row in latest:
+            if not rows or int(row[0]) > rows[-1][0]:
+                rows.append(list(row))
+        with self._lock:
+            if hit:
+                self._stats["hits"] += 1
+        return rows[-limit:]
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["open_segments"] = len(self._segments)
+            out["inflight"] = sum(len(v) for v in self._inflight.values())
+        out["root"] = self.root
+        return out
+
+
+_store: KlineStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_kline_store() -> KlineStore | None:
+    """Process-wide store under KLINE_STORE_DIR (None when the setting is empty)."""
+    global _store
+    if _store is None:
+        s = get_settings()
+        if not s.KLINE_STORE_DIR:
+            return None
+        with _store_lock:
+            if _store is None:
+                _store = KlineStore(s.KLINE_STORE_DIR, max_open_segments=s.KLINE_STORE_MAX_OPEN_SEGMENTS)
+    return _store
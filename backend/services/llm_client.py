@@ -0,0 +1,221 @@
+# Vox Trader - LLM provider clients (pooled HTTP, concurrency caps, retries, streaming)
+import asyncio
+import importlib.util
+import json
+import random
+import threading
+import time
+from typing import AsyncIterator
+
+import httpx
+
+from config import get_settings
+
+# Worth retrying: rate limits and transient upstream failures.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMProviderError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ProviderClient:
+    """One OpenAI-compatible chat/completions provider (GLM, OpenAI).
+
+    Built once per process: sync (agent threads) and async (API handlers) httpx clients share
+    keep-alive pools, use HTTP/2 when the `h2` package is installed, cap in-flight requests per
+    provider and retry connection errors / 429 / 5xx with full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: str,
+        max_concurrency: int = 8,
+        max_retries: int = 2,
+        backoff_base_sec: float = 0.5,
+        backoff_max_sec: float = 8.0,
+        connect_timeout_sec: float = 30.0,
+        read_timeout_sec: float = 180.0,
+        max_connections: int = 32,
+        transport: httpx.BaseTransport | None = None,
+        async_transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.name = name
+        self.base_url = (base_url or "").strip().rstrip("/")
+        self.api_key = api_key or ""
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base_sec = float(backoff_base_sec)
+        self.backoff_max_sec = float(backoff_max_sec)
+        self.http2 = importlib.util.find_spec("h2") is not None and transport is None
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=60.0)
+        timeout = httpx.Timeout(connect_timeout_sec, read=read_timeout_sec)
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+        self._sync = httpx.Client(
+            base_url=self.base_url, headers=headers, timeout=timeout, limits=limits,
+            http2=self.http2, transport=transport,
+        )
+        self._async = httpx.AsyncClient(
+            base_url=self.base_url, headers=headers, timeout=timeout, limits=limits,
+            http2=self.http2 and async_transport is None, transport=async_transport,
+        )
+        self._sync_slots = threading.BoundedSemaphore(max(1, int(max_concurrency)))
+        self._async_slots = asyncio.Semaphore(max(1, int(max_concurrency)))
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "errors": 0, "streams": 0}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _backoff(self, attempt: int, response: httpx.Response | None = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after and retry_after.isdigit():
+                return min(self.backoff_max_sec, float(retry_after))
+        return random.uniform(0, min(self.backoff_max_sec, self.backoff_base_sec * (2 ** attempt)))
+
+    def post_chat_sync(self, payload: dict, timeout: float | None = None) -> httpx.Response:
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        with self._sync_slots:
+            for attempt in range(self.max_retries + 1):
+                self._count("requests")
+                try:
+                    r = self._sync.post("/chat/completions", json=payload, **kwargs)
+                except httpx.TransportError:
+                    if attempt >= self.max_retries:
+                        self._count("errors")
+                        raise
+                    self._count("retries")
+                    time.sleep(self._backoff(attempt))
+                    continue
+                if r.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    self._count("retries")
+                    time.sleep(self._backoff(attempt, r))
+                    continue
+                return r
+        raise RuntimeError("unreachable")
+
+    async def post_chat(self, payload: dict, timeout: float | None = None) -> httpx.Response:
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        async with self._async_slots:
+            for attempt in range(self.max_retries + 1):
+                self._count("requests")
+                try:
+                    r = await self._async.post("/chat/completions", json=payload, **kwargs)
+                except httpx.TransportError:
+                    if attempt >= self.max_retries:
+                        self._count("errors")
+                        raise
+                    self._count("retries")
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                if r.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    self._count("retries")
+                    await asyncio.sleep(self._backoff(attempt, r))
+                    continue
+                return r
+        raise RuntimeError("unreachable")
+
+    async def stream_chat(self, payload: dict, timeout: float | None = None) -> AsyncIterator[dict]:
+        """Yield parsed SSE chunks of a streamed completion. Retries only before the first byte."""
+        body = {**payload, "stream": True}
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        async with self._async_slots:
+            self._count("streams")
+            started = False
+            for attempt in range(self.max_retries + 1):
+                self._count("requests")
+                try:
+                    async with self._async.stream("POST", "/chat/completions", json=body, **kwargs) as r:
+                        if r.status_code != 200:
+                            text = (await r.aread()).decode(errors="replace")
+                            if r.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                                self._count("retries")
+                                await asyncio.sleep(self._backoff(attempt, r))
+                                continue
+                            self._count("errors")
+                            raise LLMProviderError(r.status_code, text or "API error")
+                        async for line in r.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                return
+                            try:
+                                chunk = json.loads(data)
+                            except ValueError:
+                                continue
+                            started = True
+                            yield chunk
+                        return
+                except httpx.TransportError:
+                    if started or attempt >= self.max_retries:
+                        self._count("errors")
+                        raise
+                    self._count("retries")
+                    await asyncio.sleep(self._backoff(attempt))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["http2"] = self.http2
+        return out
+
+    async def aclose(self) -> None:
+        self._sync.close()
+        await self._async.aclose()
+
+
+_clients: dict[str, ProviderClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _build_clients() -> dict[str, ProviderClient]:
+    s = get_settings()
+    common = {
+        "max_retries": s.LLM_MAX_RETRIES,
+        "backoff_base_sec": s.LLM_RETRY_BACKOFF_SEC,
+        "connect_timeout_sec": s.LLM_CONNECT_TIMEOUT_SEC,
+        "read_timeout_sec": s.LLM_READ_TIMEOUT_SEC,
+    }
+    limits = s.LLM_MAX_CONCURRENCY
+    return {
+        "glm": ProviderClient("glm", s.GLM5_BASE_URL, s.GLM5_API_KEY, max_concurrency=limits.get("glm", 8), **common),
+        "openai": ProviderClient(
+            "openai", s.OPENAI_BASE_URL or "https://api.openai.com/v1", s.OPENAI_API_KEY,
+            max_concurrency=limits.get("openai", 8), **common,
+        ),
+    }
+
+
+def start_llm_clients() -> None:
+    with _clients_lock:
+        if not _clients:
+            _clients.update(_build_clients())
+
+
+def get_llm_client(provider: str) -> ProviderClient:
+    if not _clients:
+        start_llm_clients()
+    return _clients.get(provider) or _clients["glm"]
+
+
+def llm_client_stats() -> dict:
+    return {name: c.stats() for name, c in _clients.items()}
+
+
+async def close_llm_clients() -> None:
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for c in clients:
+        await c.aclose()
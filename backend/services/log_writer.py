@@ -0,0 +1,119 @@
+# Vox Trader - Write-behind batch writer (buffer rows in memory, flush as multi-row INSERTs)
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+
+class BatchWriter:
+    """Buffers rows and hands them to `write(rows)` in batches from one background thread.
+
+    A flush happens when `flush_rows` rows are waiting or `flush_interval_sec` has passed since
+    the oldest waiting row. The buffer holds at most `max_buffer` rows; adds beyond that are
+    dropped and counted. A failed batch is retried once, then dropped. `stop()` drains what
+    is left; rows added after it are written one by one in the caller's thread.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[tuple]], None],
+        flush_rows: int = 200,
+        flush_interval_sec: float = 0.5,
+        max_buffer: int = 10000,
+        name: str = "batch-writer",
+    ):
+        self._write = write
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval_sec = float(flush_interval_sec)
+        self.max_buffer = max(self.flush_rows, int(max_buffer))
+        self.name = name
+        self._cond = threading.Condition()
+        self._buf: deque[tuple] = deque()
+        self._oldest_at: float | None = None
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self._stats = {"added": 0, "written": 0, "batches": 0, "dropped": 0, "errors": 0, "max_batch": 0}
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def add(self, row: tuple) -> bool:
+        with self._cond:
+            stopped = self._stopping
+            if not stopped:
+                if len(self._buf) >= self.max_buffer:
+                    self._stats["dropped"] += 1
+                    return False
+                self._buf.append(row)
+                self._stats["added"] += 1
+                if self._oldest_at is None:
+                    self._oldest_at = time.monotonic()
+                if len(self._buf) >= self.flush_rows:
+                    self._cond.notify()
+        if stopped:
+            # Rows arriving after stop() (a caller outliving shutdown) are written directly.
+            self._write([row])
+        return True
+
+    def _take_batch(self) -> list[tuple] | None:
+        with self._cond:
+            while True:
+                if self._buf:
+                    due = self._oldest_at + self.flush_interval_sec
+                    if self._stopping or len(self._buf) >= self.flush_rows or time.monotonic() >= due:
+                        break
+                    self._cond.wait(timeout=max(0.0, due - time.monotonic()))
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+            n = min(len(self._buf), self.flush_rows)
+            batch = [self._buf.popleft() for _ in range(n)]
+            self._oldest_at = time.monotonic() if self._buf else None
+            return batch
+
+    def _loop(self) -> None:
+        retry: list[tuple] | None = None
+        while True:
+            batch = retry or self._take_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except Exception:
+                with self._cond:
+                    self._stats["errors"] += 1
+                    if retry is not None:
+                        self._stats["dropped"] += len(batch)
+                retry = batch if retry is None else None
+                if retry is not None:
+                    time.sleep(min(1.0, self.flush_interval_sec))
+                continue
+            retry = None
+            with self._cond:
+                self._stats["written"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out["buffered"] = len(self._buf)
+        out["running"] = self.is_alive()
+        return out
@@ -0,0 +1,473 @@
+# Vox Trader - Binance WebSocket market-data ingester (live prices + rolling kline buffers)
+import json
+import re
+import threading
+import time
+from collections import deque
+
+import httpx
+from config import get_settings
+from services.price_cache import get_price_cache
+
+BINANCE_BASE = "https://api.binance.com"
+BINANCE_WS_BASE = "wss://stream.binance.com:9443/stream"
+# Binance spot kline intervals and the per-connection stream limit of the combined endpoint.
+KLINE_INTERVALS = frozenset({"1s", "1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h", "6h", "8h", "12h", "1d", "3d", "1w", "1M"})
+MAX_STREAMS = 1024
+# Minimum pause between REST re-seed attempts of gapped buffers.
+SEED_RETRY_SEC = 5.0
+_SYMBOL_RE = re.compile(r"^[A-Z0-9]{2,20}$")
+
+
+# --- Sources (pluggable: live WebSocket or local replay file) ---
+
+class StreamConnection:
+    """One open combined-stream subscription. recv() returns the next message or None on timeout."""
+
+    def recv(self, timeout: float) -> dict | None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class BinanceWebSocketSource:
+    """Live Binance combined streams (wss://stream.binance.com/stream?streams=a/b/c)."""
+
+    def __init__(self, base_url: str = BINANCE_WS_BASE):
+        self.base_url = base_url
+
+    def connect(self, streams: list[str]) -> StreamConnection:
+        from websockets.sync.client import connect
+
+        ws = connect(f"{self.base_url}?streams={'/'.join(streams)}", open_timeout=10, close_timeout=2)
+        return _WebSocketConnection(ws)
+
+
+class _WebSocketConnection(StreamConnection):
+    def __init__(self, ws):
+        self._ws = ws
+
+    def recv(self, timeout: float) -> dict | None:
+        try:
+            raw = self._ws.recv(timeout=timeout)
+        except TimeoutError:
+            return None
+        return json.loads(raw)
+
+    def close(self) -> None:
+        try:
+            self._ws.close()
+        except Exception:
+            pass
+
+
+class ReplaySource:
+    """Replays a JSON-lines file of combined-stream messages ({"stream": ..., "data": ...}).
+
+    Only lines whose stream is subscribed are delivered. `delay_sec` spaces messages out;
+    with `loop=True` the file restarts at EOF, otherwise the connection goes quiet.
+    """
+
+    def __init__(self, path: str, delay_sec: float = 0.0, loop: bool = False):
+        self.path = path
+        self.delay_sec = float(delay_sec)
+        self.loop = loop
+
+    def connect(self, streams: list[str]) -> StreamConnection:
+        return _ReplayConnection(self, set(streams))
+
+
+class _ReplayConnection(StreamConnection):
+    def __init__(self, source: ReplaySource, streams: set[str]):
+        self._source = source
+        self._streams = streams
+        self._fh = open(source.path, encoding="utf-8")
+
+    def recv(self, timeout: float) -> dict | None:
+        while True:
+            line = self._fh.readline()
+            if not line:
+                if not self._source.loop:
+                    time.sleep(timeout)
+                    return None
+                self._fh.seek(0)
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            msg = json.loads(line)
+            if msg.get("stream") not in self._streams:
+                continue
+            if self._source.delay_sec:
+                time.sleep(self._source.delay_sec)
+            return msg
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+# --- Ingester ---
+
+def _fetch_raw_klines(symbol: str, interval: str, limit: int) -> list[list]:
+    """REST seed for a kline buffer (Binance raw rows)."""
+    with httpx.Client(timeout=10.0) as client:
+        r = client.get(
+            f"{BINANCE_BASE}/api/v3/klines",
+            params={"symbol": symbol.upper(), "interval": interval, "limit": limit},
+        )
+    if r.status_code != 200:
+        raise ValueError(f"Failed to fetch klines: {r.status_code}")
+    return r.json()
+
+
+class MarketDataIngester:
+    """Keeps last-trade prices and rolling candle buffers current from a stream source.
+
+    Wanted streams come from `load_targets()` (symbol/interval pairs of running agents, refreshed
+    periodically) plus pairs recently requested through `track()`. track() only accepts known
+    intervals and symbols that `is_symbol()` confirms, and at most `max_tracked` pairs besides the
+    targets, so outside input cannot churn or overgrow the subscription. Candle rows are stored in
+    the Binance REST layout so readers can serve them as-is; a buffer that misses a candle (gap
+    after a disconnect) is re-seeded from REST. Prices are also pushed into `price_sink.update()`
+    (the shared PriceCache) when a sink is given.
+    """
+
+    def __init__(
+        self,
+        source,
+        load_targets=None,
+        price_sink=None,
+        buffer_size: int = 1000,
+        track_ttl_sec: float = 600.0,
+        refresh_sec: float = 10.0,
+        stale_after_sec: float = 10.0,
+        seed_klines=_fetch_raw_klines,
+        max_tracked: int = 200,
+        is_symbol=None,
+    ):
+        self.source = source
+        self._load_targets = load_targets
+        self._price_sink = price_sink
+        self.buffer_size = int(buffer_size)
+        self.track_ttl_sec = float(track_ttl_sec)
+        self.refresh_sec = float(refresh_sec)
+        self.stale_after_sec = float(stale_after_sec)
+        self._seed_klines = seed_klines
+        self.max_tracked = max(0, int(max_tracked))
+        self._is_symbol = is_symbol or (lambda symbol: get_price_cache().is_listed(symbol) is not False)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._resubscribe = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._tracked: dict[tuple[str, str | None], float] = {}
+        self._targets: set[tuple[str, str | None]] = set()
+        self._candles: dict[tuple[str, str], deque] = {}
+        self._candle_updated: dict[tuple[str, str], float] = {}
+        self._needs_seed: set[tuple[str, str]] = set()
+        self._prices: dict[str, tuple[float, float]] = {}
+        self._price_listeners: list = []
+        self._stats = {"messages": 0, "connects": 0, "errors": 0, "seeds": 0, "streams": 0, "listener_errors": 0,
+                       "gaps": 0, "track_rejected": 0}
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="market-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._resubscribe.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    # --- interest ---
+
+    def track(self, symbol: str, interval: str | None = None) -> bool:
+        """Mark a symbol (and optionally a kline interval) as wanted for track_ttl_sec.
+
+        Returns False when the pair is invalid, unknown to the exchange, or the tracked set is full.
+        """
+        key = (symbol.upper(), interval)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._targets or key in self._tracked:
+                if key in self._tracked:
+                    self._tracked[key] = now
+                return True
+        if not _SYMBOL_RE.match(key[0]) or (interval is not None and interval not in KLINE_INTERVALS) or not self._is_symbol(key[0]):
+            with self._lock:
+                self._stats["track_rejected"] += 1
+            return False
+        with self._lock:
+            if key not in self._tracked and len(self._tracked) >= self.max_tracked:
+                for k, ts in list(self._tracked.items()):
+                    if now - ts > self.track_ttl_sec:
+                        del self._tracked[k]
+                if len(self._tracked) >= self.max_tracked:
+                    self._stats["track_rejected"] += 1
+                    return False
+            is_new = key not in self._tracked
+            self._tracked[key] = now
+        if is_new:
+            self._resubscribe.set()
+        return True
+
+    def add_price_listener(self, fn) -> None:
+        """Call fn(symbol, price) on every trade tick (on the stream thread, so it must be cheap)."""
+        self._price_listeners.append(fn)
+
+    def remove_price_listener(self, fn) -> None:
+        if fn in self._price_listeners:
+            self._price_listeners.remove(fn)
+
+    def _wanted_streams(self) -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            for key, ts in list(self._tracked.items()):
+                if now - ts > self.track_ttl_sec:
+                    del self._tracked[key]
+            # Agent targets first, then the most recently requested pairs, up to the Binance limit.
+            pairs = sorted(self._targets) + sorted(
+                (k for k in self._tracked if k not in self._targets), key=lambda k: self._tracked[k], reverse=True,
+            )
+        streams: set[str] = set()
+        for symbol, interval in pairs:
+            wanted = {f"{symbol.lower()}@aggTrade"}
+            if interval:
+                wanted.add(f"{symbol.lower()}@kline_{interval}")
+            if len(streams | wanted) > MAX_STREAMS:
+                break
+            streams |= wanted
+        return sorted(streams)
+
+    # --- readers (zero network) ---
+
+    def get_price(self, symbol: str) -> float | None:
+        with self._lock:
+            entry = self._prices.get(symbol.upper())
+        if entry is None or time.monotonic() - entry[1] > self.stale_after_sec:
+            return None
+        return entry[0]
+
+    def get_raw_klines(self, symbol: str, interval: str, limit: int, track: bool = False) -> list[list] | None:
+        """Last `limit` candles in Binance REST layout, or None if the buffer is short or stale.
+
+        `track=True` also subscribes the pair (callers acting for an agent or a signed-in user).
+        """
+        key = (symbol.upper(), interval)
+        if track:
+            self.track(symbol, interval)
+        with self._lock:
+            buf = self._candles.get(key)
+            updated = self._candle_updated.get(key, 0.0)
+            if buf is None or len(buf) < limit or time.monotonic() - updated > self.stale_after_sec:
+                return None
+            if key in self._needs_seed:
+                # Disconnected or gapped: the buffer may miss candles until it is re-seeded.
+                return None
+            return list(buf)[-limit:]
+
+    def get_klines(self, symbol: str, interval: str, limit: int, track: bool = False) -> list[list[float]] | None:
+        rows = self.get_raw_klines(symbol, interval, limit, track)
+        if rows is None:
+            return None
+        return [[float(c[1]), float(c[2]), float(c[3]), float(c[4])] for c in rows]
+
+    # --- ingest ---
+
+    def _seed(self, symbol: str, interval: str) -> None:
+        """Fill a new or gapped buffer from REST; candles the stream delivered since are kept."""
+        key = (symbol, interval)
+        with self._lock:
+            if key in self._candles and key not in self._needs_seed:
+                return
+            self._needs_seed.discard(key)
+        try:
+            rows = self._seed_klines(symbol, interval, self.buffer_size)
+        except Exception:
+            self._stats["errors"] += 1
+            with self._lock:
+                self._needs_seed.add(key)
+            return
+        with self._lock:
+            live = self._candles.get(key)
+            if live and rows:
+                # REST is authoritative up to its last candle; keep streamed candles that are newer.
+                rows = list(rows) + [r for r in live if r[0] > rows[-1][0]]
+            elif live:
+                rows = list(live)
+            self._candles[key] = deque(rows, maxlen=self.buffer_size)
+            self._stats["seeds"] += 1
+
+    def handle_message(self, msg: dict) -> None:
+        data = msg.get("data") or msg
+        etype = data.get("e")
+        now = time.monotonic()
+        self._stats["messages"] += 1
+        if etype in ("aggTrade", "trade"):
+            symbol = data["s"]
+            price = float(data["p"])
+            with self._lock:
+                self._prices[symbol] = (price, now)
+            if self._price_sink is not None:
+                self._price_sink.update({symbol: price}, now)
+            for fn in self._price_listeners:
+                try:
+                    fn(symbol, price)
+                except Exception:
+                    self._stats["listener_errors"] += 1
+        elif etype == "kline":
+            k = data["k"]
+            symbol, interval = data["s"], k["i"]
+            row = [k["t"], k["o"], k["h"], k["l"], k["c"], k["v"], k["T"], k["q"], k["n"], k["V"], k["Q"], k.get("B", "0")]
+            key = (symbol, interval)
+            with self._lock:
+                buf = self._candles.get(key)
+                if buf is None:
+                    buf = self._candles[key] = deque(maxlen=self.buffer_size)
+                if buf and buf[-1][0] == row[0]:
+                    buf[-1] = row
+                elif not buf or buf[-1][0] < row[0]:
+                    if buf and row[0] > int(buf[-1][6]) + 1:
+                        # Candles were missed (disconnect): restart from this one and re-seed.
+                        buf.clear()
+                        self._needs_seed.add(key)
+                        self._stats["gaps"] += 1
+                    buf.append(row)
+                self._candle_updated[key] = now
+                self._prices.setdefault(symbol, (float(k["c"]), now))
+
+    def _drop_unsubscribed(self, streams: list[str]) -> None:
+        # A buffer that stops receiving updates would develop a gap; re-seed on next subscribe.
+        wanted = {(st.split("@kline_")[0].upper(), st.split("@kline_")[1]) for st in streams if "@kline_" in st}
+        with self._lock:
+            for key in list(self._candles):
+                if key not in wanted:
+                    del self._candles[key]
+                    self._candle_updated.pop(key, None)
+                    self._needs_seed.discard(key)
+
+    def _refresh_targets(self) -> None:
+        if self._load_targets is None:
+            return
+        targets = {(s.upper(), i) for s, i in self._load_targets()}
+        with self._lock:
+            changed = targets != self._targets
+            self._targets = targets
+        if changed:
+            self._resubscribe.set()
+
+    def _loop(self) -> None:
+        conn = None
+        streams: list[str] = []
+        next_refresh = 0.0
+        seed_retry_at = 0.0
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_refresh:
+                    try:
+                        self._refresh_targets()
+                    except Exception:
+                        self._stats["errors"] += 1
+                    # Re-evaluate wanted streams so expired track() interest is dropped.
+                    self._resubscribe.set()
+                    next_refresh = time.monotonic() + self.refresh_sec
+                if conn is None or self._resubscribe.is_set():
+                    self._resubscribe.clear()
+                    wanted = self._wanted_streams()
+                    if conn is None or wanted != streams:
+                        if conn is not None:
+                            conn.close()
+                            conn = None
+                        streams = wanted
+                        self._stats["streams"] = len(streams)
+                        self._drop_unsubscribed(streams)
+                        if not streams:
+                            self._resubscribe.wait(timeout=self.refresh_sec)
+                            continue
+                        conn = self.source.connect(streams)
+                        self._stats["connects"] += 1
+                        # A buffer whose last candle closed while disconnected may miss its final update
+                        # or later candles; re-seed those (after connecting, so nothing falls in between).
+                        now_ms = int(time.time() * 1000)
+                        with self._lock:
+                            self._needs_seed.update(k for k, buf in self._candles.items() if buf and int(buf[-1][6]) < now_ms)
+                        for st in streams:
+                            if "@kline_" in st:
+                                sym, interval = st.split("@kline_")
+                                self._seed(sym.upper(), interval)
+                if self._needs_seed and time.monotonic() >= seed_retry_at:
+                    with self._lock:
+                        pending = list(self._needs_seed)
+                    for sym, interval in pending:
+                        self._seed(sym, interval)
+                    seed_retry_at = time.monotonic() + SEED_RETRY_SEC
+                msg = conn.recv(timeout=1.0)
+                if msg is not None:
+                    self.handle_message(msg)
+                backoff = 1.0
+            except Exception:
+                self._stats["errors"] += 1
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                # Updates during the outage are lost: buffers are not served until re-seeded.
+                with self._lock:
+                    self._needs_seed.update(self._candles)
+                self._stop.wait(backoff)
+                backoff = min(60.0, backoff * 2)
+        if conn is not None:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["prices"] = len(self._prices)
+            out["kline_buffers"] = len(self._candles)
+            out["tracked"] = len(self._tracked)
+        return out
+
+
+_ingester: MarketDataIngester | None = None
+_ingester_lock = threading.Lock()
+
+
+def get_market_stream() -> MarketDataIngester | None:
+    """Process-wide ingester, or None when MARKET_STREAM_ENABLED is off."""
+    return _ingester
+
+
+def start_market_stream(load_targets=None) -> MarketDataIngester | None:
+    global _ingester
+    s = get_settings()
+    if not s.MARKET_STREAM_ENABLED:
+        return None
+    with _ingester_lock:
+        if _ingester is None:
+            if s.MARKET_STREAM_REPLAY_FILE:
+                source = ReplaySource(s.MARKET_STREAM_REPLAY_FILE, delay_sec=s.MARKET_STREAM_REPLAY_DELAY_SEC, loop=True)
+            else:
+                source = BinanceWebSocketSource()
+            _ingester = MarketDataIngester(
+                source,
+                load_targets=load_targets,
+                price_sink=get_price_cache(),
+                buffer_size=s.MARKET_STREAM_BUFFER_SIZE,
+                track_ttl_sec=s.MARKET_STREAM_TRACK_TTL_SEC,
+                max_tracked=s.MARKET_STREAM_MAX_TRACKED,
+            )
+        _ingester.start()
+    return _ingester
+
+
+def stop_market_stream() -> None:
+    with _ingester_lock:
+        if _ingester is not None:
+            _ingester.stop()
@@ -0,0 +1,322 @@
+# Vox Trader - Demo spot resting orders (limit / stop) matched in batches against price ticks
+import heapq
+import threading
+import time
+from typing import Callable
+
+from config import get_settings
+from services.market_stream import get_market_stream
+from services.price_cache import get_price_cache
+
+LIMIT = "LIMIT"
+STOP = "STOP"
+
+
+def order_direction(side: str, order_type: str) -> str:
+    """"below" when the order fills at price <= its level, "above" at >=.
+
+    BUY LIMIT / SELL STOP wait for the price to fall to the level; BUY STOP / SELL LIMIT for it to rise.
+    """
+    buy = side == "BUY"
+    return "below" if (order_type == LIMIT) == buy else "above"
+
+
+class _HeapBook:
+    """Order levels of one symbol and direction; the next order to cross sits on top of the heap.
+
+    "below" books are max-heaps (keys are negated levels), "above" books min-heaps. Cancelled or
+    re-priced orders stay in the heap until they surface and are skipped (lazy deletion).
+    """
+
+    __slots__ = ("sign", "heap")
+
+    def __init__(self, direction: str):
+        self.sign = -1.0 if direction == "below" else 1.0
+        self.heap: list[tuple[float, int]] = []
+
+    def push(self, level: float, order_id: int) -> None:
+        heapq.heappush(self.heap, (self.sign * level, order_id))
+
+    def pop_crossed(self, price: float) -> list[tuple[int, float]]:
+        """Pop every (order_id, level) crossed by `price`, live or not."""
+        out = []
+        key = self.sign * price
+        heap = self.heap
+        while heap and heap[0][0] <= key:
+            k, oid = heapq.heappop(heap)
+            out.append((oid, self.sign * k))
+        return out
+
+
+class SpotOrderBook:
+    """In-memory price-level index of open demo spot limit/stop orders.
+
+    Ticks (market stream listener or a price-cache poll every `poll_sec`) only widen a per-symbol
+    low/high window; every `batch_sec` the worker matches each window against the heaps and hands
+    the crossed order ids to `fill(order_ids)` in chunks of `batch_max`. `fill` must lock the rows,
+    skip orders that are no longer open, and settle the rest at their own price in one transaction;
+    it returns {order_id: "filled" | "rejected"}; orders it leaves out were already filled or
+    cancelled elsewhere. When it raises, the chunk is re-indexed and retried on the next crossing.
+    The index is rebuilt from `load()` every `resync_sec` so orders of other processes are picked up.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], list[dict]],
+        fill: Callable[[list[int]], dict[int, str]],
+        batch_sec: float = 0.05,
+        batch_max: int = 500,
+        poll_sec: float = 1.0,
+        resync_sec: float = 30.0,
+        get_prices: Callable | None = None,
+    ):
+        self._load = load
+        self._fill = fill
+        self.batch_sec = float(batch_sec)
+        self.batch_max = max(1, int(batch_max))
+        self.poll_sec = float(poll_sec)
+        self.resync_sec = float(resync_sec)
+        self._get_prices = get_prices or (lambda symbols: get_price_cache().get_prices(symbols))
+        self._lock = threading.Lock()
+        self._books: dict[tuple[str, str], _HeapBook] = {}
+        self._live: dict[int, tuple[str, str, float]] = {}  # order_id -> (symbol, direction, level)
+        self._stale = 0  # heap entries of cancelled / re-priced orders not yet popped
+        self._window: dict[str, list[float]] = {}  # symbol -> [low, high] since the last batch
+        self._pending: list[tuple[str, object]] | None = None  # add/cancel calls during a resync
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stats = {"ticks": 0, "batches": 0, "matched": 0, "filled": 0, "rejected": 0, "gone": 0,
+                       "stale_skipped": 0, "errors": 0, "resyncs": 0}
+
+    # --- index ---
+
+    def _insert_locked(self, oid: int, symbol: str, direction: str, level: float) -> None:
+        if oid in self._live:
+            self._stale += 1  # the old entry stays in its heap until it surfaces
+        self._live[oid] = (symbol, direction, level)
+        book = self._books.get((symbol, direction))
+        if book is None:
+            book = self._books[(symbol, direction)] = _HeapBook(direction)
+        book.push(level, oid)
+
+    def _add_locked(self, order: dict) -> None:
+        self._insert_locked(
+            int(order["id"]), order["symbol"].upper(), order_direction(order["side"], order["order_type"]), float(order["price"]),
+        )
+
+    def _bulk_load(self, rows: list[dict]) -> None:
+        """Build the index from scratch: one heapify per book."""
+        for order in rows:
+            oid = int(order["id"])
+            symbol = order["symbol"].upper()
+            direction = order_direction(order["side"], order["order_type"])
+            self._live[oid] = (symbol, direction, float(order["price"]))
+        self._rebuild_locked()
+
+    def _rebuild_locked(self) -> None:
+        """Heaps from the live orders only, dropping every stale entry."""
+        self._books = {}
+        for oid, (symbol, direction, level) in self._live.items():
+            book = self._books.get((symbol, direction))
+            if book is None:
+                book = self._books[(symbol, direction)] = _HeapBook(direction)
+            book.heap.append((book.sign * level, oid))
+        for book in self._books.values():
+            heapq.heapify(book.heap)
+        self._stale = 0
+
+    def _drop_locked(self, order_id: int) -> None:
+        if self._live.pop(order_id, None) is not None:
+            self._stale += 1
+            if self._stale > max(1024, len(self._live)):
+                self._rebuild_locked()
+
+    def add(self, order: dict) -> None:
+        """Index (or re-price) an open order row: id, symbol, side, order_type, price."""
+        with self._lock:
+            self._add_locked(order)
+            if self._pending is not None:
+                self._pending.append(("add", order))
+
+    def cancel(self, order_id: int) -> None:
+        with self._lock:
+            self._drop_locked(int(order_id))
+            if self._pending is not None:
+                self._pending.append(("cancel", int(order_id)))
+
+    def resync(self) -> None:
+        """Rebuild the index from load() and swap it in; add/cancel calls made meanwhile are replayed."""
+        with self._lock:
+            self._pending = []
+        try:
+            rows = self._load()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        fresh = SpotOrderBook(load=self._load, fill=self._fill)
+        fresh._bulk_load(rows)
+        with self._lock:
+            for op, arg in self._pending:
+                if op == "add":
+                    fresh._add_locked(arg)
+                else:
+                    fresh._drop_locked(arg)
+            self._pending = None
+            self._books, self._live, self._stale = fresh._books, fresh._live, fresh._stale
+            self._stats["resyncs"] += 1
+        stream = get_market_stream()
+        if stream is not None:
+            for symbol in self.symbols():
+                stream.track(symbol)
+
+    def symbols(self) -> list[str]:
+        with self._lock:
+            return sorted({symbol for symbol, _, _ in self._live.values()})
+
+    # --- ticks ---
+
+    def on_tick(self, symbol: str, price: float) -> None:
+        """Record a trade price; matching happens on the worker in the next batch."""
+        symbol = symbol.upper()
+        with self._lock:
+            self._stats["ticks"] += 1
+            w = self._window.get(symbol)
+            if w is None:
+                self._window[symbol] = [price, price]
+                self._wake.set()
+            elif price < w[0]:
+                w[0] = price
+            elif price > w[1]:
+                w[1] = price
+
+    def match(self) -> list[tuple[int, str, str, float]]:
+        """Match the tick window collected since the last call; returns crossed (order_id, symbol, direction, level)."""
+        with self._lock:
+            window, self._window = self._window, {}
+            crossed = []
+            for symbol, (low, high) in window.items():
+                for direction, price in (("below", low), ("above", high)):
+                    book = self._books.get((symbol, direction))
+                    if book is None or not book.heap:
+                        continue
+                    for oid, level in book.pop_crossed(price):
+                        # Cancelled, or re-priced (its current entry is elsewhere in the heap).
+                        if self._live.get(oid) != (symbol, direction, level):
+                            self._stale = max(0, self._stale - 1)
+                            self._stats["stale_skipped"] += 1
+                            continue
+                        del self._live[oid]
+                        crossed.append((oid, symbol, direction, level))
+            self._stats["matched"] += len(crossed)
+        return crossed
+
+    def settle(self, crossed: list[tuple[int, str, str, float]]) -> None:
+        """Hand crossed orders to fill() in chunks; a failed chunk goes back into the index."""
+        for i in range(0, len(crossed), self.batch_max):
+            chunk = crossed[i: i + self.batch_max]
+            try:
+                result = self._fill([oid for oid, _, _, _ in chunk])
+            except Exception:
+                with self._lock:
+                    self._stats["errors"] += 1
+                    for oid, symbol, direction, level in chunk:
+                        if oid not in self._live:
+                            self._insert_locked(oid, symbol, direction, level)
+                continue
+            with self._lock:
+                self._stats["batches"] += 1
+                for oid, _, _, _ in chunk:
+                    status = result.get(oid)
+                    self._stats[status if status in ("filled", "rejected") else "gone"] += 1
+
+    # --- worker ---
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="spot-order-book", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def _poll(self) -> None:
+        symbols = self.symbols()
+        if not symbols:
+            return
+        for symbol, price in self._get_prices(symbols).items():
+            self.on_tick(symbol, price)
+
+    def _loop(self) -> None:
+        next_resync = 0.0
+        next_poll = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            try:
+                if now >= next_resync:
+                    self.resync()
+                    next_resync = now + self.resync_sec
+                if now >= next_poll:
+                    self._poll()
+                    next_poll = now + self.poll_sec
+            except Exception:
+                with self._lock:
+                    self._stats["errors"] += 1
+            # Let ticks accumulate for one batch window, then match them all at once.
+            self._wake.wait(timeout=max(0.01, min(next_poll, next_resync) - time.monotonic()))
+            self._wake.clear()
+            if self._stop.wait(self.batch_sec):
+                break
+            crossed = self.match()
+            if crossed:
+                self.settle(crossed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["orders"] = len(self._live)
+            out["heap_entries"] = sum(len(b.heap) for b in self._books.values())
+            out["stale_entries"] = self._stale
+        out["running"] = self._thread is not None and self._thread.is_alive()
+        return out
+
+
+_book: SpotOrderBook | None = None
+
+
+def start_order_book(load: Callable[[], list[dict]], fill: Callable[[list[int]], dict[int, str]]) -> SpotOrderBook | None:
+    """Start the matcher and subscribe it to market-stream ticks (no-op when ORDER_BOOK_ENABLED is off)."""
+    global _book
+    s = get_settings()
+    if not s.ORDER_BOOK_ENABLED:
+        return None
+    if _book is None:
+        _book = SpotOrderBook(
+            load, fill, batch_sec=s.ORDER_BOOK_BATCH_SEC, batch_max=s.ORDER_BOOK_BATCH_MAX,
+            poll_sec=s.ORDER_BOOK_POLL_SEC, resync_sec=s.ORDER_BOOK_RESYNC_SEC,
+        )
+    stream = get_market_stream()
+    if stream is not None:
+        stream.add_price_listener(_book.on_tick)
+    _book.start()
+    return _book
+
+
+def stop_order_book() -> None:
+    if _book is None:
+        return
+    stream = get_market_stream()
+    if stream is not None:
+        stream.remove_price_listener(_book.on_tick)
+    _book.stop()
+
+
+def get_order_book() -> SpotOrderBook | None:
+    return _book
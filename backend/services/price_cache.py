@@ -0,0 +1,161 @@
+# Vox Trader - Shared market price cache (TTL + single-flight refresh)
+import threading
+import time
+from typing import Callable, Iterable
+
+import httpx
+from config import get_settings
+
+BINANCE_BASE = "https://api.binance.com"
+
+
+class PriceUnavailableError(Exception):
+    """No fresh price for the symbol (upstream failed or symbol unknown)."""
+
+
+def fetch_all_ticker_prices(client: httpx.Client | None = None) -> dict[str, float]:
+    """All spot symbols in one call: GET /api/v3/ticker/price (no symbol param)."""
+    if client is None:
+        with httpx.Client(timeout=5.0) as c:
+            r = c.get(f"{BINANCE_BASE}/api/v3/ticker/price")
+    else:
+        r = client.get(f"{BINANCE_BASE}/api/v3/ticker/price")
+    if r.status_code != 200:
+        raise PriceUnavailableError(f"ticker/price returned {r.status_code}")
+    return {item["symbol"]: float(item["price"]) for item in r.json()}
+
+
+class PriceCache:
+    """Process-wide last-price table.
+
+    A miss or an expired entry triggers one all-symbols ticker fetch; concurrent callers wait
+    for that fetch instead of issuing their own (single flight). Other sources (e.g. a
+    WebSocket ingester) can push fresher prices with `update()`.
+    """
+
+    def __init__(
+        self,
+        ttl_sec: float = 2.0,
+        fetch_all: Callable[[], dict[str, float]] | None = None,
+        fetch_timeout_sec: float = 10.0,
+    ):
+        self.ttl_sec = float(ttl_sec)
+        self.fetch_timeout_sec = float(fetch_timeout_sec)
+        self._client = httpx.Client(timeout=5.0) if fetch_all is None else None
+        self._fetch_all = fetch_all or (lambda: fetch_all_ticker_prices(self._client))
+        self._lock = threading.Lock()
+        self._prices: dict[str, tuple[float, float]] = {}
+        self._inflight: threading.Event | None = None
+        self._last_error: Exception | None = None
+        self._last_fetch_at = float("-inf")
+        self._stats = {"hits": 0, "misses": 0, "upstream_fetches": 0, "coalesced_waits": 0, "errors": 0, "pushed": 0}
+
+    def update(self, prices: dict[str, float], ts: float | None = None) -> None:
+        ts = time.monotonic() if ts is None else ts
+        with self._lock:
+            for sym, price in prices.items():
+                self._prices[sym.upper()] = (float(price), ts)
+            self._stats["pushed"] += len(prices)
+
+    def _fresh_locked(self, symbols: list[str], now: float) -> dict[str, float] | None:
+        out = {}
+        for sym in symbols:
+            entry = self._prices.get(sym)
+            if entry is None or now - entry[1] > self.ttl_sec:
+                return None
+            out[sym] = entry[0]
+        return out
+
+    def _refresh(self) -> None:
+        with self._lock:
+            leader = self._inflight is None
+            if leader:
+                self._inflight = threading.Event()
+            event = self._inflight
+            if not leader:
+                self._stats["coalesced_waits"] += 1
+        if not leader:
+            event.wait(self.fetch_timeout_sec)
+            return
+        try:
+            prices = self._fetch_all()
+            now = time.monotonic()
+            with self._lock:
+                self._stats["upstream_fetches"] += 1
+                for sym, price in prices.items():
+                    self._prices[sym] = (price, now)
+                self._last_fetch_at = now
+                self._last_error = None
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                self._last_error = e
+        finally:
+            with self._lock:
+                self._inflight = None
+            event.set()
+
+    def get_prices(self, symbols: Iterable[str]) -> dict[str, float]:
+        """Fresh prices for the requested symbols; unknown/unavailable symbols are left out."""
+        wanted = list({s.upper() for s in symbols})
+        if not wanted:
+            return {}
+        with self._lock:
+            now = time.monotonic()
+            hit = self._fresh_locked(wanted, now)
+            self._stats["hits" if hit is not None else "misses"] += 1
+            # A full snapshot younger than the TTL already says the missing symbols do not exist.
+            snapshot_fresh = now - self._last_fetch_at <= self.ttl_sec
+        if hit is not None:
+            return hit
+        if not snapshot_fresh:
+            self._refresh()
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for sym in wanted:
+                entry = self._prices.get(sym)
+                if entry is not None and now - entry[1] <= self.ttl_sec:
+                    out[sym] = entry[0]
+        return out
+
+    def get_price(self, symbol: str) -> float:
+        sym = symbol.upper()
+        price = self.get_prices([sym]).get(sym)
+        if price is None:
+            with self._lock:
+                err = self._last_error
+            raise PriceUnavailableError(f"No price for {sym}" + (f": {err}" if err else ""))
+        return price
+
+    def is_listed(self, symbol: str) -> bool | None:
+        """Whether Binance lists the symbol; None when no snapshot could be fetched to tell."""
+        sym = symbol.upper()
+        with self._lock:
+            if sym in self._prices:
+                return True
+        self.get_prices([sym])
+        with self._lock:
+            if sym in self._prices:
+                return True
+            return None if self._last_error is not None or self._last_fetch_at == float("-inf") else False
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["symbols"] = len(self._prices)
+        out["ttl_sec"] = self.ttl_sec
+        return out
+
+
+_price_cache: PriceCache | None = None
+_price_cache_lock = threading.Lock()
+
+
+def get_price_cache() -> PriceCache:
+    global _price_cache
+    if _price_cache is None:
+        with _price_cache_lock:
+            if _price_cache is None:
+                _price_cache = PriceCache(ttl_sec=get_settings().PRICE_CACHE_TTL_SEC)
+    return _price_cache
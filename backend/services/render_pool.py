@@ -0,0 +1,154 @@
+# Vox Trader - Chart rendering in a warmed pool of worker processes
+import base64
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from config import get_settings
+from services.chart_render import render_candlestick_png
+
+
+class RenderQueueFullError(RuntimeError):
+    """All render slots stayed busy for RENDER_POOL_TIMEOUT_SEC (backpressure)."""
+
+
+def _warm_worker() -> None:
+    # chart_render imports matplotlib with the Agg backend at module load; one tiny render
+    # also builds the per-process figure and font cache before the first real job.
+    render_candlestick_png([[1.0, 2.0, 0.5, 1.5], [1.5, 2.0, 1.0, 1.2]], "warmup")
+
+
+def _noop() -> None:
+    return None
+
+
+def _render_in_worker(ohlc_bytes: bytes, n: int, title: str) -> bytes:
+    ohlc = np.frombuffer(ohlc_bytes, dtype=np.float64).reshape(n, 4)
+    return render_candlestick_png(ohlc, title)
+
+
+class RenderPool:
+    """Process pool for CPU-bound chart rendering, so renders do not hold the API process GIL.
+
+    OHLC goes over the pipe as packed float64 bytes (32 bytes per candle) and PNG bytes come
+    back. At most `max_pending` renders are queued or running (a slot frees when the worker
+    finishes, even after its caller timed out); further callers block up to `timeout_sec` for
+    a slot and then get RenderQueueFullError.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, timeout_sec: float = 30.0):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.timeout_sec = float(timeout_sec)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._stats = {"rendered": 0, "rejected": 0, "errors": 0, "restarts": 0}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+            # Spawn and warm every worker now instead of on the first agent cycle.
+            for _ in range(self.workers):
+                self._executor.submit(_noop)
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+            self._stats["restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.start()
+
+    def render_png(self, klines, title: str) -> bytes:
+        ohlc = np.ascontiguousarray(np.asarray(klines, dtype=np.float64).reshape(-1, 4))
+        if len(ohlc) == 0:
+            raise ValueError("Klines are empty")
+        if not self._slots.acquire(timeout=self.timeout_sec):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise RenderQueueFullError("Chart render queue is full")
+        executor = self._executor
+        try:
+            if executor is None:
+                raise RuntimeError("Render pool is not running")
+            future = executor.submit(_render_in_worker, ohlc.tobytes(), len(ohlc), title)
+        except BaseException as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._restart(executor)
+            raise
+        # The slot is held until the worker is done with the job, not until this caller stops
+        # waiting: a timed-out render keeps its worker busy and must keep counting as pending.
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            png = future.result(timeout=self.timeout_sec)
+        except BrokenProcessPool:
+            self._restart(executor)
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        except TimeoutError:
+            future.cancel()
+            raise
+        with self._lock:
+            self._stats["rendered"] += 1
+        return png
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["workers"] = self.workers
+            out["max_pending"] = self.max_pending
+            out["running"] = self._executor is not None
+        return out
+
+
+_render_pool: RenderPool | None = None
+
+
+def start_render_pool() -> RenderPool | None:
+    """Create and warm the process pool (no-op when RENDER_POOL_WORKERS is 0)."""
+    global _render_pool
+    s = get_settings()
+    if s.RENDER_POOL_WORKERS <= 0:
+        return None
+    if _render_pool is None:
+        _render_pool = RenderPool(s.RENDER_POOL_WORKERS, s.RENDER_POOL_MAX_PENDING, s.RENDER_POOL_TIMEOUT_SEC)
+    _render_pool.start()
+    return _render_pool
+
+
+def stop_render_pool() -> None:
+    if _render_pool is not None:
+        _render_pool.stop()
+
+
+def get_render_pool() -> RenderPool | None:
+    return _render_pool
+
+
+def render_chart_base64(klines, title: str = "BTCUSDT") -> str:
+    """Render via the process pool when it is running, otherwise in the calling thread."""
+    pool = _render_pool
+    if pool is not None and pool.stats()["running"]:
+        png = pool.render_png(klines, title)
+    else:
+        png = render_candlestick_png(klines, title)
+    return base64.b64encode(png).decode("ascii")
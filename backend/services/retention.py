@@ -0,0 +1,321 @@
+# Vox Trader - Retention for agent_log / agent_analyses (partition drops or chunked deletes, optional archive)
+import gzip
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import pymysql
+
+from config import get_settings
+from database import get_db
+
+# Only one process in the deployment prunes at a time (MySQL named lock).
+RETENTION_LOCK_NAME = "vox_trader_retention"
+
+
+# --- Monthly RANGE partitions on created_at ---
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _partition_clause(month: date) -> str:
+    return f"PARTITION {_partition_name(month)} VALUES LESS THAN ('{_next_month(month):%Y-%m-%d}')"
+
+
+def list_partitions(cur, table: str) -> list[tuple[str, str]]:
+    """(name, upper bound) of a table's partitions in order; empty when the table is not partitioned."""
+    cur.execute(
+        """
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+        """,
+        (table,),
+    )
+    return [(_row_value(r, 0, "PARTITION_NAME"), _row_value(r, 1, "PARTITION_DESCRIPTION")) for r in cur.fetchall()]
+
+
+def _row_value(row, index: int, key: str):
+    return row[key] if isinstance(row, dict) else row[index]
+
+
+def partition_table_by_month(cur, table: str, months_ahead: int = 2) -> bool:
+    """Convert table to monthly RANGE COLUMNS(created_at) partitions. Returns False if already partitioned.
+
+    MySQL does not allow foreign keys on partitioned tables and every unique key must contain
+    the partition column, so the user_id foreign key is dropped and the primary key becomes
+    (id, created_at). Rows of deleted users are then removed by retention instead of CASCADE.
+    """
+    if list_partitions(cur, table):
+        return False
+    cur.execute(
+        """
+        SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """,
+        (table,),
+    )
+    for r in cur.fetchall():
+        cur.execute(f"ALTER TABLE `{table}` DROP FOREIGN KEY `{_row_value(r, 0, 'CONSTRAINT_NAME')}`")
+    cur.execute(f"ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)")
+    cur.execute(f"SELECT MIN(created_at) AS oldest FROM `{table}`")
+    oldest = _row_value(cur.fetchone(), 0, "oldest")
+    month = _month_start(oldest.date() if oldest else date.today())
+    last = _month_start(date.today())
+    for _ in range(max(0, months_ahead)):
+        last = _next_month(last)
+    parts = []
+    while month <= last:
+        parts.append(_partition_clause(month))
+        month = _next_month(month)
+    parts.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    cur.execute(f"ALTER TABLE `{table}` PARTITION BY RANGE COLUMNS(created_at) ({', '.join(parts)})")
+    return True
+
+
+def ensure_future_partitions(cur, table: str, months_ahead: int = 2) -> int:
+    """Split pmax so partitions exist up to `months_ahead` months from now. Returns partitions added."""
+    parts = list_partitions(cur, table)
+    named = [p for p, bound in parts if p != "pmax"]
+    if not parts or not named:
+        return 0
+    newest = datetime.strptime(named[-1][1:], "%Y%m").date()
+    target = _month_start(date.today())
+    for _ in range(max(0, months_ahead)):
+        target = _next_month(target)
+    new = []
+    month = _next_month(newest)
+    while month <= target:
+        new.append(_partition_clause(month))
+        month = _next_month(month)
+    if not new:
+        return 0
+    cur.execute(
+        f"ALTER TABLE `{table}` REORGANIZE PARTITION pmax INTO ({', '.join(new)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+    )
+    return len(new)
+
+
+def _expired_partitions(cur, table: str, cutoff: datetime) -> list[str]:
+    """Partitions whose whole range is older than cutoff."""
+    out = []
+    for name, bound in list_partitions(cur, table):
+        if name == "pmax" or not bound or bound == "MAXVALUE":
+            continue
+        upper = datetime.fromisoformat(bound.strip("'"))
+        if upper <= cutoff:
+            out.append(name)
+    return out
+
+
+# --- Archive ---
+
+def _archive_rows(archive_dir: str, table: str, rows: list[dict]) -> None:
+    """Append rows as JSON lines to gzip files per table and month (one gzip member per call)."""
+    by_month: dict[str, list[dict]] = {}
+    for r in rows:
+        ts = r.get("created_at")
+        key = ts.strftime("%Y%m") if hasattr(ts, "strftime") else "unknown"
+        by_month.setdefault(key, []).append(r)
+    os.makedirs(archive_dir, exist_ok=True)
+    for month, items in by_month.items():
+        path = os.path.join(archive_dir, f"{table}-{month}.jsonl.gz")
+        with gzip.open(path, "at", encoding="utf-8") as fh:
+            for r in items:
+                fh.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+
+
+# --- Worker ---
+
+class RetentionWorker:
+    """Prunes rows older than each table's TTL on a background thread.
+
+    Partitioned tables lose whole expired partitions (and get future ones added); other tables
+    are read oldest-first in primary-key order without locks and deleted by id range in small
+    committed chunks with a pause between them, so locks stay on cold rows and never block the
+    runner's inserts. With an
+    archive directory, agent_analyses rows are written to gzip JSON lines before removal.
+    """
+
+    def __init__(
+        self,
+        ttl_days: dict[str, int],
+        interval_sec: float = 3600.0,
+        chunk_rows: int = 5000,
+        chunk_pause_sec: float = 0.2,
+        archive_dir: str = "",
+        archive_tables: tuple[str, ...] = ("agent_analyses",),
+        months_ahead: int = 2,
+    ):
+        self.ttl_days = {t: int(d) for t, d in ttl_days.items() if int(d) > 0}
+        self.interval_sec = float(interval_sec)
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.chunk_pause_sec = float(chunk_pause_sec)
+        self.archive_dir = archive_dir
+        self.archive_tables = archive_tables
+        self.months_ahead = months_ahead
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "skipped_locked": 0, "errors": 0, "deleted": 0, "archived": 0,
+                       "partitions_dropped": 0, "partitions_added": 0, "last_run_at": None, "last_error": None}
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def _loop(self) -> None:
+        # First pass shortly after startup, then every interval.
+        wait = min(60.0, self.interval_sec)
+        while not self._stop.wait(wait):
+            try:
+                self.run_once()
+            except Exception as e:
+                self._count("errors")
+                with self._lock:
+                    self._stats["last_error"] = str(e)[:200]
+            wait = self.interval_sec
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def run_once(self) -> None:
+        with get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT GET_LOCK(%s, 0)", (RETENTION_LOCK_NAME,))
+                if not cur.fetchone()[0]:
+                    self._count("skipped_locked")
+                    return
+                try:
+                    for table, days in self.ttl_days.items():
+                        if self._stop.is_set():
+                            break
+                        cutoff = datetime.now() - timedelta(days=days)
+                        if list_partitions(cur, table):
+                            self._prune_partitions(conn, table, cutoff)
+                        else:
+                            self._prune_chunked(conn, table, cutoff)
+                finally:
+                    cur.execute("SELECT RELEASE_LOCK(%s)", (RETENTION_LOCK_NAME,))
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["last_run_at"] = datetime.now().isoformat(timespec="seconds")
+
+    def _archiving(self, table: str) -> bool:
+        return bool(self.archive_dir) and table in self.archive_tables
+
+    def _prune_partitions(self, conn, table: str, cutoff: datetime) -> None:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            for name in _expired_partitions(cur, table, cutoff):
+                if self._archiving(table):
+                    last_id = 0
+                    while not self._stop.is_set():
+                        cur.execute(
+                            f"SELECT * FROM `{table}` PARTITION ({name}) WHERE id > %s ORDER BY id LIMIT %s",
+                            (last_id, self.chunk_rows),
+                        )
+                        rows = cur.fetchall()
+                        if not rows:
+                            break
+                        _archive_rows(self.archive_dir, table, rows)
+                        self._count("archived", len(rows))
+                        last_id = rows[-1]["id"]
+                    if self._stop.is_set():
+                        return
+                cur.execute(f"ALTER TABLE `{table}` DROP PARTITION {name}")
+                self._count("partitions_dropped")
+            added = ensure_future_partitions(cur, table, self.months_ahead)
+            if added:
+                self._count("partitions_added", added)
+
+    def _prune_chunked(self, conn, table: str, cutoff: datetime) -> None:
+        # No index starts with created_at, so a DELETE filtered on it would scan and lock the table.
+        # Instead walk the primary key with plain (non-locking) reads and delete only the id range seen expired.
+        columns = "*" if self._archiving(table) else "id, created_at"
+        last_id = 0
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            while not self._stop.is_set():
+                cur.execute(
+                    f"SELECT {columns} FROM `{table}` WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, self.chunk_rows),
+                )
+                rows = cur.fetchall()
+                expired = []
+                for r in rows:
+                    if r["created_at"] >= cutoff:
+                        break
+                    expired.append(r)
+                if expired:
+                    if self._archiving(table):
+                        _archive_rows(self.archive_dir, table, expired)
+                        self._count("archived", len(expired))
+                    cur.execute(
+                        f"DELETE FROM `{table}` WHERE id BETWEEN %s AND %s AND created_at < %s",
+                        (expired[0]["id"], expired[-1]["id"], cutoff),
+                    )
+                    self._count("deleted", cur.rowcount)
+                    conn.commit()
+                    last_id = expired[-1]["id"]
+                # Ids grow with created_at: the first live row ends the expired prefix.
+                if len(expired) < len(rows) or len(rows) < self.chunk_rows:
+                    break
+                self._stop.wait(self.chunk_pause_sec)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        out["ttl_days"] = dict(self.ttl_days)
+        out["running"] = self._thread is not None and self._thread.is_alive()
+        return out
+
+
+_worker: RetentionWorker | None = None
+
+
+def start_retention() -> RetentionWorker | None:
+    """Start the background pruner (opt-in: no-op unless RETENTION_ENABLED is on and a TTL is set)."""
+    global _worker
+    s = get_settings()
+    if not s.RETENTION_ENABLED:
+        return None
+    if _worker is None:
+        _worker = RetentionWorker(
+            ttl_days={"agent_log": s.RETENTION_AGENT_LOG_DAYS, "agent_analyses": s.RETENTION_AGENT_ANALYSES_DAYS},
+            interval_sec=s.RETENTION_INTERVAL_SEC,
+            chunk_rows=s.RETENTION_CHUNK_ROWS,
+            chunk_pause_sec=s.RETENTION_CHUNK_PAUSE_SEC,
+            archive_dir=s.RETENTION_ARCHIVE_DIR,
+        )
+    if not _worker.ttl_days:
+        return None
+    _worker.start()
+    return _worker
+
+
+def stop_retention() -> None:
+    if _worker is not None:
+        _worker.stop()
+
+
+def get_retention() -> RetentionWorker | None:
+    return _worker
@@ -0,0 +1,331 @@
+# Vox Trader - Demo futures trigger engine (liquidation, stop-loss, take-profit on price ticks)
+import queue
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Callable
+
+from config import get_settings
+from services.futures_mtm import MAINTENANCE_MARGIN_RATE
+from services.market_stream import get_market_stream
+from services.price_cache import get_price_cache
+
+# Trigger kinds, in the order they win when several cross on the same tick.
+LIQUIDATION = "liquidation"
+STOP_LOSS = "stop_loss"
+TAKE_PROFIT = "take_profit"
+_KIND_PRIORITY = {LIQUIDATION: 0, STOP_LOSS: 1, TAKE_PROFIT: 2}
+
+
+def position_triggers(pos: dict) -> list[tuple[str, str, float]]:
+    """(direction, kind, level) for a position row; direction "below" fires at price <= level, "above" at >=.
+
+    LONG: liquidation and stop below, target above. SHORT: the mirror image.
+    """
+    long = pos["side"] == "LONG"
+    down, up = ("below", "above") if long else ("above", "below")
+    sign, qty = (1.0 if long else -1.0), float(pos["quantity"])
+    # Scalar form of futures_mtm.liquidation_prices (NumPy per row would dominate index builds).
+    liq = 0.0
+    if qty > 0:
+        liq = max(0.0, (sign * float(pos["entry_price"]) * qty - float(pos["margin_used"])) / (qty * (sign - MAINTENANCE_MARGIN_RATE)))
+    out = [(down, LIQUIDATION, liq)] if liq > 0 else []
+    if pos.get("stop_loss_price"):
+        out.append((down, STOP_LOSS, float(pos["stop_loss_price"])))
+    if pos.get("take_profit_price"):
+        out.append((up, TAKE_PROFIT, float(pos["take_profit_price"])))
+    return out
+
+
+class _LevelBook:
+    """Trigger levels of one symbol and direction, sorted for O(log n) crossing checks.
+
+    `levels` mirrors `entries` (level, position_id, kind) so bisect works on plain floats.
+    """
+
+    __slots__ = ("levels", "entries")
+
+    def __init__(self):
+        self.levels: list[float] = []
+        self.entries: list[tuple[float, int, str]] = []
+
+    def add(self, entry: tuple[float, int, str]) -> None:
+        i = bisect_left(self.entries, entry)
+        self.entries.insert(i, entry)
+        self.levels.insert(i, entry[0])
+
+    def remove(self, entry: tuple[float, int, str]) -> None:
+        i = bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+            del self.levels[i]
+
+    def pop_at_or_above(self, price: float) -> list[tuple[float, int, str]]:
+        i = bisect_left(self.levels, price)
+        out = self.entries[i:]
+        del self.entries[i:], self.levels[i:]
+        return out
+
+    def pop_at_or_below(self, price: float) -> list[tuple[float, int, str]]:
+        i = bisect_right(self.levels, price)
+        out = self.entries[:i]
+        del self.entries[:i], self.levels[:i]
+        return out
+
+
+class TriggerEngine:
+    """In-memory index of liquidation / stop / target levels of open demo futures positions.
+
+    Each tick costs two bisects for its symbol plus the crossed entries, so the DB is never
+    scanned per tick. Crossed positions are handed to `close(position_id, kind, price)` on a
+    worker thread; it must re-check the row under lock and close it through the normal close
+    path, returning True when it closed the position, None when the position is already gone,
+    or the current row to re-index when it no longer crosses. Ticks come from the market stream
+    (when enabled) and from a price-cache poll every `poll_sec`; the index is rebuilt from
+    `load()` every `resync_sec` so positions opened by other processes are picked up.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], list[dict]],
+        close: Callable[[int, str, float], dict | bool | None],
+        poll_sec: float = 1.0,
+        resync_sec: float = 30.0,
+        get_prices: Callable | None = None,
+    ):
+        self._load = load
+        self._close = close
+        self.poll_sec = float(poll_sec)
+        self.resync_sec = float(resync_sec)
+        self._get_prices = get_prices or (lambda symbols: get_price_cache().get_prices(symbols))
+        self._lock = threading.Lock()
+        self._books: dict[tuple[str, str], _LevelBook] = {}
+        self._by_position: dict[int, tuple[str, list[tuple[str, tuple[float, int, str]]]]] = {}
+        self._pending: list[tuple[str, object]] | None = None  # track/untrack calls during a resync
+        self._fired: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stats = {"ticks": 0, "fired": 0, "closed": 0, "reindexed": 0, "gone": 0, "errors": 0, "resyncs": 0,
+                       LIQUIDATION: 0, STOP_LOSS: 0, TAKE_PROFIT: 0}
+
+    # --- index ---
+
+    def _add_locked(self, pos: dict) -> None:
+        pid = int(pos["id"])
+        symbol = pos["symbol"].upper()
+        placed = []
+        for direction, kind, level in position_triggers(pos):
+            entry = (level, pid, kind)
+            book = self._books.get((symbol, direction))
+            if book is None:
+                book = self._books[(symbol, direction)] = _LevelBook()
+            book.add(entry)
+            placed.append((direction, entry))
+        self._by_position[pid] = (symbol, placed)
+
+    def _bulk_load(self, rows: list[dict]) -> None:
+        """Build the index from scratch: one sort per book instead of n sorted inserts."""
+        pending: dict[tuple[str, str], list[tuple[float, int, str]]] = {}
+        for pos in rows:
+            pid = int(pos["id"])
+            symbol = pos["symbol"].upper()
+            placed = []
+            for direction, kind, level in position_triggers(pos):
+                entry = (level, pid, kind)
+                pending.setdefault((symbol, direction), []).append(entry)
+                placed.append((direction, entry))
+            self._by_position[pid] = (symbol, placed)
+        for key, entries in pending.items():
+            entries.sort()
+            book = self._books[key] = _LevelBook()
+            book.entries = entries
+            book.levels = [e[0] for e in entries]
+
+    def _remove_locked(self, position_id: int) -> None:
+        item = self._by_position.pop(position_id, None)
+        if item is None:
+            return
+        symbol, placed = item
+        for direction, entry in placed:
+            book = self._books.get((symbol, direction))
+            if book is not None:
+                book.remove(entry)
+
+    def track(self, pos: dict) -> None:
+        """Index (or re-index) an open position row."""
+        with self._lock:
+            self._remove_locked(int(pos["id"]))
+            self._add_locked(pos)
+            if self._pending is not None:
+                self._pending.append(("track", pos))
+
+    def untrack(self, position_id: int) -> None:
+        with self._lock:
+            self._remove_locked(int(position_id))
+            if self._pending is not None:
+                self._pending.append(("untrack", int(position_id)))
+
+    def resync(self) -> None:
+        """Rebuild the whole index from load() (one query) and swap it in.
+
+        track/untrack calls made while the query runs are replayed on the new index.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            rows = self._load()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        fresh = TriggerEngine(load=self._load, close=self._close)
+        fresh._bulk_load(rows)
+        with self._lock:
+            for op, arg in self._pending:
+                if op == "track":
+                    fresh._remove_locked(int(arg["id"]))
+                    fresh._add_locked(arg)
+                else:
+                    fresh._remove_locked(arg)
+            self._pending = None
+            self._books, self._by_position = fresh._books, fresh._by_position
+            self._stats["resyncs"] += 1
+        stream = get_market_stream()
+        if stream is not None:
+            for symbol in self.symbols():
+                stream.track(symbol)
+
+    def symbols(self) -> list[str]:
+        with self._lock:
+            return sorted({symbol for (symbol, _), book in self._books.items() if book.entries})
+
+    # --- ticks ---
+
+    def on_tick(self, symbol: str, price: float) -> int:
+        """Check one price against the symbol's levels; crossed positions are queued. Returns the count."""
+        symbol = symbol.upper()
+        crossed: dict[int, str] = {}
+        with self._lock:
+            self._stats["ticks"] += 1
+            below = self._books.get((symbol, "below"))
+            above = self._books.get((symbol, "above"))
+            # A cheap peek first: most ticks cross nothing.
+            hit_below = below is not None and below.levels and below.levels[-1] >= price
+            hit_above = above is not None and above.levels and above.levels[0] <= price
+            if not (hit_below or hit_above):
+                return 0
+            entries = (below.pop_at_or_above(price) if hit_below else []) + (above.pop_at_or_below(price) if hit_above else [])
+            for _, pid, kind in entries:
+                if pid not in crossed or _KIND_PRIORITY[kind] < _KIND_PRIORITY[crossed[pid]]:
+                    crossed[pid] = kind
+            for pid in crossed:
+                self._remove_locked(pid)
+            self._stats["fired"] += len(crossed)
+        for pid, kind in crossed.items():
+            self._fired.put((pid, kind, price))
+        return len(crossed)
+
+    # --- worker ---
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="trigger-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._fired.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def _handle(self, pid: int, kind: str, price: float) -> None:
+        try:
+            result = self._close(pid, kind, price)
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            return
+        if isinstance(result, dict):
+            with self._lock:
+                self._stats["reindexed"] += 1
+            self.track(result)
+            return
+        with self._lock:
+            if result:
+                self._stats["closed"] += 1
+                self._stats[kind] += 1
+            else:
+                self._stats["gone"] += 1
+
+    def _poll(self) -> None:
+        symbols = self.symbols()
+        if not symbols:
+            return
+        for symbol, price in self._get_prices(symbols).items():
+            self.on_tick(symbol, price)
+
+    def _loop(self) -> None:
+        next_resync = 0.0
+        next_poll = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            try:
+                if now >= next_resync:
+                    self.resync()
+                    next_resync = now + self.resync_sec
+                if now >= next_poll:
+                    self._poll()
+                    next_poll = now + self.poll_sec
+            except Exception:
+                with self._lock:
+                    self._stats["errors"] += 1
+            try:
+                item = self._fired.get(timeout=max(0.05, min(next_poll, next_resync) - time.monotonic()))
+            except queue.Empty:
+                continue
+            if item is None:
+                continue
+            self._handle(*item)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["positions"] = len(self._by_position)
+            out["triggers"] = sum(len(b.entries) for b in self._books.values())
+        out["queued"] = self._fired.qsize()
+        out["running"] = self._thread is not None and self._thread.is_alive()
+        return out
+
+
+_engine: TriggerEngine | None = None
+
+
+def start_trigger_engine(load: Callable[[], list[dict]], close: Callable[[int, str, float], dict | bool | None]) -> TriggerEngine | None:
+    """Start the engine and subscribe it to market-stream ticks (no-op when TRIGGER_ENGINE_ENABLED is off)."""
+    global _engine
+    s = get_settings()
+    if not s.TRIGGER_ENGINE_ENABLED:
+        return None
+    if _engine is None:
+        _engine = TriggerEngine(load, close, poll_sec=s.TRIGGER_ENGINE_POLL_SEC, resync_sec=s.TRIGGER_ENGINE_RESYNC_SEC)
+    stream = get_market_stream()
+    if stream is not None:
+        stream.add_price_listener(_engine.on_tick)
+    _engine.start()
+    return _engine
+
+
+def stop_trigger_engine() -> None:
+    if _engine is None:
+        return
+    stream = get_market_stream()
+    if stream is not None:
+        stream.remove_price_listener(_engine.on_tick)
+    _engine.stop()
+
+
+def get_trigger_engine() -> TriggerEngine | None:
+    return _engine
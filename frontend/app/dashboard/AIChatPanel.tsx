@@ -2,8 +2,12 @@
 
 import { useState, useRef, useEffect, useCallback } from 'react'
 import html2canvas from 'html2canvas'
+import { useEventStream } from './useEventStream'
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8423'
+// Polling period while the push stream is connected (safety net) vs. disconnected.
+const POLL_MS_PUSH = 60000
+const POLL_MS_FALLBACK = 4000
 
 function getToken() {
   if (typeof window === 'undefined') return null
@@ -161,6 +165,18 @@ export default function AIChatPanel({ chartContainerRef, chartInfoRef }: AIChatP
   } | null>(null)
   const [agentLog, setAgentLog] = useState<{ id: number; time: string; message: string; fullAnalysis?: string; analysisId?: number }[]>([])
   const agentLogIdRef = useRef(0)
+  const syncPerformanceRef = useRef<() => void>(() => {})
+  const fetchStatusRef = useRef<() => void>(() => {})
+  const streamConnected = useEventStream((event) => {
+    if (event.type === 'order_fill') {
+      syncPerformanceRef.current()
+    } else if (event.type === 'analysis') {
+      fetchStatusRef.current()
+    } else if (event.type === 'agent_log') {
+      const d = event.data as { id: number; time?: string; message: string; analysis_id?: number | null }
+      setAgentLog((prev) => (prev.some((e) => e.id === d.id) ? prev : [{ id: d.id, time: d.time || '', message: d.message, analysisId: d.analysis_id ?? undefined }, ...prev]))
+    }
+  }, tab === 'agent')
   const [agentSectionOpen, setAgentSectionOpen] = useState({ output: true, performance: true, result: true })
   const [selectedAnalysis, setSelectedAnalysis] = useState<{ analysisId?: number; fullAnalysis?: string } | null>(null)
   const [agentModel, setAgentModel] = useState('GLM-4.6V-Flash')
@@ -206,10 +222,11 @@ export default function AIChatPanel({ chartContainerRef, chartInfoRef }: AIChatP
         if (futures) setFuturesPerformance(futures)
       })
     }
+    syncPerformanceRef.current = syncPerformance
     syncPerformance()
-    const interval = setInterval(syncPerformance, 4000)
+    const interval = setInterval(syncPerformance, streamConnected ? POLL_MS_PUSH : POLL_MS_FALLBACK)
     return () => clearInterval(interval)
-  }, [tab])
+  }, [tab, streamConnected])
 
   const addAgentLog = useCallback((message: string, fullAnalysis?: string, analysisId?: number) => {
     const t = new Date().toLocaleTimeString('en-US')
@@ -353,9 +370,21 @@ export default function AIChatPanel({ chartContainerRef, chartInfoRef }: AIChatP
     if (tab !== 'agent') return
     const token = getToken()
     if (!token) return
+    // Incremental sync: only logs newer than the cursor, analysis text only when it changed, 304 when idle.
+    let etag: string | null = null
+    let lastLogId = 0
+    let knownAnalysisId: number | null = null
     const fetchStatus = () => {
-      fetch(`${API_URL}/ai/agent/status`, { headers: { Authorization: `Bearer ${token}` } })
-        .then((r) => (r.ok ? r.json() : null))
+      const params = new URLSearchParams({ since_id: String(lastLogId) })
+      if (knownAnalysisId != null) params.set('known_analysis_id', String(knownAnalysisId))
+      fetch(`${API_URL}/ai/agent/status?${params}`, {
+        headers: { Authorization: `Bearer ${token}`, ...(etag ? { 'If-None-Match': etag } : {}) },
+      })
+        .then((r) => {
+          if (!r.ok) return null
+          etag = r.headers.get('ETag')
+          return r.json()
+        })
         .then((data) => {
           if (!data) return
           setAgentRunning(!!data.is_running)
@@ -371,17 +400,28 @@ export default function AIChatPanel({ chartContainerRef, chartInfoRef }: AIChatP
             if (data.job.model) setAgentModel(data.job.model)
           }
           if (data.logs && Array.isArray(data.logs)) {
-            setAgentLog(
-              data.logs.map((e: { id: number; time: string; message: string; analysis_id?: number }) => ({
-                id: e.id,
-                time: e.time || '',
-                message: e.message,
-                analysisId: e.analysis_id,
-              }))
-            )
+            const fresh = data.logs.map((e: { id: number; time: string; message: string; analysis_id?: number }) => ({
+              id: e.id,
+              time: e.time || '',
+              message: e.message,
+              analysisId: e.analysis_id,
+            }))
+            if (data.incremental) {
+              if (fresh.length) {
+                setAgentLog((prev) => {
+                  const seen = new Set(fresh.map((e: { id: number }) => e.id))
+                  return [...fresh, ...prev.filter((e) => !seen.has(e.id))].slice(0, 100)
+                })
+              }
+            } else {
+              setAgentLog(fresh)
+            }
           }
+          if (typeof data.last_log_id === 'number') lastLogId = data.last_log_id
           if (data.last_analysis) {
-            const la = data.last_analysis as { action: string; analysis?: string; message?: string; buy_at?: number | null; sell_at?: number | null; time?: string }
+            const la = data.last_analysis as { id?: number; action: string; analysis?: string; message?: string; buy_at?: number | null; sell_at?: number | null; time?: string }
+            if (la.id != null && la.id === knownAnalysisId && la.analysis === undefined) return
+            knownAnalysisId = la.id ?? null
             setAgentResult({
               action: (la.action === 'BUY' || la.action === 'SELL' ? la.action : 'HOLD') as 'BUY' | 'SELL' | 'HOLD',
               analysis: la.analysis ?? '',
@@ -394,10 +434,11 @@ export default function AIChatPanel({ chartContainerRef, chartInfoRef }: AIChatP
         })
         .catch(() => {})
     }
+    fetchStatusRef.current = fetchStatus
     fetchStatus()
-    const interval = setInterval(fetchStatus, 4000)
+    const interval = setInterval(fetchStatus, streamConnected ? POLL_MS_PUSH : POLL_MS_FALLBACK)
     return () => clearInterval(interval)
-  }, [tab])
+  }, [tab, streamConnected])
 
   const startAgent = async () => {
     const token = getToken()
@@ -510,15 +551,44 @@ export default function AIChatPanel({ chartContainerRef, chartInfoRef }: AIChatP
           'Content-Type': 'application/json',
           ...(token ? { Authorization: `Bearer ${token}` } : {}),
         },
-        body: JSON.stringify({ messages: history }),
+        body: JSON.stringify({ messages: history, stream: true }),
       })
-      const data = await res.json().catch(() => ({}))
-      if (!res.ok) {
+      if (!res.ok || !res.body) {
+        const data = await res.json().catch(() => ({}))
         setMessages((m) => [...m, { role: 'ai', text: data.detail || 'Failed to get response.' }])
         setError(data.detail || 'Error')
         return
       }
-      setMessages((m) => [...m, { role: 'ai', text: data.content || '' }])
+      // Server-sent events: `data: {"delta": "..."}` chunks, then `data: {"done": true}` or `event: error`.
+      setMessages((m) => [...m, { role: 'ai', text: '' }])
+      const appendToReply = (chunk: string) =>
+        setMessages((m) => {
+          const last = m[m.length - 1]
+          return [...m.slice(0, -1), { ...last, text: last.text + chunk }]
+        })
+      const reader = res.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      for (;;) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        let sep
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+          const block = buffer.slice(0, sep)
+          buffer = buffer.slice(sep + 2)
+          const isError = block.split('\n').some((l) => l === 'event: error')
+          const dataLine = block.split('\n').find((l) => l.startsWith('data:'))
+          if (!dataLine) continue
+          const event = JSON.parse(dataLine.slice(5))
+          if (isError) {
+            appendToReply(event.detail ? `\n\n${event.detail}` : '')
+            setError(event.detail || 'Error')
+          } else if (event.delta) {
+            appendToReply(event.delta)
+          }
+        }
+      }
     } catch {
       setMessages((m) => [...m, { role: 'ai', text: 'Connection error. Please try again.' }])
       setError('Connection error')
@@ -2,8 +2,9 @@
 
 import Link from 'next/link'
 import { usePathname } from 'next/navigation'
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import '../globals.css'
+import { useEventStream } from './useEventStream'
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8423'
 const TOPUP_PRESETS = [3, 5, 10, 25]
@@ -20,6 +21,10 @@ export default function DashboardLayout({
 }) {
   const pathname = usePathname()
   const [balance, setBalance] = useState<number | null>(null)
+  const syncBalanceRef = useRef<() => void>(() => {})
+  const streamConnected = useEventStream((event) => {
+    if (event.type === 'ai_balance') syncBalanceRef.current()
+  })
   const [showTopupModal, setShowTopupModal] = useState(false)
   const [topupLoading, setTopupLoading] = useState(false)
   const [topupError, setTopupError] = useState<string | null>(null)
@@ -74,7 +79,9 @@ export default function DashboardLayout({
         })
         .catch(() => {})
     }
+  }, [])
 
+  useEffect(() => {
     let inFlight = false
     const syncBalance = () => {
       if (inFlight) return
@@ -82,8 +89,9 @@ export default function DashboardLayout({
       loadBalance().finally(() => { inFlight = false })
     }
 
+    syncBalanceRef.current = syncBalance
     syncBalance()
-    const iv = setInterval(syncBalance, 4000)
+    const iv = setInterval(syncBalance, streamConnected ? 60000 : 4000)
     const onFocus = () => syncBalance()
     const onVisibility = () => {
       if (document.visibilityState === 'visible') syncBalance()
@@ -95,7 +103,7 @@ export default function DashboardLayout({
       window.removeEventListener('focus', onFocus)
       document.removeEventListener('visibilitychange', onVisibility)
     }
-  }, [])
+  }, [streamConnected])
 
   useEffect(() => {
     if (typeof window === 'undefined') return
@@ -0,0 +1,101 @@
+'use client'
+
+import { useEffect, useRef, useState } from 'react'
+
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8423'
+
+export type ServerEvent = { type: string; data: Record<string, unknown>; ts?: number }
+type Listener = (event: ServerEvent) => void
+
+// One shared /events/stream connection per tab, fanned out to every mounted listener.
+const listeners = new Set<Listener>()
+const connectedListeners = new Set<(connected: boolean) => void>()
+let controller: AbortController | null = null
+let isConnected = false
+
+function setConnected(value: boolean) {
+  isConnected = value
+  connectedListeners.forEach((fn) => fn(value))
+}
+
+async function runStream(signal: AbortSignal) {
+  let delay = 1000
+  while (!signal.aborted) {
+    const token = typeof window === 'undefined' ? null : localStorage.getItem('token')
+    if (!token) return
+    try {
+      const res = await fetch(`${API_URL}/events/stream`, {
+        headers: { Authorization: `Bearer ${token}` },
+        signal,
+      })
+      if (!res.ok || !res.body) throw new Error(String(res.status))
+      setConnected(true)
+      delay = 1000
+      const reader = res.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      for (;;) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        let sep
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+          const block = buffer.slice(0, sep)
+          buffer = buffer.slice(sep + 2)
+          const dataLine = block.split('\n').find((l) => l.startsWith('data:'))
+          if (!dataLine) continue
+          try {
+            const event = JSON.parse(dataLine.slice(5)) as ServerEvent
+            listeners.forEach((fn) => fn(event))
+          } catch {
+            // ignore malformed event
+          }
+        }
+      }
+    } catch {
+      if (signal.aborted) return
+    }
+    setConnected(false)
+    await new Promise((r) => setTimeout(r, delay))
+    delay = Math.min(delay * 2, 30000)
+  }
+}
+
+function addListener(fn: Listener) {
+  listeners.add(fn)
+  if (!controller) {
+    controller = new AbortController()
+    runStream(controller.signal)
+  }
+  return () => {
+    listeners.delete(fn)
+    if (listeners.size === 0 && controller) {
+      controller.abort()
+      controller = null
+      setConnected(false)
+    }
+  }
+}
+
+/**
+ * Subscribe to the per-user push stream. Returns whether the stream is connected, so callers can
+ * keep polling while it is down and only poll rarely while it is up.
+ */
+export function useEventStream(onEvent: Listener, enabled = true): boolean {
+  const handler = useRef(onEvent)
+  handler.current = onEvent
+  const [connected, setConnectedState] = useState(isConnected)
+
+  useEffect(() => {
+    if (!enabled) return
+    connectedListeners.add(setConnectedState)
+    setConnectedState(isConnected)
+    const remove = addListener((e) => handler.current(e))
+    return () => {
+      connectedListeners.delete(setConnectedState)
+      remove()
+    }
+  }, [enabled])
+
+  return connected
+}